@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artworks', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='category',
+            field=models.CharField(choices=[('painting', 'Pittura'), ('sculpture', 'Scultura'), ('photography', 'Fotografia'), ('drawing', 'Disegno'), ('print', 'Stampa'), ('digital', 'Arte Digitale'), ('mixed_media', 'Tecnica Mista'), ('other', 'Altro')], default='other', max_length=20, verbose_name='Categoria'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(fields=['-created_at', '-id'], name='artwork_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='artwork_category_created_idx'),
+        ),
+    ]
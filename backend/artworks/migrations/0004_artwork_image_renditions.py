@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artworks', '0003_artwork_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Varianti Immagine'),
+        ),
+    ]
@@ -2,12 +2,26 @@ from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
+from core import counters
+from trending import engine as trending
 
 class Artwork(models.Model):
+    class Category(models.TextChoices):
+        PAINTING = 'painting', _('Pittura')
+        SCULPTURE = 'sculpture', _('Scultura')
+        PHOTOGRAPHY = 'photography', _('Fotografia')
+        DRAWING = 'drawing', _('Disegno')
+        PRINT = 'print', _('Stampa')
+        DIGITAL = 'digital', _('Arte Digitale')
+        MIXED_MEDIA = 'mixed_media', _('Tecnica Mista')
+        OTHER = 'other', _('Altro')
+
     title = models.CharField(_('Titolo'), max_length=200)
     description = models.TextField(_('Descrizione'))
     image = models.ImageField(_('Immagine'), upload_to='artworks/')
+    image_renditions = models.JSONField(_('Varianti Immagine'), default=dict, blank=True, editable=False)
     price = models.DecimalField(_('Prezzo'), max_digits=10, decimal_places=2)
+    category = models.CharField(_('Categoria'), max_length=20, choices=Category.choices, default=Category.OTHER)
     is_digital = models.BooleanField(_('È digitale'), default=False)
     blockchain_hash = models.CharField(_('Hash Blockchain'), max_length=66, blank=True, null=True)
     artist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='artworks')
@@ -32,17 +46,23 @@ class Artwork(models.Model):
         verbose_name = _('Opera')
         verbose_name_plural = _('Opere')
         ordering = ['-created_at']
+        indexes = [
+            # Paginazione keyset del catalogo, anche filtrato per categoria
+            models.Index(fields=['-created_at', '-id'], name='artwork_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='artwork_category_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.artist.username}"
 
     def increment_views(self):
-        self.views_count += 1
-        self.save()
+        # Scrittura differita e in blocco, senza salvare l'intera riga
+        counters.increment(self, 'views_count')
+        trending.record(trending.Content.ARTWORK, self.pk, trending.Action.VIEW)
 
     def increment_likes(self):
-        self.likes_count += 1
-        self.save()
+        counters.increment(self, 'likes_count')
+        trending.record(trending.Content.ARTWORK, self.pk, trending.Action.LIKE)
 
     def mark_as_sold(self, buyer, price=None):
         self.is_sold = True
@@ -52,6 +72,19 @@ class Artwork(models.Model):
             self.price = price
         self.save()
 
+    @classmethod
+    def mark_many_as_sold(cls, sales):
+        """
+        Versione in blocco di mark_as_sold: `sales` è una lista di tuple
+        (artwork_id, buyer_id, price) e viene scritta con un solo bulk_update.
+        """
+        now = timezone.now()
+        artworks = [
+            cls(pk=artwork_id, is_sold=True, sold_to_id=buyer_id, sold_at=now, price=price, updated_at=now)
+            for artwork_id, buyer_id, price in sales
+        ]
+        cls.objects.bulk_update(artworks, ['is_sold', 'sold_to', 'sold_at', 'price', 'updated_at'])
+
     def verify(self, notes=''):
         self.is_verified = True
         self.verification_date = timezone.now()
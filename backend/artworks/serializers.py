@@ -1,7 +1,11 @@
 from rest_framework import serializers
+from media.serializers import RenditionsField
 from .models import Artwork
 
 class ArtworkSerializer(serializers.ModelSerializer):
+    artist_name = serializers.CharField(source='artist.username', read_only=True)
+    image_renditions = RenditionsField('image')
+
     class Meta:
         model = Artwork
-        fields = ['id', 'title', 'description', 'image', 'price', 'category', 'artist', 'created_at'] 
\ No newline at end of file
+        fields = ['id', 'title', 'description', 'image', 'image_renditions', 'price', 'category', 'artist', 'artist_name', 'created_at']
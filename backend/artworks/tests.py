@@ -1,3 +1,38 @@
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
 from django.test import TestCase
+from rest_framework.test import APIClient
+from users.models import User
+from .models import Artwork
 
-# Create your tests here.
+
+class ArtworkPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        artist = User.objects.create_user('artist', password='password')
+        Artwork.objects.bulk_create(
+            Artwork(title=f'Opera {i}', description='', image='', price=Decimal('100'), artist=artist)
+            for i in range(30)
+        )
+        self.newest_first = list(Artwork.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get('/api/artworks/', {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 30)
+        self.assertIn('page=3', response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], self.newest_first[12:24])
+
+    def test_keyset_pages_are_one_query_each(self):
+        seen, params = [], {'cursor': ''}
+        while True:
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/artworks/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen += [item['id'] for item in response.data['results']]
+            if response.data['next'] is None:
+                break
+            params = {'cursor': parse_qs(urlparse(response.data['next']).query)['cursor'][0]}
+        self.assertEqual(seen, self.newest_first)
@@ -1,18 +1,27 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
 from rest_framework.response import Response
+from core.pagination import CursorOptInPagination
 from .models import Artwork
 from .serializers import ArtworkSerializer
 
 # Create your views here.
 
 class ArtworkViewSet(viewsets.ModelViewSet):
+    """
+    Catalogo delle opere, dalla più recente, con l'artista nella stessa query.
+    L'elenco è paginato per numero di pagina; con `?cursor=` passa al cursore
+    su (created_at, id): ogni pagina è una sola query sull'indice, a
+    qualunque profondità di scorrimento.
+    """
     queryset = Artwork.objects.all()
     serializer_class = ArtworkSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CursorOptInPagination
+    keyset_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
-        queryset = Artwork.objects.all()
+        queryset = Artwork.objects.select_related('artist')
         # Filtra per categoria se specificata
         category = self.request.query_params.get('category', None)
         if category:
@@ -1,122 +1,211 @@
-import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from core import groups
+from core.broadcast import get_broadcaster
+from core.heartbeat import get_heartbeat
+from core.throttling import ThrottleMixin
+from core.wire import WireProtocolMixin, encode_frames
+from live_streams import timeseries
 from .models import Auction
-from django.utils import timezone
+from .sequencer import get_sequencer
+from . import state
+
+
+def merge_deltas(pending, message):
+    # I delta contengono valori assoluti: vince quello con la sequenza più alta
+    older, newer = sorted((pending['delta'], message['delta']), key=lambda delta: delta['seq'])
+    return {'type': 'auction_update', 'delta': {**older, **newer}}
+
+
+def encode_update(message):
+    # Il delta accorpato viene codificato una sola volta per tutta la stanza
+    return {
+        'type': 'auction_update',
+        'frames': encode_frames({'type': 'auction_update', **message['delta'], 'server_time': state.server_time()}),
+    }
+
+
+async def auction_heartbeat(auction_id):
+    # Sequenza e scadenza correnti: il client riconosce gli aggiornamenti persi
+    # e riallinea l'orologio, senza un broadcast a ogni nuova connessione
+    snapshot = await database_sync_to_async(state.get_snapshot)(auction_id)
+    if snapshot:
+        return {
+            'type': 'auction_heartbeat',
+            'frames': encode_frames({
+                'type': 'auction_heartbeat',
+                'seq': snapshot['seq'],
+                'end_time': snapshot['end_time'],
+                'is_active': snapshot['is_active'],
+                'server_time': state.server_time(),
+            }),
+        }
+
+
+class AuctionConsumer(ThrottleMixin, WireProtocolMixin, AsyncWebsocketConsumer):
+    joined = False
 
-class AuctionConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.auction_id = self.scope['url_route']['kwargs']['auction_id']
         self.room_group_name = f'auction_{self.auction_id}'
 
-        # Verifica che l'asta esista e sia attiva
-        if await self.is_valid_auction():
+        # Verifica che l'asta esista e sia attiva (dallo snapshot in cache)
+        snapshot = await self.get_auction_status()
+        if snapshot and snapshot['is_active']:
             # Unisciti al gruppo
-            await self.channel_layer.group_add(
+            await groups.group_add(
+                self.channel_layer,
                 self.room_group_name,
                 self.channel_name
             )
-            await self.accept()
+            await self.accept_with_subprotocol()
             
-            # Invia stato iniziale
-            await self.send_auction_status()
+            # Un client che si riconnette riceve solo gli eventi persi,
+            # altrimenti lo stato completo: in entrambi i casi solo a lui
+            last_seq = self.get_last_seq()
+            missed = await self.get_missed_events(snapshot, last_seq) if last_seq is not None else None
+            if missed is not None:
+                await self.send_message({
+                    'type': 'auction_replay',
+                    **missed,
+                    'server_time': state.server_time(),
+                })
+            else:
+                await self.send_auction_status(snapshot)
+            self.heartbeat().join(self.room_group_name, self.auction_id)
+            self.joined = True
         else:
             await self.close()
 
     async def disconnect(self, close_code):
+        if self.joined:
+            await self.heartbeat().leave(self.room_group_name)
+            self.joined = False
         # Rimuovi dal gruppo
-        await self.channel_layer.group_discard(
+        await groups.group_discard(
+            self.channel_layer,
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode_message(text_data, bytes_data)
         message_type = text_data_json.get('type')
         
+        if not self.allow_message(message_type, text_data_json):
+            if message_type == 'place_bid':
+                await self.send_message({
+                    'type': 'bid_response',
+                    'success': False,
+                    'message': "Troppe offerte, riprova tra poco",
+                })
+            return
+
         if message_type == 'place_bid':
             # Gestisci una nuova offerta
             amount = text_data_json.get('amount')
             user_id = text_data_json.get('user_id')
-            success, message = await self.place_bid(user_id, amount)
+            if getattr(settings, 'AUCTION_BID_SEQUENCER', False):
+                # L'esito è deciso in memoria dal sequencer dell'asta
+                success, message, snapshot = await get_sequencer(self.auction_id).submit(
+                    user_id, amount, reply_to=self.channel_name
+                )
+            else:
+                success, message, snapshot = await self.place_bid(user_id, amount)
             
-            await self.send(text_data=json.dumps({
+            response = {
                 'type': 'bid_response',
                 'success': success,
                 'message': message
-            }))
+            }
+            if success:
+                # Sequenza dell'offerta: un eventuale rifiuto successivo la riporta
+                response['seq'] = snapshot['seq']
+            await self.send_message(response)
             
             if success:
-                # Invia aggiornamento a tutti i client
-                await self.channel_layer.group_send(
+                # Invia a tutti i client solo i campi modificati, accorpati per tick
+                delta = await self.update_auction_status(snapshot)
+                broadcaster = get_broadcaster(self.channel_layer, getattr(settings, 'AUCTION_BROADCAST_TICK', 0.1))
+                await broadcaster.publish(
                     self.room_group_name,
                     {
                         'type': 'auction_update',
-                        'current_price': amount,
-                        'highest_bidder': user_id,
-                        'time_remaining': await self.get_time_remaining()
-                    }
+                        'delta': delta,
+                    },
+                    merge=merge_deltas,
+                    prepare=encode_update,
                 )
+                if snapshot.get('live_stream'):
+                    await timeseries.record(snapshot['live_stream'], 'bids')
 
     async def auction_update(self, event):
-        # Invia aggiornamenti dell'asta
-        await self.send(text_data=json.dumps({
-            'type': 'auction_update',
-            'current_price': event['current_price'],
-            'highest_bidder': event['highest_bidder'],
-            'time_remaining': event['time_remaining']
-        }))
+        # Invia il delta dell'asta (già codificato) con il numero di sequenza
+        await self.send_frames(event['frames'])
 
-    @database_sync_to_async
-    def is_valid_auction(self):
-        try:
-            auction = Auction.objects.get(id=self.auction_id)
-            return auction.is_active
-        except Auction.DoesNotExist:
-            return False
+    async def auction_closed(self, event):
+        # Notifica la chiusura dell'asta con prezzo finale e vincitore
+        await self.send_frames(event['frames'], private=True)
+
+    async def auction_correction(self, event):
+        # Snapshot dal database dopo offerte annunciate ma non scritte
+        await self.send_frames(event['frames'], private=True)
+
+    async def bid_rejected(self, event):
+        # Offerta già confermata dal sequencer ma rifiutata dal database
+        await self.send_message({
+            'type': 'bid_response',
+            'success': False,
+            'message': event['message'],
+            'seq': event['seq'],
+        })
+
+    async def auction_heartbeat(self, event):
+        await self.send_frames(event['frames'], coalesce='auction_heartbeat')
+
+    def heartbeat(self):
+        interval = getattr(settings, 'WEBSOCKET_HEARTBEAT_INTERVAL', 5)
+        return get_heartbeat('auction', self.channel_layer, interval, auction_heartbeat)
+
+    def throttle_user_id(self, message):
+        # Senza sessione il limite "per utente" vale per la connessione: lo
+        # user_id del messaggio lo sceglie il client e non può fare da chiave
+        return super().throttle_user_id(message) or self.channel_name
 
     @database_sync_to_async
     def place_bid(self, user_id, amount):
         try:
             auction = Auction.objects.get(id=self.auction_id)
             success, message = auction.place_bid(user_id, amount)
-            return success, message
+            return success, message, state.build_snapshot(auction) if success else None
         except Auction.DoesNotExist:
-            return False, "Asta non trovata"
+            return False, "Asta non trovata", None
 
     @database_sync_to_async
     def get_auction_status(self):
-        try:
-            auction = Auction.objects.get(id=self.auction_id)
-            return {
-                'current_price': auction.current_price,
-                'highest_bidder': auction.highest_bidder.id if auction.highest_bidder else None,
-                'total_bids': auction.total_bids,
-                'unique_bidders': auction.unique_bidders,
-                'time_remaining': auction.time_remaining.total_seconds() if auction.time_remaining else None
-            }
-        except Auction.DoesNotExist:
-            return None
+        return state.get_snapshot(self.auction_id)
+
+    @database_sync_to_async
+    def update_auction_status(self, snapshot):
+        return state.record_bid(snapshot)
 
     @database_sync_to_async
-    def get_time_remaining(self):
+    def get_missed_events(self, snapshot, last_seq):
+        return state.replay(snapshot, last_seq)
+
+    def get_last_seq(self):
+        # ws/auction/<id>/?last_seq=<n> quando il client si riconnette
+        values = parse_qs(self.scope.get('query_string', b'').decode()).get('last_seq')
         try:
-            auction = Auction.objects.get(id=self.auction_id)
-            if auction.time_remaining:
-                return auction.time_remaining.total_seconds()
-            return None
-        except Auction.DoesNotExist:
+            return int(values[0]) if values else None
+        except ValueError:
             return None
 
-    async def send_auction_status(self):
-        status = await self.get_auction_status()
-        if status:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'auction_update',
-                    'current_price': status['current_price'],
-                    'highest_bidder': status['highest_bidder'],
-                    'time_remaining': status['time_remaining']
-                }
-            ) 
\ No newline at end of file
+    async def send_auction_status(self, snapshot):
+        await self.send_message({
+            'type': 'auction_snapshot',
+            **snapshot,
+            'server_time': state.server_time(),
+        })
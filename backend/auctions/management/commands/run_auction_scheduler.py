@@ -0,0 +1,22 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from auctions.scheduler import AuctionScheduler
+
+
+class Command(BaseCommand):
+    help = 'Avvia lo scheduler che chiude le aste alla scadenza'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rescan',
+            type=int,
+            default=None,
+            help='Secondi tra due scansioni delle aste create o modificate',
+        )
+
+    def handle(self, *args, **options):
+        scheduler = AuctionScheduler(rescan_interval=options['rescan'])
+        try:
+            asyncio.run(scheduler.run())
+        except KeyboardInterrupt:
+            self.stdout.write('Scheduler aste arrestato')
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Importo')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('auction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='auctions.auction')),
+                ('bidder', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bids', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Offerta',
+                'verbose_name_plural': 'Offerte',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['auction', 'created_at'], name='auctions_bi_auction_deb2ca_idx')],
+            },
+        ),
+    ]
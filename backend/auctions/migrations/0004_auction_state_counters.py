@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Auction = apps.get_model('auctions', 'Auction')
+    counts = (
+        Auction.objects.filter(bids__isnull=False)
+        .annotate(total=Count('bids'), bidders=Count('bids__bidder', distinct=True))
+        .values_list('pk', 'total', 'bidders')
+    )
+    for pk, total, bidders in counts:
+        Auction.objects.filter(pk=pk).update(bids_count=total, unique_bidders_count=bidders, version=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0003_bid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='bids_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Numero Offerte'),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='unique_bidders_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Offerenti Unici'),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Versione'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', 'bidder'], name='auctions_bi_auction_331710_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artworks', '0002_initial'),
+        ('auctions', '0004_auction_state_counters'),
+        ('live_streams', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['is_active', 'end_time'], name='auctions_au_is_acti_5ed5f6_idx'),
+        ),
+    ]
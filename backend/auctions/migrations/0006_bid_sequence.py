@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_sequence(apps, schema_editor):
+    Bid = apps.get_model('auctions', 'Bid')
+    auction_ids = Bid.objects.values_list('auction_id', flat=True).order_by().distinct()
+    for auction_id in auction_ids:
+        bids = list(Bid.objects.filter(auction_id=auction_id).order_by('created_at', 'id'))
+        for sequence, bid in enumerate(bids, start=1):
+            bid.sequence = sequence
+        Bid.objects.bulk_update(bids, ['sequence'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0005_auction_active_end_time_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='sequence',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Sequenza'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', 'sequence'], name='auctions_bi_auction_ee856a_idx'),
+        ),
+        migrations.RunPython(backfill_sequence, migrations.RunPython.noop),
+    ]
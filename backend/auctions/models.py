@@ -1,8 +1,32 @@
-from django.db import models
+from decimal import ROUND_DOWN, Decimal, InvalidOperation
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 
+
+# Importi rappresentabili da DecimalField(max_digits=10, decimal_places=2)
+CENT = Decimal('0.01')
+MAX_BID_AMOUNT = Decimal('99999999.99')
+
+
+def parse_bid_amount(value):
+    """
+    Converte l'importo ricevuto dal client in Decimal al centesimo (troncato),
+    None se non valido o fuori dai limiti della colonna: un valore più grande
+    verrebbe scritto ma renderebbe illeggibile la riga.
+    """
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not amount.is_finite() or not 0 < amount <= MAX_BID_AMOUNT:
+        return None
+    return amount.quantize(CENT, rounding=ROUND_DOWN)
+
+
 class Auction(models.Model):
     artwork = models.OneToOneField('artworks.Artwork', on_delete=models.CASCADE, related_name='auction')
     starting_price = models.DecimalField(_('Prezzo Iniziale'), max_digits=10, decimal_places=2)
@@ -15,6 +39,12 @@ class Auction(models.Model):
     is_live = models.BooleanField(_('In Diretta'), default=False)
     live_stream = models.ForeignKey('live_streams.LiveStream', on_delete=models.SET_NULL, null=True, blank=True, related_name='auctions')
     min_bid_increment = models.DecimalField(_('Incremento Minimo'), max_digits=10, decimal_places=2, default=1.00)
+
+    # Versione dello stato (incrementata a ogni modifica) e contatori delle offerte
+    version = models.PositiveBigIntegerField(_('Versione'), default=0)
+    bids_count = models.PositiveIntegerField(_('Numero Offerte'), default=0)
+    unique_bidders_count = models.PositiveIntegerField(_('Offerenti Unici'), default=0)
+
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -22,38 +52,145 @@ class Auction(models.Model):
         verbose_name = _('Asta')
         verbose_name_plural = _('Aste')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_active', 'end_time', 'id']),
+        ]
 
     def __str__(self):
         return f"Asta per {self.artwork.title}"
 
-    def place_bid(self, user, amount):
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.invalidate_state()
+
+    def invalidate_state(self):
+        # Lo snapshot in cache verrà ricostruito alla prossima lettura
+        from .state import invalidate_snapshot
+        invalidate_snapshot(self.pk)
+
+    def anti_sniping_end_time(self, now):
+        """
+        Fine dell'asta dopo un'offerta ricevuta in `now`: se mancano meno di
+        AUCTION_ANTI_SNIPING_SECONDS secondi, l'asta viene prolungata.
+        """
+        seconds = getattr(settings, 'AUCTION_ANTI_SNIPING_SECONDS', 0)
+        if not seconds:
+            return self.end_time
+        return max(self.end_time, now + timezone.timedelta(seconds=seconds))
+
+    def validate_bid(self, amount, now=None):
+        """Controlla un'offerta contro lo stato in memoria, senza accedere al database."""
+        now = now or timezone.now()
         if not self.is_active:
             return False, "Asta non attiva"
-        
+        if self.end_time <= now:
+            return False, "Asta terminata"
         if amount <= self.current_price:
             return False, "Offerta troppo bassa"
-        
         if amount < self.current_price + self.min_bid_increment:
             return False, f"Offerta deve essere almeno {self.min_bid_increment}€ superiore"
-        
+        return True, None
+
+    def place_bid(self, user, amount, placed_at=None):
+        """
+        Registra un'offerta con un unico UPDATE condizionale (compare-and-swap su
+        current_price/min_bid_increment) e la aggiunge al registro Bid.
+        `user` può essere un'istanza di User oppure il suo id; `placed_at` è
+        l'istante di ricezione se l'offerta è già stata accettata altrove.
+        """
+        amount = parse_bid_amount(amount)
+        if amount is None:
+            return False, "Offerta non valida"
+
+        bidder_id = getattr(user, 'pk', user)
+        if bidder_id is None:
+            return False, "Utente non valido"
+
+        # Il prezzo può solo salire: se l'offerta non supera il valore già letto
+        # è sicuramente troppo bassa e non serve toccare il database
+        if amount <= self.current_price:
+            return False, "Offerta troppo bassa"
+
+        now = placed_at or timezone.now()
+        extra_fields = {}
+        sniping_seconds = getattr(settings, 'AUCTION_ANTI_SNIPING_SECONDS', 0)
+        if sniping_seconds:
+            # Anti-sniping nello stesso UPDATE: end_time = max(end_time, now + N)
+            extra_fields['end_time'] = Greatest(
+                F('end_time'),
+                Value(now + timezone.timedelta(seconds=sniping_seconds), output_field=models.DateTimeField()),
+            )
+        with transaction.atomic():
+            updated = Auction.objects.filter(
+                pk=self.pk,
+                is_active=True,
+                end_time__gt=now,
+                current_price__lt=amount,
+                current_price__lte=amount - F('min_bid_increment'),
+            ).update(
+                current_price=amount,
+                highest_bidder_id=bidder_id,
+                last_bid_time=now,
+                updated_at=now,
+                version=F('version') + 1,
+                bids_count=F('bids_count') + 1,
+                **extra_fields,
+            )
+            if updated:
+                # Con la riga bloccata le offerte di questa asta sono serializzate:
+                # il controllo sul registro non può correre con un'altra prima offerta
+                if not Bid.objects.filter(auction_id=self.pk, bidder_id=bidder_id).exists():
+                    Auction.objects.filter(pk=self.pk).update(unique_bidders_count=F('unique_bidders_count') + 1)
+                # La riga è ancora bloccata dall'UPDATE: questi valori sono esatti
+                self.version, self.bids_count, self.unique_bidders_count, self.end_time = (
+                    Auction.objects.filter(pk=self.pk)
+                    .values_list('version', 'bids_count', 'unique_bidders_count', 'end_time')
+                    .get()
+                )
+                self.last_bid = Bid.objects.create(
+                    auction_id=self.pk,
+                    bidder_id=bidder_id,
+                    amount=amount,
+                    sequence=self.version,
+                    created_at=now,
+                )
+
+        if not updated:
+            # Offerta rifiutata: rileggi lo stato per restituire il motivo corretto
+            self.refresh_from_db(fields=['current_price', 'min_bid_increment', 'is_active', 'end_time'])
+            message = self.validate_bid(amount, now)[1]
+            return False, message or "Offerta non accettata"
+
         self.current_price = amount
-        self.highest_bidder = user
-        self.last_bid_time = timezone.now()
-        self.save()
-        
+        self.highest_bidder_id = bidder_id
+        self.last_bid_time = now
+        self.updated_at = now
         return True, "Offerta accettata"
 
     def end_auction(self):
-        if self.is_active:
-            self.is_active = False
+        # UPDATE condizionale: solo chi chiude davvero l'asta vende l'opera
+        closed = Auction.objects.filter(pk=self.pk, is_active=True).update(
+            is_active=False,
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if closed:
+            self.refresh_from_db(fields=['is_active', 'version', 'current_price', 'highest_bidder'])
             if self.highest_bidder:
                 self.artwork.mark_as_sold(self.highest_bidder, self.current_price)
-            self.save()
+            self.invalidate_state()
+        return bool(closed)
 
     def extend_time(self, minutes):
-        if self.is_active:
-            self.end_time += timezone.timedelta(minutes=minutes)
-            self.save()
+        # Aggiorna solo end_time/version per non sovrascrivere offerte concorrenti
+        extended = Auction.objects.filter(pk=self.pk, is_active=True).update(
+            end_time=F('end_time') + timezone.timedelta(minutes=minutes),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if extended:
+            self.refresh_from_db(fields=['end_time', 'version'])
+            self.invalidate_state()
             return True
         return False
 
@@ -72,3 +209,31 @@ class Auction(models.Model):
         if not self.is_active:
             return False
         return self.time_remaining.total_seconds() <= 300  # 5 minuti
+
+
+class Bid(models.Model):
+    """Registro append-only delle offerte accettate."""
+    auction = models.ForeignKey(Auction, on_delete=models.CASCADE, related_name='bids')
+    bidder = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='bids')
+    amount = models.DecimalField(_('Importo'), max_digits=10, decimal_places=2)
+    # Versione dell'asta prodotta da questa offerta: numero di sequenza per il replay
+    sequence = models.PositiveBigIntegerField(_('Sequenza'), default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Offerta')
+        verbose_name_plural = _('Offerte')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['auction', 'created_at']),
+            models.Index(fields=['auction', 'bidder']),
+            models.Index(fields=['auction', 'sequence']),
+        ]
+
+    def __str__(self):
+        return f"{self.amount}€ su {self.auction_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Le offerte registrate non possono essere modificate")
+        super().save(*args, **kwargs)
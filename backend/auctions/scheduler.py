@@ -0,0 +1,173 @@
+import asyncio
+import heapq
+import logging
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from artworks.models import Artwork
+from core import groups
+from core.wire import encode_frames
+from .models import Auction
+from . import state
+
+logger = logging.getLogger(__name__)
+
+# Secondi di attesa prima di ritentare una chiusura o una scansione fallite
+RETRY_DELAY = 5
+
+
+class AuctionScheduler:
+    """
+    Chiude le aste alla scadenza di end_time. Le scadenze sono tenute in un
+    heap: il processo dorme fino alla prossima, senza interrogare la tabella
+    ogni secondo. Le proroghe (anti-sniping, extend_time) sono gestite in modo
+    lazy: alla scadenza si rilegge end_time e, se è stato spostato, l'asta
+    viene ripianificata. Una scansione periodica leggera raccoglie le aste
+    create o modificate dagli altri processi. Se il database non risponde le
+    aste restano nell'heap e la chiusura viene ritentata dopo RETRY_DELAY
+    secondi: il processo non si ferma.
+    """
+
+    def __init__(self, rescan_interval=None):
+        self.rescan_interval = rescan_interval or getattr(settings, 'AUCTION_SCHEDULER_RESCAN', 60)
+        self.heap = []
+        self.scheduled = {}
+        self.last_scan = None
+        self.next_scan = None
+        self.channel_layer = get_channel_layer()
+
+    def schedule(self, auction_id, end_time):
+        if self.scheduled.get(auction_id) == end_time:
+            return
+        self.scheduled[auction_id] = end_time
+        heapq.heappush(self.heap, (end_time, auction_id))
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            end_time, auction_id = heapq.heappop(self.heap)
+            # Voce superata da una ripianificazione successiva
+            if self.scheduled.get(auction_id) != end_time:
+                continue
+            del self.scheduled[auction_id]
+            due.append(auction_id)
+        return due
+
+    @database_sync_to_async
+    def load(self, since=None):
+        """Carica le aste attive (tutte al riavvio, solo le modificate dopo)."""
+        now = timezone.now()
+        auctions = Auction.objects.filter(is_active=True)
+        if since is not None:
+            auctions = auctions.filter(updated_at__gte=since)
+        entries = list(auctions.values_list('id', 'end_time'))
+        self.last_scan = now
+        return entries
+
+    @database_sync_to_async
+    def close_due(self, auction_ids):
+        """
+        Chiude in blocco le aste scadute e vende le opere ai vincitori.
+        Restituisce gli snapshot delle aste chiuse e le aste prorogate.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # Il lock impedisce che un'offerta arrivi tra la lettura e la chiusura
+            auctions = list(
+                Auction.objects.select_for_update()
+                .filter(id__in=auction_ids, is_active=True)
+            )
+            closing = [auction for auction in auctions if auction.end_time <= now]
+            extended = [(auction.id, auction.end_time) for auction in auctions if auction.end_time > now]
+
+            Auction.objects.filter(id__in=[auction.id for auction in closing]).update(
+                is_active=False,
+                version=F('version') + 1,
+                updated_at=now,
+            )
+            Artwork.mark_many_as_sold([
+                (auction.artwork_id, auction.highest_bidder_id, auction.current_price)
+                for auction in closing
+                if auction.highest_bidder_id
+            ])
+
+        snapshots = []
+        for auction in closing:
+            auction.is_active = False
+            auction.version += 1
+            snapshot = state.build_snapshot(auction)
+            state.update_snapshot(snapshot, fields=('is_active', 'current_price', 'highest_bidder', 'end_time'))
+            snapshots.append(snapshot)
+        return snapshots, extended
+
+    async def announce(self, snapshot):
+        await groups.group_send(
+            self.channel_layer,
+            f"auction_{snapshot['auction_id']}",
+            {
+                'type': 'auction_closed',
+                'frames': encode_frames({
+                    'type': 'auction_closed',
+                    'seq': snapshot['seq'],
+                    'current_price': snapshot['current_price'],
+                    'winner': snapshot['highest_bidder'],
+                    'server_time': state.server_time(),
+                }),
+            }
+        )
+
+    async def rescan(self):
+        """
+        Pianifica le aste attive: tutte al primo avvio, poi solo quelle
+        modificate dall'ultima scansione. Restituisce False se è fallita.
+        """
+        since = None
+        if self.last_scan is not None:
+            # Margine per le transazioni ancora aperte durante la scansione precedente
+            since = self.last_scan - timezone.timedelta(seconds=5)
+        try:
+            entries = await self.load(since)
+        except Exception:
+            logger.exception("Scansione delle aste fallita, nuovo tentativo tra %s secondi", RETRY_DELAY)
+            self.next_scan = timezone.now() + timezone.timedelta(seconds=RETRY_DELAY)
+            return False
+        for auction_id, end_time in entries:
+            self.schedule(auction_id, end_time)
+        self.next_scan = self.last_scan + timezone.timedelta(seconds=self.rescan_interval)
+        return True
+
+    async def close(self, due):
+        try:
+            snapshots, extended = await self.close_due(due)
+        except Exception:
+            logger.exception("Chiusura di %d aste fallita, nuovo tentativo tra %s secondi", len(due), RETRY_DELAY)
+            retry_at = timezone.now() + timezone.timedelta(seconds=RETRY_DELAY)
+            for auction_id in due:
+                self.schedule(auction_id, retry_at)
+            return
+        for auction_id, end_time in extended:
+            self.schedule(auction_id, end_time)
+        results = await asyncio.gather(*(self.announce(snapshot) for snapshot in snapshots), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Annuncio di chiusura asta fallito: %r", result)
+        if snapshots:
+            logger.info("Chiuse %d aste", len(snapshots))
+
+    async def run(self):
+        if await self.rescan():
+            logger.info("Scheduler aste avviato con %d aste attive", len(self.scheduled))
+
+        while True:
+            due = self.pop_due(timezone.now())
+            if due:
+                await self.close(due)
+
+            wake_up = min(self.heap[0][0], self.next_scan) if self.heap else self.next_scan
+            await asyncio.sleep(max((wake_up - timezone.now()).total_seconds(), 0))
+
+            if timezone.now() >= self.next_scan:
+                await self.rescan()
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from core import groups
+from core.wire import encode_frames
+from .models import Auction, Bid, parse_bid_amount
+from .state import build_snapshot, reset_snapshot, server_time
+
+logger = logging.getLogger(__name__)
+
+# Un sequencer per asta attiva, per processo
+_sequencers = {}
+
+# Attesa massima tra due controlli della scadenza dell'asta (secondi)
+END_CHECK_INTERVAL = 60
+
+# Letture dal database ritentate prima di arrendersi, con attesa che raddoppia (secondi)
+RESYNC_ATTEMPTS = 4
+RESYNC_RETRY_DELAY = 0.5
+
+
+class AuctionSequencer:
+    """
+    Unico scrittore in memoria per un'asta: un task asyncio ordina le offerte,
+    le valida contro lo stato in memoria e le persiste in background.
+    Va usato con routing "sticky" (un solo processo per asta); il
+    compare-and-swap di Auction.place_bid resta comunque la garanzia finale.
+
+    L'esito viene comunicato prima della scrittura: se il database rifiuta
+    un'offerta già annunciata, lo stato torna a quello del database (con una
+    sequenza più alta di tutte quelle annunciate), la stanza riceve lo
+    snapshot corretto e chi aveva offerto un bid_response negativo.
+    Alla fine dell'asta i task si fermano da soli; se il database resta
+    irraggiungibile le offerte in attesa falliscono e il sequencer esce dal
+    registro, così il prossimo submit ne crea uno nuovo.
+    """
+
+    def __init__(self, auction_id):
+        self.auction_id = auction_id
+        self.auction = None
+        self.bidders = set()
+        self.loop = asyncio.get_running_loop()
+        self.stopped = False
+        self.stop_message = "Asta terminata"
+        self._incoming = asyncio.Queue()
+        self._to_persist = asyncio.Queue()
+        self._ready = asyncio.Event()
+        self._tasks = [
+            self.loop.create_task(self._run()),
+            self.loop.create_task(self._persist()),
+        ]
+
+    async def submit(self, user_id, amount, reply_to=None):
+        """
+        Accoda un'offerta e attende l'esito, deciso solo in memoria.
+        Restituisce (successo, messaggio, snapshot dello stato dopo l'offerta).
+        `reply_to` è il canale dell'offerente, avvisato se la scrittura fallisce.
+        """
+        if self.stopped:
+            return False, self.stop_message, None
+        future = self.loop.create_future()
+        await self._incoming.put((user_id, amount, reply_to, future))
+        return await future
+
+    async def _run(self):
+        try:
+            await self._sequence()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Errore nel sequencer dell'asta %s", self.auction_id)
+            await self.abort()
+
+    async def _sequence(self):
+        # Recupera lo stato dal database a ogni (ri)avvio
+        if not await self.resync_with_retry():
+            await self.abort()
+            return
+        self._ready.set()
+        while True:
+            try:
+                user_id, amount, reply_to, future = await asyncio.wait_for(
+                    self._incoming.get(), self.seconds_to_end()
+                )
+            except asyncio.TimeoutError:
+                # Scadenza raggiunta in memoria: conferma dal database (proroghe
+                # manuali o chiusura anticipata) prima di fermarsi
+                await self._to_persist.join()
+                if not await self.resync_with_retry():
+                    await self.abort()
+                    return
+                if self.is_ended():
+                    await self.finish()
+                    return
+                continue
+            # Durante un rollback le offerte attendono lo stato riallineato
+            await self._ready.wait()
+            try:
+                result = self._apply(user_id, amount, reply_to)
+            except Exception as e:
+                logger.exception("Errore nel sequencer dell'asta %s", self.auction_id)
+                result = (False, str(e), None)
+            if not future.done():
+                future.set_result(result)
+
+    async def with_retry(self, read):
+        """
+        Esegue una lettura dal database ritentandola con attesa crescente.
+        Restituisce (riuscita, risultato).
+        """
+        delay = RESYNC_RETRY_DELAY
+        for attempt in range(1, RESYNC_ATTEMPTS + 1):
+            try:
+                return True, await read()
+            except Exception:
+                logger.exception(
+                    "Lettura dell'asta %s fallita (tentativo %s di %s)", self.auction_id, attempt, RESYNC_ATTEMPTS
+                )
+            if attempt < RESYNC_ATTEMPTS:
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False, None
+
+    async def resync_with_retry(self):
+        success, _ = await self.with_retry(self.resync)
+        return success
+
+    def seconds_to_end(self):
+        if self.auction is None:
+            return 0
+        remaining = (self.auction.end_time - timezone.now()).total_seconds()
+        return min(max(remaining, 0), END_CHECK_INTERVAL)
+
+    def is_ended(self):
+        return self.auction is None or self.auction.is_ended
+
+    def _apply(self, user_id, amount, reply_to=None):
+        if self.auction is None:
+            return False, "Asta non trovata", None
+        amount = parse_bid_amount(amount)
+        if amount is None:
+            return False, "Offerta non valida", None
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return False, "Utente non valido", None
+
+        now = timezone.now()
+        success, message = self.auction.validate_bid(amount, now)
+        if not success:
+            return False, message, None
+
+        auction = self.auction
+        auction.current_price = amount
+        auction.highest_bidder_id = user_id
+        auction.last_bid_time = now
+        auction.end_time = auction.anti_sniping_end_time(now)
+        auction.version += 1
+        auction.bids_count += 1
+        if user_id not in self.bidders:
+            self.bidders.add(user_id)
+            auction.unique_bidders_count += 1
+        self._to_persist.put_nowait((user_id, amount, now, auction.version, reply_to))
+        return True, "Offerta accettata", build_snapshot(auction)
+
+    async def _persist(self):
+        await self._ready.wait()
+        success, writer = await self.with_retry(self.load_state)
+        if not success:
+            await self.abort()
+            return
+        while True:
+            bid = await self._to_persist.get()
+            user_id, amount, placed_at, seq, reply_to = bid
+            try:
+                success, message = await database_sync_to_async(writer.place_bid)(user_id, amount, placed_at)
+            except Exception:
+                logger.exception("Persistenza offerta fallita per l'asta %s", self.auction_id)
+                success, message = False, None
+            if success:
+                self._to_persist.task_done()
+                continue
+            # Un altro scrittore ha modificato l'asta (o il database non risponde):
+            # le offerte ancora in coda sono state validate contro uno stato mai scritto
+            logger.warning("Offerta %s su asta %s rifiutata dal database: %s", amount, self.auction_id, message)
+            rejected = [bid]
+            while not self._to_persist.empty():
+                rejected.append(self._to_persist.get_nowait())
+            try:
+                await self.rollback(rejected)
+            except Exception:
+                logger.exception("Rollback fallito per l'asta %s", self.auction_id)
+            finally:
+                for _ in rejected:
+                    self._to_persist.task_done()
+            success, reloaded = await self.with_retry(self.load_state)
+            if not success:
+                await self.abort()
+                return
+            writer = reloaded or writer
+
+    async def rollback(self, rejected):
+        """
+        Riporta lo stato a quello del database dopo offerte annunciate ma non
+        scritte: snapshot e log in cache ricostruiti, stanza e offerenti avvisati.
+        """
+        self._ready.clear()
+        try:
+            issued = max(seq for _, _, _, seq, _ in rejected)
+            auction = await self.restore(issued)
+            if auction is None:
+                return
+            self.auction = auction
+            self.bidders = await self.load_bidders()
+            snapshot = await database_sync_to_async(reset_snapshot)(auction)
+        finally:
+            self._ready.set()
+
+        channel_layer = get_channel_layer()
+        for user_id, amount, _, seq, reply_to in rejected:
+            if reply_to:
+                await channel_layer.send(reply_to, {
+                    'type': 'bid_rejected',
+                    'seq': seq,
+                    'message': "Offerta non registrata, riprova",
+                })
+        await groups.group_send(channel_layer, f'auction_{self.auction_id}', {
+            'type': 'auction_correction',
+            'frames': encode_frames({'type': 'auction_snapshot', **snapshot, 'server_time': server_time()}),
+        })
+
+    async def resync(self):
+        auction = await self.load_state()
+        self.auction = auction
+        if auction is not None:
+            self.bidders = await self.load_bidders()
+
+    async def flush(self):
+        """Attende che tutte le offerte accettate siano state scritte."""
+        await self._ready.wait()
+        await self._to_persist.join()
+
+    async def finish(self):
+        """Fine dell'asta: scrive le offerte in coda, rifiuta le nuove e libera i task."""
+        self.stopped = True
+        if _sequencers.get(self.auction_id) is self:
+            del _sequencers[self.auction_id]
+        await self._to_persist.join()
+        self._release()
+
+    async def abort(self, message="Asta non disponibile, riprova"):
+        """
+        Errore non recuperabile (database irraggiungibile): le offerte in attesa
+        falliscono e il sequencer esce dal registro senza aspettare le scritture.
+        """
+        logger.error("Sequencer dell'asta %s fermato: %s", self.auction_id, message)
+        self.stopped = True
+        self.stop_message = message
+        if _sequencers.get(self.auction_id) is self:
+            del _sequencers[self.auction_id]
+        self._release()
+
+    def _release(self):
+        while not self._incoming.empty():
+            *_, future = self._incoming.get_nowait()
+            if not future.done():
+                future.set_result((False, self.stop_message, None))
+        for task in self._tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+
+    async def stop(self):
+        await self.flush()
+        await self.finish()
+
+    @database_sync_to_async
+    def restore(self, issued_seq):
+        """
+        Rilegge l'asta portando la versione oltre l'ultima sequenza annunciata:
+        i client non vedono mai la sequenza tornare indietro.
+        """
+        with transaction.atomic():
+            Auction.objects.filter(pk=self.auction_id).update(
+                version=Greatest(F('version'), Value(issued_seq)) + 1,
+                updated_at=timezone.now(),
+            )
+            try:
+                return Auction.objects.get(id=self.auction_id)
+            except Auction.DoesNotExist:
+                return None
+
+    @database_sync_to_async
+    def load_state(self):
+        try:
+            return Auction.objects.get(id=self.auction_id)
+        except Auction.DoesNotExist:
+            return None
+
+    @database_sync_to_async
+    def load_bidders(self):
+        bidders = Bid.objects.filter(auction_id=self.auction_id).values_list('bidder_id', flat=True)
+        return set(bidders.order_by().distinct())
+
+
+def get_sequencer(auction_id):
+    """Restituisce il sequencer dell'asta, creandolo nel loop corrente se serve."""
+    auction_id = str(auction_id)
+    sequencer = _sequencers.get(auction_id)
+    if sequencer is None or sequencer.stopped or sequencer.loop is not asyncio.get_running_loop():
+        sequencer = _sequencers[auction_id] = AuctionSequencer(auction_id)
+    return sequencer
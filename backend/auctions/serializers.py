@@ -0,0 +1,27 @@
+from rest_framework import serializers
+from artworks.models import Artwork
+from media.serializers import RenditionsField
+from .models import Auction
+
+
+class AuctionArtworkSerializer(serializers.ModelSerializer):
+    artist_name = serializers.CharField(source='artist.username', read_only=True)
+    image_renditions = RenditionsField('image')
+
+    class Meta:
+        model = Artwork
+        fields = ['id', 'title', 'image', 'image_renditions', 'artist', 'artist_name']
+
+
+class AuctionSerializer(serializers.ModelSerializer):
+    artwork = AuctionArtworkSerializer(read_only=True)
+    highest_bidder_name = serializers.CharField(source='highest_bidder.username', read_only=True, default=None)
+
+    class Meta:
+        model = Auction
+        fields = [
+            'id', 'artwork', 'starting_price', 'current_price', 'min_bid_increment',
+            'highest_bidder', 'highest_bidder_name', 'start_time', 'end_time', 'last_bid_time',
+            'is_active', 'is_live', 'live_stream', 'bids_count', 'unique_bidders_count',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,173 @@
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from core.ringbuffer import CacheRingBuffer
+from .models import Auction, Bid
+
+# Gli snapshot vengono ricostruiti dal database se spariscono dalla cache:
+# una durata breve limita quanto a lungo un processo può servire uno stato
+# modificato altrove senza invalidazione
+SNAPSHOT_TIMEOUT = 60
+
+# Campi che un'offerta accettata può modificare: sono gli unici inviati nei delta
+BID_FIELDS = ('current_price', 'highest_bidder', 'total_bids', 'unique_bidders', 'end_time')
+
+
+def snapshot_key(auction_id):
+    return f'auction_state_{auction_id}'
+
+
+def to_millis(value):
+    return int(value.timestamp() * 1000) if value else None
+
+
+def server_time():
+    """Orologio del server in millisecondi, per calcolare l'offset lato client."""
+    return to_millis(timezone.now())
+
+
+def build_snapshot(auction):
+    """
+    Stato completo e versionato di un'asta. I tempi sono in millisecondi epoch:
+    il client calcola il countdown da end_time e dall'offset con server_time.
+    """
+    return {
+        'seq': auction.version,
+        'auction_id': auction.pk,
+        'current_price': f'{auction.current_price:.2f}',
+        'min_bid_increment': f'{auction.min_bid_increment:.2f}',
+        'highest_bidder': auction.highest_bidder_id,
+        'total_bids': auction.bids_count,
+        'unique_bidders': auction.unique_bidders_count,
+        'end_time': to_millis(auction.end_time),
+        'last_bid_time': to_millis(auction.last_bid_time),
+        'is_active': auction.is_active,
+        'live_stream': auction.live_stream_id,
+    }
+
+
+def is_past_end(snapshot):
+    return snapshot['is_active'] and snapshot['end_time'] is not None and snapshot['end_time'] <= server_time()
+
+
+def get_snapshot(auction_id):
+    """
+    Restituisce lo snapshot dalla cache, leggendo il database solo se manca
+    o se l'asta risulta attiva oltre la scadenza: la chiusura avviene nello
+    scheduler, un altro processo, e is_active/end_time vanno verificati.
+    """
+    snapshot = cache.get(snapshot_key(auction_id))
+    if snapshot is None or is_past_end(snapshot):
+        try:
+            auction = Auction.objects.get(id=auction_id)
+        except (Auction.DoesNotExist, ValueError):
+            return None
+        fresh = build_snapshot(auction)
+        if snapshot is None or fresh['seq'] >= snapshot['seq']:
+            snapshot = fresh
+            cache.set(snapshot_key(auction_id), snapshot, SNAPSHOT_TIMEOUT)
+        else:
+            # Offerte annunciate e non ancora scritte: restano, ma la scadenza è quella del database
+            snapshot = {**snapshot, 'is_active': fresh['is_active'], 'end_time': fresh['end_time']}
+    return snapshot
+
+
+def update_snapshot(snapshot, fields=BID_FIELDS):
+    """
+    Salva un nuovo snapshot se più recente di quello in cache e restituisce
+    il delta da inviare ai client. I valori del delta sono assoluti, quindi un
+    client che salta un numero di sequenza resta comunque consistente.
+    """
+    key = snapshot_key(snapshot['auction_id'])
+    current = cache.get(key)
+    # Un worker più lento non deve far tornare indietro lo snapshot
+    if current is None or current['seq'] < snapshot['seq']:
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+
+    delta = {field: snapshot[field] for field in fields}
+    delta['seq'] = snapshot['seq']
+    return delta
+
+
+def invalidate_snapshot(auction_id):
+    cache.delete(snapshot_key(auction_id))
+
+
+def reset_snapshot(auction):
+    """
+    Sostituisce snapshot e log degli eventi con lo stato del database, anche
+    se la sequenza in cache è più alta (offerte annunciate ma mai scritte).
+    """
+    invalidate_snapshot(auction.pk)
+    event_log(auction.pk).clear()
+    snapshot = build_snapshot(auction)
+    cache.set(snapshot_key(auction.pk), snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def bid_event(sequence, amount, bidder_id, created_at):
+    return {'seq': sequence, 'amount': f'{amount:.2f}', 'bidder': bidder_id, 'time': to_millis(created_at)}
+
+
+def load_bid_events(auction_id, size):
+    """Ricostruisce il log degli eventi dalle ultime offerte del registro Bid."""
+    bids = (
+        Bid.objects.filter(auction_id=auction_id)
+        .order_by('-sequence')
+        .values_list('sequence', 'amount', 'bidder_id', 'created_at')[:size]
+    )
+    return [bid_event(*bid) for bid in reversed(bids)]
+
+
+def read_bid_events(auction_id, seq, size):
+    """
+    Offerte successive a `seq` lette dal registro Bid (indice auction, sequence),
+    None se sono più di `size`: il client riceve lo snapshot completo.
+    """
+    bids = list(
+        Bid.objects.filter(auction_id=auction_id, sequence__gt=seq)
+        .order_by('sequence')
+        .values_list('sequence', 'amount', 'bidder_id', 'created_at')[:size + 1]
+    )
+    if len(bids) > size:
+        return None
+    return [bid_event(*bid) for bid in bids]
+
+
+def event_log(auction_id):
+    size = getattr(settings, 'AUCTION_EVENT_LOG_SIZE', 200)
+    return CacheRingBuffer(
+        f'auction_events_{auction_id}',
+        size,
+        loader=partial(load_bid_events, auction_id),
+        reader=partial(read_bid_events, auction_id),
+        timeout=SNAPSHOT_TIMEOUT,
+    )
+
+
+def record_bid(snapshot):
+    """Aggiorna lo snapshot dopo un'offerta, la aggiunge al log e restituisce il delta."""
+    delta = update_snapshot(snapshot)
+    event_log(snapshot['auction_id']).append({
+        'seq': snapshot['seq'],
+        'amount': snapshot['current_price'],
+        'bidder': snapshot['highest_bidder'],
+        'time': snapshot['last_bid_time'],
+    })
+    return delta
+
+
+def replay(snapshot, last_seq):
+    """
+    Offerte perse da un client che si riconnette dopo `last_seq`, seguite dai
+    valori correnti. None se il log non copre il buco: serve lo snapshot completo.
+    """
+    if last_seq >= snapshot['seq']:
+        return {'events': [], 'seq': snapshot['seq']}
+    events = event_log(snapshot['auction_id']).since(last_seq)
+    # Modifiche successive all'ultima offerta (es. proroghe manuali) non sono nel log
+    if not events or events[-1]['seq'] != snapshot['seq']:
+        return None
+    current = {field: snapshot[field] for field in BID_FIELDS}
+    return {'events': events, 'seq': snapshot['seq'], **current}
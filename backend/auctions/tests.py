@@ -1,3 +1,393 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+from decimal import Decimal
+from unittest import mock
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from artworks.models import Artwork
+from core import groups, throttling
+from core.wire import JSON_SUBPROTOCOL
+from users.models import User
+from . import scheduler as scheduler_module, state
+from .consumers import AuctionConsumer
+from .models import Auction, Bid, parse_bid_amount
+from .scheduler import AuctionScheduler
+from .sequencer import AuctionSequencer, get_sequencer
 
-# Create your tests here.
+
+def create_auction(**fields):
+    artist = User.objects.create_user(f'artist{User.objects.count()}', password='password')
+    artwork = Artwork.objects.create(
+        title='Opera', description='', image='', price=Decimal('100'), artist=artist,
+        is_for_auction=True,
+    )
+    fields.setdefault('end_time', timezone.now() + timezone.timedelta(hours=1))
+    return Auction.objects.create(
+        artwork=artwork, starting_price=Decimal('100'), current_price=Decimal('100'), **fields
+    )
+
+
+class ParseBidAmountTests(TestCase):
+    def test_amounts_are_truncated_to_cents(self):
+        self.assertEqual(parse_bid_amount('10.019'), Decimal('10.01'))
+        self.assertEqual(parse_bid_amount(12.5), Decimal('12.50'))
+
+    def test_invalid_or_out_of_range_amounts(self):
+        for value in ('abc', None, 'NaN', 'Infinity', '0', '-5', '1e20', '100000000'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_bid_amount(value))
+        self.assertEqual(parse_bid_amount('99999999.99'), Decimal('99999999.99'))
+
+
+class PlaceBidTests(TestCase):
+    def setUp(self):
+        self.auction = create_auction()
+        self.alice = User.objects.create_user('alice', password='password')
+        self.bob = User.objects.create_user('bob', password='password')
+
+    def test_accepted_bid_updates_row_and_ledger(self):
+        accepted, message = self.auction.place_bid(self.alice, '110.509')
+        self.assertTrue(accepted, message)
+        auction = Auction.objects.get(pk=self.auction.pk)
+        self.assertEqual(auction.current_price, Decimal('110.50'))
+        self.assertEqual(auction.highest_bidder, self.alice)
+        self.assertEqual((auction.version, auction.bids_count), (1, 1))
+        bid = Bid.objects.get()
+        self.assertEqual((bid.amount, bid.sequence), (Decimal('110.50'), 1))
+
+    def test_huge_amount_is_rejected_and_row_stays_readable(self):
+        accepted, _ = self.auction.place_bid(self.alice, '1e20')
+        self.assertFalse(accepted)
+        self.assertEqual(Auction.objects.get(pk=self.auction.pk).current_price, Decimal('100'))
+        self.assertFalse(Bid.objects.exists())
+
+    def test_stale_instance_cannot_overwrite_a_higher_bid(self):
+        stale = Auction.objects.get(pk=self.auction.pk)
+        self.assertTrue(self.auction.place_bid(self.alice, 150)[0])
+        accepted, message = stale.place_bid(self.bob, 120)
+        self.assertFalse(accepted)
+        self.assertEqual(message, "Offerta troppo bassa")
+        self.assertEqual(Auction.objects.get(pk=self.auction.pk).current_price, Decimal('150'))
+
+    def test_increment_is_enforced(self):
+        self.auction.min_bid_increment = Decimal('10')
+        self.auction.save()
+        accepted, _ = self.auction.place_bid(self.alice, 105)
+        self.assertFalse(accepted)
+        self.assertTrue(self.auction.place_bid(self.alice, 110)[0])
+
+    def test_ended_auction_rejects_bids(self):
+        auction = create_auction(end_time=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertEqual(auction.place_bid(self.alice, 200), (False, "Asta terminata"))
+
+    def test_unique_bidders_are_counted_once(self):
+        for bidder, amount in ((self.alice, 110), (self.bob, 120), (self.alice, 130)):
+            self.assertTrue(self.auction.place_bid(bidder, amount)[0])
+        auction = Auction.objects.get(pk=self.auction.pk)
+        self.assertEqual((auction.bids_count, auction.unique_bidders_count), (3, 2))
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    AUCTION_ANTI_SNIPING_SECONDS=0,
+)
+class SequencerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.auction = create_auction()
+        self.alice = User.objects.create_user('alice', password='password')
+        self.bob = User.objects.create_user('bob', password='password')
+
+    async def join_room(self):
+        layer = get_channel_layer()
+        room, reply = await layer.new_channel(), await layer.new_channel()
+        await groups.group_add(layer, f'auction_{self.auction.pk}', room)
+        return layer, room, reply
+
+    async def test_accepted_bid_is_acknowledged_then_persisted(self):
+        sequencer = AuctionSequencer(self.auction.pk)
+        success, message, snapshot = await sequencer.submit(self.alice.pk, '150')
+        self.assertTrue(success, message)
+        self.assertEqual((snapshot['seq'], snapshot['current_price']), (1, '150.00'))
+        await sequencer.stop()
+        auction = await Auction.objects.aget(pk=self.auction.pk)
+        self.assertEqual((auction.current_price, auction.version), (Decimal('150'), 1))
+        self.assertEqual(await Bid.objects.filter(auction=auction, sequence=1).acount(), 1)
+
+    async def test_rejected_write_rolls_back_and_notifies(self):
+        layer, room, reply = await self.join_room()
+        sequencer = AuctionSequencer(self.auction.pk)
+        await sequencer.flush()
+        # Un altro scrittore modifica l'asta dopo che il sequencer l'ha letta
+        writer = await Auction.objects.aget(pk=self.auction.pk)
+        await database_sync_to_async(writer.place_bid)(self.bob.pk, 500)
+        await database_sync_to_async(state.record_bid)(await database_sync_to_async(state.build_snapshot)(writer))
+
+        success, _, snapshot = await sequencer.submit(self.alice.pk, 150, reply_to=reply)
+        self.assertTrue(success)
+        issued = snapshot['seq']
+        await sequencer.flush()
+
+        rejected = await layer.receive(reply)
+        self.assertEqual((rejected['type'], rejected['seq']), ('bid_rejected', issued))
+        correction = await layer.receive(room)
+        self.assertEqual(correction['type'], 'auction_correction')
+        corrected = json.loads(correction['frames'][JSON_SUBPROTOCOL])
+        self.assertEqual((corrected['type'], corrected['current_price']), ('auction_snapshot', '500.00'))
+        self.assertGreater(corrected['seq'], issued)
+
+        # Cache e memoria tornano allo stato del database, con la sequenza più alta
+        cached = await database_sync_to_async(state.get_snapshot)(self.auction.pk)
+        self.assertEqual(cached['seq'], corrected['seq'])
+        self.assertEqual(cached['current_price'], '500.00')
+        events = await database_sync_to_async(state.event_log(self.auction.pk).items)()
+        self.assertEqual([event['amount'] for event in events], ['500.00'])
+        self.assertEqual(sequencer.auction.current_price, Decimal('500'))
+        await sequencer.stop()
+
+    async def test_bids_queued_behind_a_rejected_one_are_rejected_too(self):
+        layer, room, reply = await self.join_room()
+        sequencer = AuctionSequencer(self.auction.pk)
+        await sequencer.flush()
+        with mock.patch.object(Auction, 'place_bid', return_value=(False, "Offerta troppo bassa")):
+            first = await sequencer.submit(self.alice.pk, 150, reply_to=reply)
+            second = await sequencer.submit(self.bob.pk, 160, reply_to=reply)
+            self.assertTrue(first[0] and second[0])
+            await sequencer.flush()
+        seqs = {(await layer.receive(reply))['seq'] for _ in range(2)}
+        self.assertEqual(seqs, {first[2]['seq'], second[2]['seq']})
+        # Dopo il rollback il sequencer accetta offerte contro lo stato corretto
+        success, _, snapshot = await sequencer.submit(self.alice.pk, 120)
+        self.assertTrue(success)
+        self.assertGreater(snapshot['seq'], second[2]['seq'])
+        await sequencer.stop()
+        self.assertEqual((await Auction.objects.aget(pk=self.auction.pk)).current_price, Decimal('120'))
+
+    async def test_sequencer_stops_when_the_auction_ends(self):
+        await Auction.objects.filter(pk=self.auction.pk).aupdate(
+            end_time=timezone.now() + timezone.timedelta(milliseconds=300)
+        )
+        sequencer = get_sequencer(self.auction.pk)
+        await asyncio.wait_for(asyncio.gather(*sequencer._tasks, return_exceptions=True), 5)
+        self.assertTrue(sequencer.stopped)
+        self.assertIsNot(get_sequencer(self.auction.pk), sequencer)
+        self.assertEqual(await sequencer.submit(self.alice.pk, 150), (False, "Asta terminata", None))
+        await get_sequencer(self.auction.pk).stop()
+
+    async def test_user_id_as_string_counts_as_the_same_bidder(self):
+        sequencer = AuctionSequencer(self.auction.pk)
+        self.assertTrue((await sequencer.submit(self.alice.pk, 150))[0])
+        _, _, snapshot = await sequencer.submit(str(self.alice.pk), 160)
+        self.assertEqual((snapshot['total_bids'], snapshot['unique_bidders']), (2, 1))
+        self.assertEqual(await sequencer.submit('alice', 170), (False, "Utente non valido", None))
+        await sequencer.stop()
+
+    @mock.patch('auctions.sequencer.RESYNC_RETRY_DELAY', 0.01)
+    async def test_unreachable_database_fails_pending_bids(self):
+        with mock.patch.object(AuctionSequencer, 'load_state', side_effect=OperationalError('database giù')) as load:
+            sequencer = get_sequencer(self.auction.pk)
+            result = await asyncio.wait_for(sequencer.submit(self.alice.pk, 150), 5)
+        self.assertEqual(result, (False, "Asta non disponibile, riprova", None))
+        self.assertGreater(load.call_count, 1)
+        self.assertTrue(sequencer.stopped)
+        # Il sequencer è uscito dal registro: il prossimo riparte dal database
+        retried = get_sequencer(self.auction.pk)
+        self.assertIsNot(retried, sequencer)
+        self.assertTrue((await retried.submit(self.alice.pk, 150))[0])
+        await retried.stop()
+
+    @mock.patch('auctions.sequencer.RESYNC_RETRY_DELAY', 0.01)
+    async def test_failed_read_is_retried(self):
+        real = AuctionSequencer.__dict__['load_state']
+        calls = []
+
+        def flaky(sequencer):
+            calls.append(sequencer)
+            if len(calls) == 1:
+                raise OperationalError('database giù')
+            return real(sequencer)
+
+        with mock.patch.object(AuctionSequencer, 'load_state', flaky):
+            sequencer = AuctionSequencer(self.auction.pk)
+            success, message, _ = await asyncio.wait_for(sequencer.submit(self.alice.pk, 150), 5)
+        self.assertTrue(success, message)
+        await sequencer.stop()
+
+
+@override_settings(WEBSOCKET_RATE_LIMITS={}, WEBSOCKET_USER_RATE_LIMITS={'place_bid': (0.001, 2)})
+class BidThrottleTests(TestCase):
+    def setUp(self):
+        throttling._user_buckets.clear()
+        self.alice = User.objects.create_user('alice', password='password')
+
+    def consumer(self, user, channel_name):
+        consumer = AuctionConsumer()
+        consumer.scope = {'user': user}
+        consumer.channel_name = channel_name
+        return consumer
+
+    def bids_allowed(self, consumer, user_ids):
+        return [consumer.allow_message('place_bid', {'type': 'place_bid', 'user_id': user_id}) for user_id in user_ids]
+
+    def test_anonymous_limit_is_per_connection_whatever_the_user_id(self):
+        first = self.consumer(AnonymousUser(), 'connection-1')
+        self.assertEqual(self.bids_allowed(first, [1, 2, 3]), [True, True, False])
+        # Un'altra connessione anonima ha il suo bucket, anche dichiarando gli stessi id
+        second = self.consumer(AnonymousUser(), 'connection-2')
+        self.assertEqual(self.bids_allowed(second, [1, 1]), [True, True])
+
+    def test_authenticated_limit_is_shared_across_connections(self):
+        self.assertEqual(self.bids_allowed(self.consumer(self.alice, 'connection-1'), [None, 99]), [True, True])
+        self.assertEqual(self.bids_allowed(self.consumer(self.alice, 'connection-2'), [None]), [False])
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.auction = create_auction()
+
+    def test_cached_snapshot_is_served_without_queries(self):
+        state.get_snapshot(self.auction.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(state.get_snapshot(self.auction.pk)['is_active'])
+
+    def test_close_in_another_process_is_seen_after_end_time(self):
+        state.get_snapshot(self.auction.pk)
+        # Lo scheduler chiude l'asta senza toccare la cache di questo processo
+        past = timezone.now() - timezone.timedelta(seconds=1)
+        Auction.objects.filter(pk=self.auction.pk).update(end_time=past, is_active=False, version=1)
+        cached = cache.get(state.snapshot_key(self.auction.pk))
+        cache.set(state.snapshot_key(self.auction.pk), {**cached, 'end_time': state.to_millis(past)})
+        snapshot = state.get_snapshot(self.auction.pk)
+        self.assertFalse(snapshot['is_active'])
+        self.assertEqual(snapshot['seq'], 1)
+
+    def test_extension_keeps_the_auction_open(self):
+        state.get_snapshot(self.auction.pk)
+        cached = cache.get(state.snapshot_key(self.auction.pk))
+        cache.set(state.snapshot_key(self.auction.pk), {**cached, 'end_time': state.server_time() - 1000})
+        snapshot = state.get_snapshot(self.auction.pk)
+        self.assertTrue(snapshot['is_active'])
+        self.assertEqual(snapshot['end_time'], state.to_millis(self.auction.end_time))
+
+
+@override_settings(AUCTION_EVENT_LOG_SIZE=3)
+class ReplayTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.auction = create_auction()
+        self.bidder = User.objects.create_user('alice', password='password')
+
+    def bid(self, amount):
+        self.assertTrue(self.auction.place_bid(self.bidder, amount)[0])
+        return state.record_bid(state.build_snapshot(self.auction))
+
+    def test_contiguous_log_is_replayed_from_the_cache(self):
+        for amount in (110, 120, 130):
+            self.bid(amount)
+        snapshot = state.get_snapshot(self.auction.pk)
+        with self.assertNumQueries(0):
+            missed = state.replay(snapshot, 1)
+        self.assertEqual([event['amount'] for event in missed['events']], ['120.00', '130.00'])
+        self.assertEqual((missed['seq'], missed['current_price']), (3, '130.00'))
+
+    def test_gap_in_the_log_falls_back_to_the_ledger(self):
+        self.bid(110)
+        # Offerta scritta nel registro ma mai arrivata nel log di questa cache
+        self.assertTrue(self.auction.place_bid(self.bidder, 120)[0])
+        self.bid(130)
+        snapshot = state.get_snapshot(self.auction.pk)
+        with self.assertNumQueries(1):
+            missed = state.replay(snapshot, 1)
+        self.assertEqual([event['seq'] for event in missed['events']], [2, 3])
+
+    def test_client_too_far_behind_gets_the_full_snapshot(self):
+        for amount in (110, 120, 130, 140, 150):
+            self.bid(amount)
+        snapshot = state.get_snapshot(self.auction.pk)
+        self.assertIsNone(state.replay(snapshot, 0))
+
+    def test_change_after_the_last_bid_needs_the_full_snapshot(self):
+        self.bid(110)
+        self.auction.extend_time(5)
+        self.assertIsNone(state.replay(state.get_snapshot(self.auction.pk), 0))
+
+
+class AuctionListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for hours in range(1, 4):
+            create_auction(end_time=timezone.now() + timezone.timedelta(hours=hours))
+
+    def cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def test_cursor_walks_the_list(self):
+        response = self.client.get('/api/auctions/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_tampered_cursor_is_not_found(self):
+        end_time = timezone.now().isoformat()
+        for cursor in (self.cursor(['x', 'y']), self.cursor([end_time, 'y']), self.cursor([end_time, None]),
+                       self.cursor([[1], {}]), self.cursor([end_time]), 'not-base64!'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/auctions/', {'cursor': cursor}).status_code, 404)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+@mock.patch.object(scheduler_module, 'RETRY_DELAY', 0.1)
+class SchedulerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.auction = create_auction(end_time=timezone.now() + timezone.timedelta(milliseconds=200))
+
+    async def wait_until_closed(self, task):
+        for _ in range(100):
+            if not (await Auction.objects.aget(pk=self.auction.pk)).is_active:
+                return
+            self.assertFalse(task.done(), "Lo scheduler si è fermato")
+            await asyncio.sleep(0.05)
+        self.fail("Asta non chiusa")
+
+    async def run_scheduler(self, scheduler):
+        task = asyncio.ensure_future(scheduler.run())
+        try:
+            await self.wait_until_closed(task)
+        finally:
+            task.cancel()
+
+    def fail_once(self, scheduler, name):
+        """Il primo richiamo di `name` fallisce come un database non raggiungibile."""
+        method, calls = getattr(scheduler, name), []
+
+        async def flaky(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise Exception('database non disponibile')
+            return await method(*args)
+
+        setattr(scheduler, name, flaky)
+        return calls
+
+    async def test_failed_closure_is_retried(self):
+        scheduler = AuctionScheduler(rescan_interval=60)
+        calls = self.fail_once(scheduler, 'close_due')
+        await self.run_scheduler(scheduler)
+        self.assertEqual(len(calls), 2)
+
+    async def test_failed_scan_is_retried(self):
+        scheduler = AuctionScheduler(rescan_interval=60)
+        calls = self.fail_once(scheduler, 'load')
+        await self.run_scheduler(scheduler)
+        self.assertEqual(calls[:2], [(None,), (None,)])
@@ -1,3 +1,10 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from . import views
 
-urlpatterns = []  # Aggiungeremo le URL più tardi 
\ No newline at end of file
+router = DefaultRouter()
+router.register(r'', views.AuctionViewSet, basename='auction')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
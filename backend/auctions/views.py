@@ -1,3 +1,56 @@
-from django.shortcuts import render
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from core.pagination import KeysetPagination
+from live_streams.models import LiveStream
+from .models import Auction
+from .serializers import AuctionSerializer
 
-# Create your views here.
+
+class AuctionViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Aste attive, in scadenza e collegate a una diretta. Artwork, artista e
+    miglior offerente arrivano nella stessa query; numero di offerte e di
+    offerenti sono contatori aggiornati a ogni offerta, senza COUNT.
+    """
+    serializer_class = AuctionSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('end_time', 'id')
+
+    def get_queryset(self):
+        queryset = Auction.objects.select_related('artwork__artist', 'highest_bidder')
+        if self.action == 'retrieve':
+            return queryset
+        return queryset.filter(is_active=True, end_time__gt=timezone.now())
+
+    @action(detail=False, url_path='ending-soon')
+    def ending_soon(self, request):
+        minutes = getattr(settings, 'AUCTION_ENDING_SOON_MINUTES', 60)
+        queryset = self.get_queryset().filter(end_time__lte=timezone.now() + timedelta(minutes=minutes))
+
+        # La prima pagina è la più richiesta: la teniamo in cache per pochi secondi
+        cache_seconds = getattr(settings, 'AUCTION_LIST_CACHE_SECONDS', 5)
+        if cache_seconds and not request.query_params.get(self.paginator.cursor_query_param):
+            cache_key = f'auctions_ending_soon_{request.build_absolute_uri()}'
+            data = cache.get(cache_key)
+            if data is None:
+                data = self.paginated_list(queryset).data
+                cache.set(cache_key, data, cache_seconds)
+            return Response(data)
+        return self.paginated_list(queryset)
+
+    @action(detail=False)
+    def live(self, request):
+        queryset = self.get_queryset().filter(Q(is_live=True) | Q(live_stream__status=LiveStream.Status.LIVE))
+        return self.paginated_list(queryset)
+
+    def paginated_list(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -23,6 +23,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 # Inizializza l'applicazione ASGI di Django
 django_asgi_app = get_asgi_application()
 
+# Classifiche di tendenza pronte prima delle richieste (store nella memoria del processo)
+from trending.engine import warm_up  # noqa: E402
+
+warm_up()
+
 # Definisci i pattern di routing WebSocket
 websocket_urlpatterns = [
     re_path(r'ws/live/(?P<stream_id>[^/]+)/$', LiveStreamConsumer.as_asgi()),
@@ -0,0 +1,145 @@
+import asyncio
+import functools
+import logging
+from collections import deque
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TransportPressure:
+    """
+    Producer registrato sul trasporto Twisted del socket (daphne): il trasporto
+    chiama pauseProducing quando il suo buffer di scrittura supera la soglia e
+    resumeProducing quando si svuota. Il `send` ASGI di daphne ritorna subito
+    e accumula i dati nel trasporto: solo così si vede che il client non legge.
+    Il trasporto accetta un solo producer (daphne vi registra il canale HTTP
+    da cui è nato il WebSocket): quello esistente riceve gli stessi segnali.
+    """
+
+    def __init__(self, transport, forward=None):
+        self.transport = transport
+        self.forward = forward
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    @classmethod
+    def attach(cls, send):
+        """Producer sul trasporto del protocollo daphne dietro a `send`; None con altri server o nei test."""
+        protocol = send.args[0] if isinstance(send, functools.partial) and send.args else None
+        transport = getattr(protocol, 'transport', None)
+        if transport is None or not hasattr(transport, 'registerProducer'):
+            return None
+        forward = getattr(transport, 'producer', None)
+        pressure = cls(transport, forward)
+        try:
+            if forward is not None:
+                transport.unregisterProducer()
+            transport.registerProducer(pressure, True)
+        except RuntimeError:
+            return None
+        return pressure
+
+    def pauseProducing(self):
+        self.writable.clear()
+        metrics.incr('ws.outbound.paused')
+        if self.forward is not None:
+            self.forward.pauseProducing()
+
+    def resumeProducing(self):
+        self.writable.set()
+        if self.forward is not None:
+            self.forward.resumeProducing()
+
+    def stopProducing(self):
+        self.writable.set()
+        if self.forward is not None:
+            self.forward.stopProducing()
+
+    def detach(self):
+        self.writable.set()
+        try:
+            if getattr(self.transport, 'producer', None) is self:
+                self.transport.unregisterProducer()
+                if self.forward is not None:
+                    self.transport.registerProducer(self.forward, True)
+        except Exception:
+            logger.debug("Producer del trasporto non ripristinato", exc_info=True)
+
+
+class OutboundQueue:
+    """
+    Coda limitata dei frame in uscita di un socket, svuotata da un task.
+    Un frame con chiave `coalesce` sostituisce quello in coda con la stessa
+    chiave (es. lo stato della live); a coda piena si scarta il frame più
+    vecchio tra quelli della stanza: i frame `private` (risposte a questo
+    client, chiusure, correzioni) non vengono mai scartati. Se i frame
+    scartati da quando la coda era vuota superano `max_dropped` il client è
+    considerato lento e viene chiamato `on_slow`.
+    Con `pressure` (TransportPressure) il task non scrive finché il trasporto
+    è in pausa: i frame restano qui e la coda si riempie davvero.
+    """
+
+    def __init__(self, send, size, max_dropped, on_slow, pressure=None):
+        self.send = send
+        self.size = size
+        self.max_dropped = max_dropped
+        self.on_slow = on_slow
+        self.pressure = pressure
+        self.items = deque()
+        self.dropped = 0
+        self.closed = False
+        self._task = None
+
+    def put(self, frame, coalesce=None, private=False):
+        if self.closed:
+            return
+        if coalesce is not None:
+            for i, (key, _, queued_private) in enumerate(self.items):
+                if key == coalesce:
+                    self.items[i] = (coalesce, frame, queued_private or private)
+                    metrics.incr('ws.outbound.coalesced')
+                    return
+        if len(self.items) >= self.size and self.drop_oldest():
+            self.dropped += 1
+            metrics.incr('ws.outbound.dropped')
+            if self.dropped > self.max_dropped:
+                metrics.incr('ws.outbound.slow_disconnects')
+                self.close()
+                self.on_slow()
+                return
+        self.items.append((coalesce, frame, private))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    def drop_oldest(self):
+        """Scarta il frame della stanza più vecchio; False se in coda ci sono solo frame privati."""
+        for i, (_, _, private) in enumerate(self.items):
+            if not private:
+                del self.items[i]
+                return True
+        return False
+
+    async def _drain(self):
+        while self.items:
+            if self.pressure is not None and not self.pressure.writable.is_set():
+                await self.pressure.writable.wait()
+                if not self.items:
+                    break
+            _, frame, _ = self.items.popleft()
+            try:
+                await self.send(frame)
+            except Exception:
+                logger.exception("Invio frame fallito")
+                self.close()
+                return
+            if not self.items:
+                self.dropped = 0
+
+    def close(self):
+        self.closed = True
+        self.items.clear()
+        if self.pressure is not None:
+            self.pressure.detach()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from django.db import close_old_connections
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BulkWriter:
+    """
+    Scrittura differita di righe in blocco. `put` non blocca mai: accoda in un
+    buffer limitato (`max_pending`) e, se il buffer è pieno, scarta la riga e
+    incrementa `<name>.dropped`. Un thread svuota la coda con `bulk_create`
+    ogni `batch_size` righe o ogni `interval` secondi; all'uscita del processo
+    le righe ancora in coda vengono scritte. `bulk_options` viene passato a
+    bulk_create (es. ignore_conflicts=True); le sottoclassi possono ridefinire
+    `insert` per scritture diverse da bulk_create.
+    """
+
+    def __init__(self, name, model, batch_size=500, interval=1.0, max_pending=10000, **bulk_options):
+        self.name = name
+        self.model = model
+        self.bulk_options = bulk_options
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        atexit.register(self.stop)
+
+    def put(self, obj):
+        try:
+            self.queue.put_nowait(obj)
+        except queue.Full:
+            metrics.incr(f'{self.name}.dropped')
+            return False
+        metrics.incr(f'{self.name}.queued')
+        self.start()
+        return True
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.run, name=f'{self.name}-writer', daemon=True)
+                self.thread.start()
+
+    def next_batch(self):
+        """Attende la prima riga, poi raccoglie fino a batch_size righe o fino allo scadere di interval."""
+        try:
+            batch = [self.queue.get(timeout=self.interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Scaduto l'intervallo si prende solo ciò che è già in coda
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def insert(self, batch):
+        self.model.objects.bulk_create(batch, batch_size=self.batch_size, **self.bulk_options)
+
+    def write(self, batch):
+        """Scrive un blocco; restituisce False se la scrittura è fallita."""
+        try:
+            close_old_connections()
+            self.insert(batch)
+            metrics.incr(f'{self.name}.written', len(batch))
+            metrics.incr(f'{self.name}.batches')
+            return True
+        except Exception:
+            metrics.incr(f'{self.name}.failed', len(batch))
+            logger.exception("Scrittura in blocco fallita (%s, %d righe)", self.name, len(batch))
+            return False
+
+    def run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = self.next_batch()
+            if batch:
+                self.write(batch)
+        close_old_connections()
+
+    def stop(self, timeout=10):
+        """Scrive le righe in coda e ferma il thread."""
+        self.stopping.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout)
@@ -0,0 +1,86 @@
+import asyncio
+import inspect
+import logging
+from . import groups
+
+logger = logging.getLogger(__name__)
+
+# Un broadcaster per channel layer e tick, per processo
+_broadcasters = {}
+
+
+def merge_latest(pending, message):
+    """Merge predefinito: l'ultimo messaggio sostituisce quelli precedenti."""
+    return message
+
+
+class TickBroadcaster:
+    """
+    Raggruppa i messaggi destinati allo stesso gruppo entro una finestra di
+    `tick` secondi e li invia con un unico group_send per gruppo e tipo.
+    La finestra parte dal primo messaggio, quindi senza traffico non gira
+    nessun timer. `prepare` viene applicato una sola volta al messaggio
+    accorpato, subito prima dell'invio (es. per codificare i frame), e può
+    essere una coroutine.
+    """
+
+    def __init__(self, channel_layer, tick):
+        self.channel_layer = channel_layer
+        self.tick = tick
+        self.loop = asyncio.get_running_loop()
+        self.pending = {}
+        self.prepare = {}
+        self._task = None
+
+    async def publish(self, group, message, merge=merge_latest, prepare=None):
+        if not self.tick:
+            if prepare:
+                message = prepare(message)
+                message = await message if inspect.isawaitable(message) else message
+            await groups.group_send(self.channel_layer, group, message)
+            return
+
+        key = (group, message['type'])
+        if key in self.pending:
+            self.pending[key] = merge(self.pending[key], message)
+        else:
+            self.pending[key] = message
+        if prepare:
+            self.prepare[key] = prepare
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.tick)
+        # I messaggi pubblicati durante l'invio aprono una nuova finestra
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        prepare, self.prepare = self.prepare, {}
+        await asyncio.gather(*(self._send(key, message, prepare.get(key)) for key, message in pending.items()))
+
+    async def _send(self, key, message, prepare=None):
+        # Un errore (prepare o invio) perde solo il messaggio del suo gruppo
+        group, message_type = key
+        try:
+            if prepare:
+                message = prepare(message)
+                message = await message if inspect.isawaitable(message) else message
+            await groups.group_send(self.channel_layer, group, message)
+        except Exception:
+            logger.exception("Broadcast %s al gruppo %s fallito", message_type, group)
+
+
+def get_broadcaster(channel_layer, tick):
+    """Restituisce il broadcaster del channel layer e del tick per il loop corrente."""
+    key = (id(channel_layer), tick)
+    broadcaster = _broadcasters.get(key)
+    if (
+        broadcaster is None
+        or broadcaster.channel_layer is not channel_layer
+        or broadcaster.loop is not asyncio.get_running_loop()
+    ):
+        broadcaster = _broadcasters[key] = TickBroadcaster(channel_layer, tick)
+    return broadcaster
@@ -0,0 +1,124 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# pk per ogni UPDATE: limita la dimensione di IN (...) e del CASE
+FLUSH_CHUNK_SIZE = 500
+
+
+class CounterBuffer:
+    """
+    Contatori a scrittura differita (visualizzazioni, mi piace): gli incrementi
+    si sommano in memoria e ogni COUNTERS_FLUSH_INTERVAL secondi diventano un
+    UPDATE per modello e campo del tipo
+        SET views_count = views_count + CASE WHEN id IN (...) THEN 3 ... END
+    che tocca solo la colonna del contatore. Ogni worker scrive i propri
+    incrementi, quindi nessun conteggio si perde tra processi; all'uscita
+    del processo il buffer viene svuotato. Con intervallo 0 l'UPDATE è
+    immediato. Se la scrittura fallisce (database irraggiungibile, lock) gli
+    incrementi tornano nel buffer e si sommano ai nuovi, fino a
+    COUNTERS_MAX_RETRIES scritture fallite di fila.
+    """
+
+    def __init__(self):
+        self.pending = defaultdict(lambda: defaultdict(int))
+        self.failures = defaultdict(int)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        atexit.register(self.stop)
+
+    def interval(self):
+        return getattr(settings, 'COUNTERS_FLUSH_INTERVAL', 5)
+
+    def increment(self, model, pk, field, amount=1):
+        if not self.interval():
+            model.objects.filter(pk=pk).update(**{field: F(field) + amount})
+            return
+        with self.lock:
+            self.pending[(model, field)][pk] += amount
+        self.start()
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='counters-flusher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while not self.wake.wait(self.interval()):
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+        for key, increments in pending.items():
+            model, field = key
+            try:
+                self.write(model, field, increments)
+            except Exception:
+                metrics.incr('counters.failed', sum(increments.values()))
+                logger.exception("Aggiornamento contatori fallito (%s.%s)", model.__name__, field)
+                self.retry(key, increments)
+            else:
+                self.failures.pop(key, None)
+
+    def retry(self, key, increments):
+        """Rimette gli incrementi non scritti nel buffer, finché i tentativi lo consentono."""
+        with self.lock:
+            self.failures[key] += 1
+            attempts = self.failures[key]
+            if attempts > getattr(settings, 'COUNTERS_MAX_RETRIES', 5):
+                del self.failures[key]
+                metrics.incr('counters.dropped', sum(increments.values()))
+                logger.error("Incrementi di %s.%s scartati dopo %s scritture fallite", key[0].__name__, key[1], attempts)
+                return
+            for pk, amount in increments.items():
+                self.pending[key][pk] += amount
+
+    def write(self, model, field, increments):
+        # Gli oggetti con lo stesso incremento condividono un solo WHEN
+        by_amount = defaultdict(list)
+        for pk, amount in increments.items():
+            by_amount[amount].append(pk)
+        pks = list(increments)
+        with transaction.atomic():
+            for start in range(0, len(pks), FLUSH_CHUNK_SIZE):
+                chunk = set(pks[start:start + FLUSH_CHUNK_SIZE])
+                whens = [
+                    When(pk__in=[pk for pk in group if pk in chunk], then=Value(amount))
+                    for amount, group in by_amount.items()
+                    if not chunk.isdisjoint(group)
+                ]
+                model.objects.filter(pk__in=chunk).update(**{
+                    field: F(field) + Case(*whens, default=Value(0), output_field=IntegerField())
+                })
+        metrics.incr('counters.flushed', sum(increments.values()))
+        metrics.incr('counters.updates')
+
+    def stop(self):
+        """Ferma il thread e scrive gli incrementi ancora in memoria."""
+        self.wake.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(10)
+        self.flush()
+        self.wake.clear()
+
+
+buffer = CounterBuffer()
+
+
+def increment(instance, field, amount=1):
+    """Incrementa `field` di `instance` in modo differito e aggiorna l'istanza in memoria."""
+    setattr(instance, field, getattr(instance, field) + amount)
+    buffer.increment(type(instance), instance.pk, field, amount)
@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import zlib
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Dataset esportabili: modello, colonne (anche attraverso FK) e campo data per since/until.
+# Niente segreti: il qr_code delle registrazioni vale come biglietto e resta fuori.
+DATASETS = {
+    'interactions': {
+        'model': 'users.UserInteraction',
+        'fields': ('id', 'user_id', 'content_type', 'content_id', 'action', 'timestamp', 'ip_address', 'agent__value', 'metadata'),
+        'date_field': 'timestamp',
+    },
+    'artworks': {
+        'model': 'artworks.Artwork',
+        'fields': (
+            'id', 'title', 'artist_id', 'artist__username', 'category', 'price', 'is_digital',
+            'is_for_auction', 'is_sold', 'views_count', 'likes_count', 'created_at',
+        ),
+        'date_field': 'created_at',
+    },
+    'registrations': {
+        'model': 'qr_system.EventRegistration',
+        'fields': ('id', 'event_id', 'event__name', 'user_id', 'checked_in', 'checked_in_at', 'created_at'),
+        'date_field': 'created_at',
+    },
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+# Righe per query: ogni blocco è una SELECT ... WHERE id > ultimo ORDER BY id LIMIT n
+CHUNK_SIZE = 5000
+# Byte accumulati prima di passarli al compressore / alla risposta
+BUFFER_SIZE = 256 * 1024
+
+
+def dataset_queryset(name, since=None, until=None):
+    dataset = DATASETS[name]
+    queryset = apps.get_model(dataset['model']).objects.all()
+    if since is not None:
+        queryset = queryset.filter(**{f"{dataset['date_field']}__gte": since})
+    if until is not None:
+        queryset = queryset.filter(**{f"{dataset['date_field']}__lt": until})
+    return queryset
+
+
+def keyset_rows(queryset, fields, chunk_size=CHUNK_SIZE, after=0):
+    """
+    Righe come tuple, a blocchi sulla chiave primaria: ogni blocco è una query
+    breve sull'indice e la memoria non dipende dalla dimensione della tabella
+    (nessun cursore lasciato aperto sul database tra un blocco e l'altro).
+    """
+    queryset = queryset.order_by('pk')
+    last = after
+    while True:
+        rows = list(queryset.filter(pk__gt=last).values_list(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][0]
+
+
+def ndjson_lines(rows, fields):
+    encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def csv_lines(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(json.dumps(value, cls=DjangoJSONEncoder) if isinstance(value, (dict, list)) else value for value in row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode(lines, compress=True):
+    """
+    Testo -> blocchi di byte di circa BUFFER_SIZE, compressi in gzip in streaming
+    se `compress`: in memoria resta solo il blocco corrente.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            data = ''.join(pending).encode()
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode()
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export(name, fmt='ndjson', compress=True, since=None, until=None, after=0, chunk_size=CHUNK_SIZE):
+    """Esportazione di un dataset come generatore di byte (NDJSON o CSV, gzip opzionale)."""
+    fields = DATASETS[name]['fields']
+    rows = keyset_rows(dataset_queryset(name, since, until), fields, chunk_size, after)
+    lines = ndjson_lines(rows, fields) if fmt == 'ndjson' else csv_lines(rows, fields)
+    return encode(lines, compress)
+
+
+async def aiterate(iterator):
+    """
+    Generatore sincrono -> iteratore asincrono, un blocco alla volta. Sotto ASGI
+    Django consuma un iteratore sincrono con sync_to_async(list), cioè tutto in
+    memoria prima di inviare il primo byte: così ogni blocco (e le sue query)
+    passa nel thread del database e viene inviato subito.
+    """
+    try:
+        while True:
+            chunk = await sync_to_async(next)(iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close)()
+
+
+def export_response(name, fmt='ndjson', compress=True, asynchronous=False, **options):
+    """
+    StreamingHttpResponse scaricabile come file: la risposta parte prima della
+    fine della lettura. Con `asynchronous` (richieste servite via ASGI) il
+    contenuto è un iteratore asincrono.
+    """
+    filename = f'{name}.{fmt}' + ('.gz' if compress else '')
+    content = export(name, fmt, compress, **options)
+    response = StreamingHttpResponse(
+        aiterate(content) if asynchronous else content,
+        content_type='application/gzip' if compress else FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Nessun buffering nei proxy davanti all'applicazione
+    response['X-Accel-Buffering'] = 'no'
+    return response
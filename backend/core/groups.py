@@ -0,0 +1,44 @@
+import asyncio
+import zlib
+from django.conf import settings
+
+
+def shard_count():
+    return max(1, getattr(settings, 'CHANNEL_GROUP_SHARDS', 1))
+
+
+def shard_groups(group):
+    """Sottogruppi di una stanza logica (la stanza stessa senza sharding)."""
+    shards = shard_count()
+    if shards == 1:
+        return [group]
+    return [f'{group}.{shard}' for shard in range(shards)]
+
+
+def shard_for(group, channel_name):
+    """Sottogruppo di un canale: hash stabile tra i processi, a differenza di hash()."""
+    shards = shard_count()
+    if shards == 1:
+        return group
+    return f'{group}.{zlib.crc32(channel_name.encode()) % shards}'
+
+
+async def group_add(channel_layer, group, channel_name):
+    await channel_layer.group_add(shard_for(group, channel_name), channel_name)
+
+
+async def group_discard(channel_layer, group, channel_name):
+    await channel_layer.group_discard(shard_for(group, channel_name), channel_name)
+
+
+async def group_send(channel_layer, group, message):
+    """
+    Invia il messaggio a tutta la stanza: con CHANNEL_GROUP_SHARDS > 1 ogni
+    sottogruppo riceve un group_send in parallelo, così nessun invio deve
+    raggiungere da solo decine di migliaia di canali.
+    """
+    groups = shard_groups(group)
+    if len(groups) == 1:
+        await channel_layer.group_send(group, message)
+        return
+    await asyncio.gather(*(channel_layer.group_send(shard, message) for shard in groups))
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import uuid
+from django.core.cache import cache
+from . import groups
+from .sharedcache import require_shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Un heartbeat per nome e channel layer, per processo
+_heartbeats = {}
+
+
+class CacheLease:
+    """
+    Lease nella cache condivisa: chi la ottiene resta proprietario finché la
+    rinnova entro `timeout` secondi; se smette di rinnovarla un altro
+    processo la prende alla scadenza. Con una cache privata del processo
+    ogni worker sarebbe leader: è ammessa solo con LOCAL_CACHE (un worker).
+    """
+
+    def __init__(self, key, timeout):
+        require_shared_cache("La lease degli heartbeat")
+        self.key = key
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self):
+        if await cache.aadd(self.key, self.token, timeout=self.timeout):
+            return True
+        if await cache.aget(self.key) == self.token:
+            await cache.atouch(self.key, self.timeout)
+            return True
+        return False
+
+    async def release(self):
+        if await cache.aget(self.key) == self.token:
+            await cache.adelete(self.key)
+
+
+class RoomHeartbeat:
+    """
+    Invia periodicamente lo stato di ogni stanza con almeno un socket nel
+    processo. Per ogni stanza un solo processo (il leader della lease) fa il
+    group_send, quindi il costo è un frame per socket ogni `interval` secondi,
+    indipendente da quanti client si collegano nel frattempo.
+    `build(room_id)` restituisce il messaggio per il gruppo, o None.
+    """
+
+    def __init__(self, name, channel_layer, interval, build):
+        self.name = name
+        self.channel_layer = channel_layer
+        self.interval = interval
+        self.build = build
+        self.loop = asyncio.get_running_loop()
+        self.rooms = {}
+        self.leases = {}
+        self._task = None
+
+    def join(self, group, room_id):
+        count, _ = self.rooms.get(group, (0, room_id))
+        self.rooms[group] = (count + 1, room_id)
+        if group not in self.leases:
+            self.leases[group] = CacheLease(f'heartbeat_{self.name}_{group}', self.interval * 3)
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self.run())
+
+    async def leave(self, group):
+        count, room_id = self.rooms.get(group, (1, None))
+        if count > 1:
+            self.rooms[group] = (count - 1, room_id)
+            return
+        self.rooms.pop(group, None)
+        lease = self.leases.pop(group, None)
+        if lease is not None:
+            # Lascia subito la stanza a un altro processo
+            await lease.release()
+
+    async def beat(self, group, room_id):
+        lease = self.leases.get(group)
+        if lease is None or not await lease.acquire():
+            return
+        message = await self.build(room_id)
+        if message is not None:
+            await groups.group_send(self.channel_layer, group, message)
+
+    async def run(self):
+        while self.rooms:
+            await asyncio.sleep(self.interval)
+            results = await asyncio.gather(
+                *(self.beat(group, room_id) for group, (_, room_id) in list(self.rooms.items())),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Heartbeat %s fallito: %r", self.name, result)
+
+
+def get_heartbeat(name, channel_layer, interval, build):
+    """Restituisce l'heartbeat `name` del channel layer per il loop corrente."""
+    key = (name, id(channel_layer))
+    heartbeat = _heartbeats.get(key)
+    if (
+        heartbeat is None
+        or heartbeat.channel_layer is not channel_layer
+        or heartbeat.loop is not asyncio.get_running_loop()
+    ):
+        heartbeat = _heartbeats[key] = RoomHeartbeat(name, channel_layer, interval, build)
+    return heartbeat
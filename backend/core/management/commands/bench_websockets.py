@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+HEADERS = [(b'origin', b'http://localhost'), (b'host', b'localhost')]
+
+
+def percentile(values, pct):
+    """Percentile nearest-rank, in millisecondi."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return round(values[index] * 1000, 3)
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 50),
+        'p99_ms': percentile(values, 99),
+        'max_ms': round(max(values) * 1000, 3) if values else None,
+    }
+
+
+class Client:
+    """Client simulato: apre il socket e registra le metriche dei messaggi ricevuti."""
+
+    def __init__(self, application, path, stats):
+        from channels.testing import WebsocketCommunicator
+        self.communicator = WebsocketCommunicator(application, path, headers=HEADERS)
+        self.stats = stats
+        self.pending_bids = []
+        self.reader = None
+
+    async def connect(self, timeout):
+        started = time.perf_counter()
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        if not connected:
+            self.stats['connect_failed'] += 1
+            return False
+        # Il primo frame (stato iniziale) conclude la connessione
+        await self.communicator.receive_output(timeout)
+        self.stats['connect'].append(time.perf_counter() - started)
+        self.stats['received'] += 1
+        return True
+
+    def start_reading(self, timeout):
+        self.reader = asyncio.get_running_loop().create_task(self.read(timeout))
+
+    async def read(self, timeout):
+        while True:
+            message = await self.communicator.receive_output(timeout)
+            if message['type'] != 'websocket.send':
+                return
+            received = time.perf_counter()
+            self.stats['received'] += 1
+            data = json.loads(message.get('text') or '{}')
+            kind = data.get('type')
+            if kind == 'bid_response' and self.pending_bids:
+                self.stats['bid_ack'].append(received - self.pending_bids.pop(0))
+            elif kind == 'auction_update' and 'current_price' in data:
+                try:
+                    self.record_lag(('bid', Decimal(data['current_price'])), received)
+                except (InvalidOperation, TypeError):
+                    pass
+            elif kind == 'chat_batch':
+                for chat in data.get('messages', []):
+                    if isinstance(chat.get('message'), str):
+                        self.record_lag(('chat', chat['message']), received)
+
+    def record_lag(self, key, received):
+        """
+        Ritardo di un broadcast dall'invio del messaggio che lo ha generato:
+        client e server girano nello stesso processo, quindi il tempo di
+        invio comprende la coda in ingresso, l'elaborazione e il tick.
+        """
+        sent_at = self.stats['sent_at'].get(key)
+        if sent_at is not None:
+            self.stats['broadcast_lag'].append(received - sent_at)
+
+    async def send(self, payload):
+        await self.communicator.send_to(text_data=json.dumps(payload))
+        self.stats['sent'] += 1
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        try:
+            await self.communicator.disconnect()
+        except Exception:
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark di carico per AuctionConsumer e LiveStreamConsumer: avvia '
+        "l'applicazione ASGI in-process su un database di test e produce un report JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=['auction', 'live', 'both'], default='both')
+        parser.add_argument('--clients', type=int, default=500, help='Client per scenario')
+        parser.add_argument('--active', type=float, default=0.1, help='Frazione di client che offrono o scrivono in chat')
+        parser.add_argument('--rate', type=float, default=2.0, help='Messaggi al secondo per client attivo')
+        parser.add_argument('--duration', type=float, default=10.0, help='Durata della fase di traffico in secondi')
+        parser.add_argument('--connect-concurrency', type=int, default=100)
+        parser.add_argument(
+            '--layer',
+            choices=['memory', 'configured'],
+            default='memory',
+            help='Channel layer in memoria o quello configurato in settings (es. Redis locale)',
+        )
+        parser.add_argument('--output', help='File in cui scrivere il report JSON (default: stdout)')
+
+    def handle(self, *args, **options):
+        layers = settings.CHANNEL_LAYERS
+        if options['layer'] == 'memory':
+            layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CHANNEL_LAYERS=layers):
+                fixtures = self.create_fixtures(options['clients'])
+                report = asyncio.run(self.run(options, fixtures))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            self.stdout.write(f"Report scritto in {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def create_fixtures(self, clients):
+        from artworks.models import Artwork
+        from auctions.models import Auction
+        from live_streams.models import LiveStream
+        from users.models import User
+
+        artist = User.objects.create(username='bench-artist', role=User.Role.ARTIST)
+        User.objects.bulk_create([User(username=f'bench-{i}') for i in range(clients)])
+        user_ids = list(User.objects.exclude(pk=artist.pk).values_list('id', flat=True))
+        artwork = Artwork.objects.create(
+            title='Benchmark', description='', image='bench.jpg', price=1, artist=artist
+        )
+        now = timezone.now()
+        auction = Auction.objects.create(
+            artwork=artwork, starting_price=1, current_price=1, end_time=now + timedelta(days=1)
+        )
+        stream = LiveStream.objects.create(
+            title='Benchmark', artist=artist, scheduled_start=now, status=LiveStream.Status.LIVE, started_at=now
+        )
+        return {'auction_id': auction.id, 'stream_id': stream.id, 'user_ids': user_ids}
+
+    async def run(self, options, fixtures):
+        from core.asgi import application
+
+        scenarios = ['auction', 'live'] if options['scenario'] == 'both' else [options['scenario']]
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'options': {key: options[key] for key in ('clients', 'active', 'rate', 'duration', 'layer')},
+            'scenarios': {},
+        }
+        for scenario in scenarios:
+            report['scenarios'][scenario] = await self.run_scenario(application, scenario, options, fixtures)
+        return report
+
+    async def run_scenario(self, application, scenario, options, fixtures):
+        stats = {
+            'connect': [], 'bid_ack': [], 'broadcast_lag': [],
+            'connect_failed': 0, 'sent': 0, 'received': 0,
+            # Istante di invio di ogni offerta (per importo) e messaggio (per testo)
+            'sent_at': {},
+        }
+        if scenario == 'auction':
+            path = f"/ws/auction/{fixtures['auction_id']}/"
+        else:
+            path = f"/ws/live/{fixtures['stream_id']}/"
+        timeout = options['duration'] + 60
+        clients = [Client(application, path, stats) for _ in range(options['clients'])]
+
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+
+        # Fase 1: connessioni, con concorrenza limitata
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(client):
+            async with semaphore:
+                if await client.connect(timeout):
+                    client.start_reading(timeout)
+                    return client
+
+        connected = [client for client in await asyncio.gather(*(connect(c) for c in clients)) if client]
+        connect_wall = time.perf_counter() - wall_started
+
+        # Fase 2: traffico realistico da una frazione di client attivi
+        active = connected[:max(1, int(len(connected) * options['active']))] if connected else []
+        deadline = time.perf_counter() + options['duration']
+        price = [1]
+        chat_numbers = itertools.count()
+
+        async def drive(client, user_id):
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(random.expovariate(options['rate']))
+                if scenario == 'auction':
+                    price[0] += random.randint(1, 5)
+                    sent_at = time.perf_counter()
+                    client.pending_bids.append(sent_at)
+                    stats['sent_at'][('bid', Decimal(price[0]))] = sent_at
+                    await client.send({'type': 'place_bid', 'amount': price[0], 'user_id': user_id})
+                else:
+                    # Testo univoco: identifica il messaggio nei chat_batch ricevuti
+                    text = f'ciao {next(chat_numbers)}'
+                    stats['sent_at'][('chat', text)] = time.perf_counter()
+                    await client.send({'type': 'chat_message', 'message': text})
+
+        await asyncio.gather(*(
+            drive(client, fixtures['user_ids'][i % len(fixtures['user_ids'])])
+            for i, client in enumerate(active)
+        ))
+        # Lascia arrivare gli ultimi broadcast
+        await asyncio.sleep(1)
+
+        cpu_used = time.process_time() - cpu_started
+        wall_used = time.perf_counter() - wall_started
+        await asyncio.gather(*(client.close() for client in connected))
+
+        messages = stats['sent'] + stats['received']
+        return {
+            'clients_connected': len(connected),
+            'connect_failed': stats['connect_failed'],
+            'connect_wall_s': round(connect_wall, 3),
+            'connect': summarize(stats['connect']),
+            'bid_ack': summarize(stats['bid_ack']),
+            'broadcast_lag': summarize(stats['broadcast_lag']),
+            'messages_sent': stats['sent'],
+            'messages_received': stats['received'],
+            'cpu_s': round(cpu_used, 3),
+            'wall_s': round(wall_used, 3),
+            # Il server gira in-process su un solo core: messaggi per secondo di CPU
+            'messages_per_cpu_s': round(messages / cpu_used, 1) if cpu_used else None,
+        }
@@ -0,0 +1,48 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from core import exports
+
+
+class Command(BaseCommand):
+    help = "Esporta in streaming un dataset (NDJSON o CSV, gzip) su file o stdout, a memoria costante"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--output', '-o', default='-', help="File di destinazione ('-' per stdout)")
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='ndjson')
+        parser.add_argument('--no-compress', action='store_true', help="Testo non compresso invece di gzip")
+        parser.add_argument('--since', help="Data minima (ISO 8601) sul campo data del dataset")
+        parser.add_argument('--until', help="Data massima esclusa (ISO 8601)")
+        parser.add_argument('--after', type=int, default=0, help="Solo righe con id maggiore (esportazioni incrementali)")
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def parse_date(self, value, name):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"--{name}: data non valida (ISO 8601)")
+        return parsed
+
+    def handle(self, *args, **options):
+        chunks = exports.export(
+            options['dataset'],
+            options['fmt'],
+            compress=not options['no_compress'],
+            since=self.parse_date(options['since'], 'since'),
+            until=self.parse_date(options['until'], 'until'),
+            after=options['after'],
+            chunk_size=options['chunk_size'],
+        )
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if options['output'] != '-':
+            self.stderr.write(f"{options['dataset']}: {written} byte in {options['output']}")
@@ -0,0 +1,28 @@
+import os
+import threading
+from collections import defaultdict
+
+# Contatori del processo corrente (ogni worker espone i propri)
+_counters = defaultdict(int)
+_lock = threading.Lock()
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def get(name):
+    return _counters.get(name, 0)
+
+
+def snapshot():
+    """Copia dei contatori, con il pid del worker che li ha raccolti."""
+    with _lock:
+        counters = dict(sorted(_counters.items()))
+    return {'pid': os.getpid(), 'counters': counters}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
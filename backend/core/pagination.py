@@ -0,0 +1,139 @@
+import base64
+import json
+from datetime import date, datetime
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginazione keyset (cursore) su una tupla di campi, es. ('end_time', 'id').
+    Ogni pagina è un'unica query con WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n:
+    niente COUNT(*) e niente OFFSET, quindi il costo non cresce scorrendo.
+    L'ultimo campo dell'ordinamento deve essere univoco (di solito 'id').
+    """
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_ordering(self, view):
+        return getattr(view, 'keyset_ordering', None) or self.ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound('Cursore non valido')
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise NotFound('Cursore non valido')
+        # Ogni valore convertito dal campo del modello: un cursore manomesso
+        # (es. ["x", "y"]) diventa un 404 invece di un errore nella query
+        parsed = []
+        for field, value in zip(self.fields, values):
+            try:
+                value = model._meta.get_field(field.lstrip('-')).to_python(value)
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound('Cursore non valido')
+            if value is None:
+                raise NotFound('Cursore non valido')
+            parsed.append(value)
+        return parsed
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.fields:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            values.append(value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def keyset_filter(self, values):
+        # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {f.lstrip('-'): v for f, v in zip(self.fields[:i], values[:i])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = list(self.get_ordering(view))
+        size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.fields)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(cursor))
+
+        # Un elemento in più per sapere se esiste la pagina successiva
+        page = list(queryset[:size + 1])
+        self.next_cursor = self.encode_cursor(page[size - 1]) if len(page) > size else None
+        return page[:size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CursorOptInPagination(BasePagination):
+    """
+    PageNumberPagination di default (`count`, `previous`, `?page=`), per i
+    client esistenti; con `?cursor=` (vuoto per la prima pagina) l'elenco
+    passa alla paginazione keyset, senza COUNT(*) né OFFSET.
+    """
+    page_number_class = PageNumberPagination
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.paginator = self.keyset_class()
+        else:
+            self.paginator = self.page_number_class()
+            ordering = getattr(view, 'keyset_ordering', None)
+            if ordering:
+                # Stesso ordine del cursore, stabile anche a parità di data
+                queryset = queryset.order_by(*ordering)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_class().get_paginated_response_schema(schema)
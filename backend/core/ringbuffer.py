@@ -0,0 +1,59 @@
+from django.core.cache import cache
+
+
+class CacheRingBuffer:
+    """
+    Buffer circolare limitato, salvato nella cache condivisa tra i worker.
+    Gli elementi sono dizionari con un campo 'seq' crescente; se la chiave
+    manca dalla cache il buffer viene ricostruito con `loader(size)`.
+    L'aggiornamento è read-modify-write: con più scrittori concorrenti un
+    elemento può andare perso, quindi va usato per dati ricostruibili.
+    Per questo since() si fida della cache solo se le sequenze sono contigue;
+    altrimenti legge dal registro persistente con `reader(seq, size)`.
+    """
+
+    def __init__(self, key, size, loader=None, timeout=60 * 60, reader=None):
+        self.key = key
+        self.size = size
+        self.loader = loader
+        self.reader = reader
+        self.timeout = timeout
+
+    def items(self):
+        items = cache.get(self.key)
+        if items is None:
+            items = list(self.loader(self.size)) if self.loader else []
+            cache.set(self.key, items, self.timeout)
+        return items
+
+    def extend(self, new_items):
+        items = self.items()
+        last_seq = items[-1]['seq'] if items else None
+        # Scarta gli elementi già presenti (es. appena ricaricati dal loader)
+        items.extend(item for item in new_items if last_seq is None or item['seq'] > last_seq)
+        items = items[-self.size:]
+        cache.set(self.key, items, self.timeout)
+        return items
+
+    def append(self, item):
+        return self.extend([item])
+
+    def since(self, seq):
+        """
+        Elementi successivi a `seq`, oppure None se il buffer non copre più
+        l'intervallo richiesto (il client deve ricevere lo stato completo).
+        """
+        items = self.items()
+        newer = [item for item in items if item['seq'] > seq]
+        # Buco nelle sequenze: un elemento può essersi perso (o non essere mai
+        # stato scritto in questa cache), solo il registro lo può dire
+        if items and items[0]['seq'] <= seq + 1 and all(
+            item['seq'] == seq + 1 + i for i, item in enumerate(newer)
+        ):
+            return newer
+        if self.reader is not None:
+            return self.reader(seq, self.size)
+        return None
+
+    def clear(self):
+        cache.delete(self.key)
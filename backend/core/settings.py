@@ -61,6 +61,9 @@ INSTALLED_APPS = [
     'media',
     'core',
     'payment',
+    'search',
+    'recommendations',
+    'trending',
 ]
 
 MIDDLEWARE = [
@@ -188,6 +191,118 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Aste: se attivo, le offerte sono ordinate e validate in memoria da un
+# sequencer per asta e persistite in background (richiede routing sticky)
+AUCTION_BID_SEQUENCER = os.environ.get('AUCTION_BID_SEQUENCER', 'False') == 'True'
+
+# Finestra (secondi) in cui gli aggiornamenti di un'asta vengono accorpati in
+# un unico broadcast per stanza; 0 disattiva l'accorpamento
+AUCTION_BROADCAST_TICK = float(os.environ.get('AUCTION_BROADCAST_TICK', '0.1'))
+
+# Numero di offerte recenti conservate per il replay ai client che si riconnettono
+AUCTION_EVENT_LOG_SIZE = int(os.environ.get('AUCTION_EVENT_LOG_SIZE', '200'))
+
+# Anti-sniping: un'offerta negli ultimi N secondi sposta la fine a ora + N (0 = disattivo)
+AUCTION_ANTI_SNIPING_SECONDS = int(os.environ.get('AUCTION_ANTI_SNIPING_SECONDS', '0'))
+
+# Elenco aste "in scadenza": orizzonte in minuti e cache della prima pagina in secondi
+AUCTION_ENDING_SOON_MINUTES = int(os.environ.get('AUCTION_ENDING_SOON_MINUTES', '60'))
+AUCTION_LIST_CACHE_SECONDS = int(os.environ.get('AUCTION_LIST_CACHE_SECONDS', '5'))
+
+# Intervallo (secondi) con cui lo scheduler cerca aste nuove o modificate
+AUCTION_SCHEDULER_RESCAN = int(os.environ.get('AUCTION_SCHEDULER_RESCAN', '60'))
+
+# Intervallo (secondi) con cui il numero di spettatori delle live viene salvato nel database
+LIVE_VIEWERS_FLUSH_INTERVAL = int(os.environ.get('LIVE_VIEWERS_FLUSH_INTERVAL', '10'))
+
+# Processi che possono contribuire al conteggio degli spettatori (uno slot
+# ciascuno nella cache; un processo caduto esce dal conteggio in 3 intervalli)
+LIVE_VIEWERS_MAX_WORKERS = int(os.environ.get('LIVE_VIEWERS_MAX_WORKERS', '64'))
+
+# Chat delle live: finestra (secondi) di accorpamento dei messaggi in un unico
+# frame per stanza, numero di messaggi recenti inviati a chi si collega e
+# lunghezza massima (caratteri) di un messaggio
+LIVE_CHAT_BROADCAST_TICK = float(os.environ.get('LIVE_CHAT_BROADCAST_TICK', '0.1'))
+LIVE_CHAT_HISTORY_SIZE = int(os.environ.get('LIVE_CHAT_HISTORY_SIZE', '50'))
+LIVE_CHAT_MAX_LENGTH = int(os.environ.get('LIVE_CHAT_MAX_LENGTH', '500'))
+
+# Salvataggio differito della chat: righe per bulk_create, secondi massimi di
+# attesa e messaggi in coda oltre i quali i nuovi vengono scartati
+LIVE_CHAT_WRITE_BATCH = int(os.environ.get('LIVE_CHAT_WRITE_BATCH', '500'))
+LIVE_CHAT_WRITE_INTERVAL = float(os.environ.get('LIVE_CHAT_WRITE_INTERVAL', '1.0'))
+LIVE_CHAT_WRITE_MAX_PENDING = int(os.environ.get('LIVE_CHAT_WRITE_MAX_PENDING', '10000'))
+
+# Secondi dopo la fine di una live prima di accorpare le sue metriche al secondo
+# in bucket al minuto e all'ora (il tempo perché gli ultimi bucket siano scritti)
+STREAM_METRICS_COMPACT_DELAY = int(os.environ.get('STREAM_METRICS_COMPACT_DELAY', '60'))
+
+# Tracciamento delle interazioni: righe per bulk_create, secondi massimi di
+# attesa, eventi in coda oltre i quali i nuovi vengono scartati e finestra
+# (secondi) in cui le visualizzazioni ripetute dello stesso utente si ignorano
+INTERACTIONS_WRITE_BATCH = int(os.environ.get('INTERACTIONS_WRITE_BATCH', '1000'))
+INTERACTIONS_WRITE_INTERVAL = float(os.environ.get('INTERACTIONS_WRITE_INTERVAL', '2.0'))
+INTERACTIONS_WRITE_MAX_PENDING = int(os.environ.get('INTERACTIONS_WRITE_MAX_PENDING', '50000'))
+INTERACTIONS_VIEW_DEDUP_WINDOW = int(os.environ.get('INTERACTIONS_VIEW_DEDUP_WINDOW', '30'))
+# Giorni di interazioni grezze conservati; le più vecchie restano solo nei
+# riepiloghi orari/giornalieri (comando compact_interactions)
+INTERACTIONS_RETENTION_DAYS = int(os.environ.get('INTERACTIONS_RETENTION_DAYS', '90'))
+
+# Limiti sui messaggi in ingresso dai WebSocket per tipo: (messaggi al secondo, burst),
+# per singola connessione e per utente su tutte le sue connessioni del worker
+WEBSOCKET_RATE_LIMITS = {
+    'chat_message': (2, 5),
+    'place_bid': (2, 5),
+}
+WEBSOCKET_USER_RATE_LIMITS = {
+    'chat_message': (3, 10),
+    'place_bid': (3, 10),
+}
+
+# Frame in coda per ogni socket (0 = invio diretto) e frame scartati dopo i
+# quali un client lento viene disconnesso
+WEBSOCKET_OUTBOUND_QUEUE_SIZE = int(os.environ.get('WEBSOCKET_OUTBOUND_QUEUE_SIZE', '100'))
+WEBSOCKET_MAX_DROPPED = int(os.environ.get('WEBSOCKET_MAX_DROPPED', '200'))
+
+# Intervallo (secondi) dell'heartbeat con lo stato di ogni stanza (live e aste),
+# inviato da un solo worker per stanza
+WEBSOCKET_HEARTBEAT_INTERVAL = float(os.environ.get('WEBSOCKET_HEARTBEAT_INTERVAL', '5'))
+
+# Sottogruppi in cui ogni stanza WebSocket è divisa per hash del canale: i
+# broadcast partono in parallelo verso gruppi più piccoli (1 = nessuna divisione).
+# Utile solo con stanze molto affollate; va cambiato a processi fermi, perché i
+# canali già iscritti restano nei sottogruppi calcolati con il valore precedente
+CHANNEL_GROUP_SHARDS = int(os.environ.get('CHANNEL_GROUP_SHARDS', '1'))
+
+# Intervallo (secondi) di scrittura dei contatori differiti di visualizzazioni e
+# mi piace; 0 = UPDATE immediato a ogni incremento
+COUNTERS_FLUSH_INTERVAL = float(os.environ.get('COUNTERS_FLUSH_INTERVAL', '5'))
+# Scritture fallite dopo cui gli incrementi di un contatore vengono scartati
+# (fino ad allora restano nel buffer e ripartono con la scrittura successiva)
+COUNTERS_MAX_RETRIES = int(os.environ.get('COUNTERS_MAX_RETRIES', '5'))
+
+# Varianti delle immagini caricate: larghezze in pixel, qualità WebP/JPEG e
+# processi del pool (default: un processo per core)
+RENDITION_WIDTHS = (320, 640, 1024, 1600)
+RENDITION_QUALITY = int(os.environ.get('RENDITION_QUALITY', '80'))
+RENDITION_WORKERS = int(os.environ.get('RENDITION_WORKERS', '0')) or None
+# Genera le varianti nella richiesta (sviluppo e test)
+RENDITIONS_SYNC = os.environ.get('RENDITIONS_SYNC', 'False') == 'True'
+
+# Raccomandazioni (comando build_recommendations): vicini per opera, giorni di
+# interazioni considerati (al massimo INTERACTIONS_RETENTION_DAYS), oggetti
+# massimi per utente e durata in cache
+RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', '50'))
+RECOMMENDATIONS_WINDOW_DAYS = int(os.environ.get('RECOMMENDATIONS_WINDOW_DAYS', str(INTERACTIONS_RETENTION_DAYS)))
+RECOMMENDATIONS_MAX_ITEMS_PER_USER = int(os.environ.get('RECOMMENDATIONS_MAX_ITEMS_PER_USER', '500'))
+RECOMMENDATIONS_CACHE_TIMEOUT = int(os.environ.get('RECOMMENDATIONS_CACHE_TIMEOUT', str(2 * 24 * 3600)))
+
+# Tendenze: emivita del punteggio (secondi) e contenuti per classifica. Con
+# TRENDING_REDIS_URL le classifiche sono condivise tra i processi (sorted set),
+# altrimenti restano nella memoria di ogni processo (sviluppo)
+TRENDING_HALF_LIFE = int(os.environ.get('TRENDING_HALF_LIFE', str(6 * 3600)))
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', '100'))
+TRENDING_REDIS_URL = os.environ.get('TRENDING_REDIS_URL', '')
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Solo per sviluppo
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000').split(',')
@@ -242,12 +357,28 @@ SIMPLE_JWT = {
 }
 
 # Cache settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Presenza nelle live, lease degli heartbeat, snapshot e log delle aste e
+# contatori vivono nella cache: deve essere condivisa tra tutti i worker
+# (Redis). La LocMem è privata di ogni processo: LOCAL_CACHE=True solo in
+# sviluppo o con un unico processo daphne (default con DEBUG attivo)
+LOCAL_CACHE = os.environ.get('LOCAL_CACHE', str(DEBUG)) == 'True'
+if LOCAL_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ.get('REDIS_CACHE_URL', f"redis://{os.getenv('REDIS_HOST', 'localhost')}:6379/1"),
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
     }
-}
 
 # Logging configuration
 LOGGING = {
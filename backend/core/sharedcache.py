@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+# Backend che non condividono i dati tra processi
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_process_local():
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], PROCESS_LOCAL_BACKENDS)
+
+
+def require_shared_cache(feature):
+    """
+    Errore esplicito se `feature` userebbe una cache privata del processo senza
+    che il deploy lo dichiari (LOCAL_CACHE=True, un solo processo): con più
+    worker ognuno vedrebbe solo i propri dati.
+    """
+    if is_process_local() and not getattr(settings, 'LOCAL_CACHE', False):
+        raise ImproperlyConfigured(
+            f"{feature} richiede una cache condivisa tra i processi (Redis): "
+            f"configura CACHES oppure imposta LOCAL_CACHE=True con un solo worker"
+        )
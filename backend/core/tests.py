@@ -0,0 +1,503 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from channels_redis.core import RedisChannelLayer
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+import msgpack
+from artworks.models import Artwork
+from auctions.consumers import merge_deltas
+from users.models import User, UserInteraction
+from . import exports, groups, metrics, wire
+from .backpressure import OutboundQueue
+from .broadcast import TickBroadcaster
+from .counters import CounterBuffer
+from .heartbeat import CacheLease
+from .wire import WireProtocolMixin
+
+
+class ExportStreamingTests(TransactionTestCase):
+    """Esportazioni servite attraverso l'handler ASGI, come sotto daphne."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        UserInteraction.objects.bulk_create(
+            UserInteraction(user=self.admin, content_type='artwork', content_id=i, action='view')
+            for i in range(50)
+        )
+        self.client.force_login(self.admin)
+        self.cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+
+    def request(self, path, query=''):
+        messages = []
+        state = {'exhausted': False, 'exhausted_at_first_body': None}
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # Dopo il corpo della richiesta il client resta in attesa della risposta
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and state['exhausted_at_first_body'] is None:
+                state['exhausted_at_first_body'] = state['exhausted']
+            messages.append(message)
+
+        keyset_rows = exports.keyset_rows
+
+        def tracked_rows(*args, **kwargs):
+            yield from keyset_rows(*args, **kwargs)
+            state['exhausted'] = True
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'headers': [(b'host', b'testserver'), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        with mock.patch.object(exports, 'keyset_rows', tracked_rows), \
+                mock.patch.object(exports, 'BUFFER_SIZE', 64):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+        return messages, state
+
+    def test_chunks_are_sent_while_reading(self):
+        messages, state = self.request('/api/exports/interactions/', 'compress=0')
+        self.assertEqual(messages[0]['status'], 200)
+        bodies = [message for message in messages if message['type'] == 'http.response.body']
+        # Un messaggio per blocco più quello finale vuoto, non un unico corpo
+        self.assertGreater(len(bodies), 2)
+        self.assertTrue(all(message['more_body'] for message in bodies[:-1]))
+        self.assertFalse(bodies[-1].get('more_body', False))
+        # Il primo blocco parte prima che la lettura del dataset sia finita
+        self.assertIs(state['exhausted_at_first_body'], False)
+        self.assertTrue(state['exhausted'])
+        lines = b''.join(message.get('body', b'') for message in bodies).decode().splitlines()
+        self.assertEqual([json.loads(line)['content_id'] for line in lines], list(range(50)))
+
+    def test_gzip_export_decompresses(self):
+        messages, _ = self.request('/api/exports/interactions/')
+        body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+        self.assertEqual(len(zlib.decompress(body, 31).decode().splitlines()), 50)
+
+
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        artist = User.objects.create_user('artist', password='password')
+        self.artwork = Artwork.objects.create(title='Opera', description='', image='', price=1, artist=artist)
+        self.buffer = CounterBuffer()
+        # Nessun thread di scrittura: i test chiamano flush direttamente
+        self.buffer.start = lambda: None
+        metrics.reset()
+
+    def views(self):
+        return Artwork.objects.get(pk=self.artwork.pk).views_count
+
+    def test_failed_write_is_retried_with_new_increments(self):
+        self.buffer.increment(Artwork, self.artwork.pk, 'views_count', 3)
+        with mock.patch.object(CounterBuffer, 'write', side_effect=OperationalError):
+            self.buffer.flush()
+        self.assertEqual(self.views(), 0)
+        self.buffer.increment(Artwork, self.artwork.pk, 'views_count', 2)
+        self.buffer.flush()
+        self.assertEqual(self.views(), 5)
+        self.assertFalse(self.buffer.failures)
+
+    @override_settings(COUNTERS_MAX_RETRIES=2)
+    def test_increments_are_dropped_after_max_retries(self):
+        self.buffer.increment(Artwork, self.artwork.pk, 'views_count', 3)
+        with mock.patch.object(CounterBuffer, 'write', side_effect=OperationalError):
+            for _ in range(3):
+                self.buffer.flush()
+        self.assertFalse(self.buffer.pending)
+        self.assertEqual(metrics.get('counters.dropped'), 3)
+        self.buffer.flush()
+        self.assertEqual(self.views(), 0)
+
+
+# Redis per i test del channel layer reale (saltati se non raggiungibile)
+TEST_REDIS_URL = os.environ.get('TEST_REDIS_URL', f"redis://{os.getenv('REDIS_HOST', 'localhost')}:6379/2")
+
+
+def redis_available():
+    host, port = TEST_REDIS_URL.split('//')[1].split('/')[0].split(':')
+    try:
+        socket.create_connection((host, int(port)), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+class TickBroadcasterTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        patcher = mock.patch.object(groups, 'group_send', side_effect=self.group_send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def group_send(self, layer, group, message):
+        if group == 'broken':
+            raise ConnectionError("channel layer non raggiungibile")
+        self.sent.append((group, message))
+
+    def update(self, seq, **fields):
+        return {'type': 'auction_update', 'delta': {'seq': seq, **fields}}
+
+    async def test_deltas_of_a_tick_are_merged_into_one_send(self):
+        prepared = []
+
+        def prepare(message):
+            prepared.append(message)
+            return {**message, 'prepared': True}
+
+        broadcaster = TickBroadcaster(None, 0.05)
+        # Arrivano fuori ordine: vince il campo della sequenza più alta
+        messages = (
+            self.update(2, current_price='120.00'), self.update(1, current_price='110.00', bids=1), self.update(3, end_time=5),
+        )
+        for message in messages:
+            await broadcaster.publish('auction_1', message, merge=merge_deltas, prepare=prepare)
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(prepared), 1)
+        self.assertEqual(self.sent, [('auction_1', {
+            'type': 'auction_update',
+            'delta': {'seq': 3, 'current_price': '120.00', 'bids': 1, 'end_time': 5},
+            'prepared': True,
+        })])
+
+    async def test_failing_group_does_not_stop_the_others(self):
+        broadcaster = TickBroadcaster(None, 0.05)
+
+        def failing_prepare(message):
+            raise ValueError("frame non codificabile")
+
+        await broadcaster.publish('room_a', {'type': 'chat_batch'}, prepare=failing_prepare)
+        await broadcaster.publish('broken', {'type': 'chat_batch'})
+        await broadcaster.publish('room_b', {'type': 'chat_batch'})
+        with self.assertLogs('core.broadcast', 'ERROR') as logs:
+            await broadcaster.flush()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(self.sent, [('room_b', {'type': 'chat_batch'})])
+
+
+class GroupShardingTests(SimpleTestCase):
+    """Stanze divise in sottogruppi: ogni iscritto riceve ogni messaggio una volta sola."""
+
+    def make_layer(self):
+        return InMemoryChannelLayer()
+
+    async def join(self, layer, count):
+        channels = [await layer.new_channel() for _ in range(count)]
+        for channel in channels:
+            await groups.group_add(layer, 'room_test', channel)
+        return channels
+
+    async def receive_all(self, layer, channels):
+        return [(await asyncio.wait_for(layer.receive(channel), 2))['n'] for channel in channels]
+
+    async def test_room_is_a_plain_group_without_sharding(self):
+        layer = self.make_layer()
+        with self.settings(CHANNEL_GROUP_SHARDS=1):
+            channels = await self.join(layer, 3)
+            # Chi invia direttamente al gruppo della stanza raggiunge tutti
+            await layer.group_send('room_test', {'type': 'test', 'n': 1})
+            self.assertEqual(await self.receive_all(layer, channels), [1, 1, 1])
+        await self.cleanup(layer)
+
+    async def test_sharded_broadcast_reaches_every_member_once(self):
+        layer = self.make_layer()
+        with self.settings(CHANNEL_GROUP_SHARDS=4):
+            channels = await self.join(layer, 20)
+            self.assertGreater(len({groups.shard_for('room_test', channel) for channel in channels}), 1)
+            await groups.group_send(layer, 'room_test', {'type': 'test', 'n': 1})
+            await groups.group_send(layer, 'room_test', {'type': 'test', 'n': 2})
+            self.assertEqual(await self.receive_all(layer, channels), [1] * 20)
+            self.assertEqual(await self.receive_all(layer, channels), [2] * 20)
+
+            await groups.group_discard(layer, 'room_test', channels[0])
+            await groups.group_send(layer, 'room_test', {'type': 'test', 'n': 3})
+            self.assertEqual(await self.receive_all(layer, channels[1:]), [3] * 19)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channels[0]), 0.2)
+        await self.cleanup(layer)
+
+    async def cleanup(self, layer):
+        await layer.flush()
+
+
+@skipUnless(redis_available(), f"Redis non raggiungibile su {TEST_REDIS_URL}")
+class RedisGroupShardingTests(GroupShardingTests):
+    def make_layer(self):
+        return RedisChannelLayer(hosts=[TEST_REDIS_URL])
+
+    async def cleanup(self, layer):
+        await layer.flush()
+        await layer.close_pools()
+
+
+class CacheLeaseTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_single_owner_until_expiry(self):
+        first, second = CacheLease('lease_test', 0.2), CacheLease('lease_test', 0.2)
+        self.assertTrue(await first.acquire())
+        self.assertFalse(await second.acquire())
+        # Il proprietario rinnova la lease
+        self.assertTrue(await first.acquire())
+        await asyncio.sleep(0.3)
+        self.assertTrue(await second.acquire())
+        self.assertFalse(await first.acquire())
+
+    async def test_release_hands_over_immediately(self):
+        first, second = CacheLease('lease_test', 10), CacheLease('lease_test', 10)
+        await first.acquire()
+        await first.release()
+        self.assertTrue(await second.acquire())
+
+    @override_settings(
+        LOCAL_CACHE=False,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_process_local_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheLease('lease_test', 10)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    async def test_private_frames_are_never_dropped(self):
+        sent, paused = [], asyncio.Event()
+
+        async def send(frame):
+            await paused.wait()
+            sent.append(frame)
+
+        queue = OutboundQueue(send, 3, 100, lambda: None)
+        queue.put('room-0')
+        await asyncio.sleep(0)
+        for frame in ('room-1', 'reply', 'room-2', 'room-3', 'room-4'):
+            queue.put(frame, private=frame == 'reply')
+        paused.set()
+        await queue._task
+        self.assertEqual(sent, ['room-0', 'reply', 'room-3', 'room-4'])
+        self.assertEqual(queue.dropped, 0)
+
+    async def test_slow_client_is_disconnected(self):
+        slow = []
+        queue = OutboundQueue(lambda frame: asyncio.Event().wait(), 2, 3, lambda: slow.append(True))
+        for i in range(10):
+            queue.put(f'room-{i}')
+        self.assertEqual(slow, [True])
+        self.assertTrue(queue.closed)
+
+
+class Echo(WireProtocolMixin, AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept_with_subprotocol()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.send_message(self.decode_message(text_data, bytes_data))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class WireProtocolTests(SimpleTestCase):
+    async def connect(self, subprotocols=None):
+        communicator = WebsocketCommunicator(Echo.as_asgi(), '/ws/echo/', subprotocols=subprotocols)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, subprotocol
+
+    def test_every_message_type_survives_the_binary_round_trip(self):
+        fields = {name: f'valore {name}' for name in wire.FIELD_TAGS if name != 'type'}
+        for message_type in wire.TYPE_TAGS:
+            with self.subTest(type=message_type):
+                payload = {'type': message_type, **fields, 'events': [{'seq': 1, 'amount': '10.00'}], 'extra': 1}
+                frame = wire.encode(payload, wire.MSGPACK_SUBPROTOCOL)
+                self.assertEqual(msgpack.unpackb(frame)['t'], wire.TYPE_TAGS[message_type])
+                self.assertEqual(wire.decode(bytes_data=frame), payload)
+                self.assertEqual(wire.decode(bytes_data=wire.encode_frames(payload)[wire.MSGPACK_SUBPROTOCOL]), payload)
+
+    async def test_msgpack_is_negotiated_when_offered(self):
+        communicator, subprotocol = await self.connect([wire.MSGPACK_SUBPROTOCOL, wire.JSON_SUBPROTOCOL])
+        self.assertEqual(subprotocol, wire.MSGPACK_SUBPROTOCOL)
+        await communicator.send_to(bytes_data=wire.encode({'type': 'place_bid', 'amount': '150'}, subprotocol))
+        reply = await communicator.receive_from()
+        self.assertIsInstance(reply, bytes)
+        self.assertEqual(wire.decode(bytes_data=reply), {'type': 'place_bid', 'amount': '150'})
+        await communicator.disconnect()
+
+    async def test_json_is_the_fallback(self):
+        for subprotocols in (None, ['altro']):
+            with self.subTest(subprotocols=subprotocols):
+                communicator, subprotocol = await self.connect(subprotocols)
+                self.assertIsNone(subprotocol)
+                await communicator.send_json_to({'type': 'chat_message', 'message': 'ciao'})
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'chat_message', 'message': 'ciao'})
+                await communicator.disconnect()
+        # Senza msgpack installato si negozia solo JSON
+        with mock.patch.object(wire, 'msgpack', None):
+            communicator, subprotocol = await self.connect([wire.MSGPACK_SUBPROTOCOL, wire.JSON_SUBPROTOCOL])
+            await communicator.disconnect()
+        self.assertEqual(subprotocol, wire.JSON_SUBPROTOCOL)
+
+    async def test_undecodable_frame_closes_the_socket(self):
+        for frame in ({'bytes_data': b'\xc1'}, {'bytes_data': msgpack.packb([1, 2])}, {'text_data': '{"type":'}):
+            with self.subTest(frame=frame):
+                communicator, _ = await self.connect([wire.MSGPACK_SUBPROTOCOL])
+                await communicator.send_to(**frame)
+                self.assertEqual(
+                    await communicator.receive_output(), {'type': 'websocket.close', 'code': wire.INVALID_FRAME_CLOSE_CODE}
+                )
+                await communicator.disconnect()
+
+
+# Server daphne reale con un consumer che inonda il socket: il client non legge
+SLOW_READER_SERVER = """
+import asyncio
+import sys
+import daphne.server  # reactor asyncio installato prima di Django
+import django
+
+django.setup()
+from channels.generic.websocket import AsyncWebsocketConsumer
+from daphne.server import Server
+from core.wire import JSON_SUBPROTOCOL, WireProtocolMixin
+
+
+class Flood(WireProtocolMixin, AsyncWebsocketConsumer):
+    channel_layer_alias = 'none'
+
+    async def connect(self):
+        await self.accept()
+        frame = 'x' * 65536
+        for i in range(400):
+            if i % 50 == 0:
+                await self.send_message({'type': 'bid_response', 'seq': i})
+            await self.send_frames({JSON_SUBPROTOCOL: frame})
+            await asyncio.sleep(0.001)
+        await self.send_message({'type': 'done'})
+
+
+Server(
+    Flood.as_asgi(),
+    endpoints=[f'tcp:port={sys.argv[1]}:interface=127.0.0.1'],
+    signal_handlers=False,
+    verbosity=0,
+).run()
+"""
+
+
+class SlowReaderTests(SimpleTestCase):
+    """Backpressure misurata sul trasporto di daphne, con un client che non legge."""
+
+    def start_server(self, max_dropped):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        script = tempfile.NamedTemporaryFile('w', suffix='.py', delete=False)
+        script.write(SLOW_READER_SERVER)
+        script.close()
+        self.addCleanup(os.unlink, script.name)
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'core.settings',
+            'PYTHONPATH': os.getcwd(),
+            'WEBSOCKET_OUTBOUND_QUEUE_SIZE': '10',
+            'WEBSOCKET_MAX_DROPPED': str(max_dropped),
+        }
+        server = subprocess.Popen(
+            [sys.executable, script.name, str(port)], env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(server.wait)
+        self.addCleanup(server.kill)
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return port
+            except OSError:
+                time.sleep(0.1)
+        self.fail("Server daphne non avviato")
+
+    def connect(self, port):
+        client = socket.socket()
+        # Buffer di ricezione minimo: i dati restano nel trasporto del server
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.connect(('127.0.0.1', port))
+        client.settimeout(20)
+        key = base64.b64encode(os.urandom(16)).decode()
+        client.sendall((
+            f'GET / HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUpgrade: websocket\r\n'
+            f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+        ).encode())
+        response = b''
+        while b'\r\n\r\n' not in response:
+            response += client.recv(1)
+        self.assertIn(b' 101 ', response.split(b'\r\n')[0])
+        return client
+
+    def read_frames(self, client):
+        """Frame ricevuti fino a 'done' o alla chiusura: (testi, codice di chiusura)."""
+        stream = client.makefile('rb')
+        texts = []
+        while True:
+            opcode, length = stream.read(2)
+            opcode, length = opcode & 0x0F, length & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', stream.read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', stream.read(8))[0]
+            payload = stream.read(length)
+            if opcode == 0x8:
+                return texts, struct.unpack('!H', payload[:2])[0]
+            texts.append(payload.decode())
+            if '"done"' in texts[-1]:
+                return texts, None
+
+    def test_private_frames_survive_while_room_frames_are_dropped(self):
+        client = self.connect(self.start_server(max_dropped=100000))
+        self.addCleanup(client.close)
+        time.sleep(3)
+        texts, close_code = self.read_frames(client)
+        self.assertIsNone(close_code)
+        replies = [json.loads(text)['seq'] for text in texts if 'bid_response' in text]
+        self.assertEqual(replies, list(range(0, 400, 50)))
+        room = [text for text in texts if text.startswith('x')]
+        self.assertLess(len(room), 400)
+
+    def test_client_that_does_not_read_is_disconnected(self):
+        client = self.connect(self.start_server(max_dropped=20))
+        self.addCleanup(client.close)
+        time.sleep(3)
+        # Il frame di chiusura 4008 resta dietro ai dati non letti: se il client
+        # non lo raggiunge entro il timeout di chiusura, daphne tronca la connessione
+        try:
+            texts, close_code = self.read_frames(client)
+        except (ConnectionResetError, ValueError):
+            return
+        self.assertEqual(close_code, 4008)
+        self.assertFalse(any('"done"' in text for text in texts))
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from django.conf import settings
+from . import metrics
+
+# Bucket per utente condivisi dalle connessioni del processo, i meno recenti
+# vengono scartati oltre questa soglia
+MAX_USER_BUCKETS = 10000
+_user_buckets = OrderedDict()
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` token al secondo fino a un massimo di `burst`.
+    Ogni messaggio consuma un token; senza token il messaggio è rifiutato.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+def user_bucket(message_type, user_id, rate, burst):
+    key = (message_type, user_id)
+    bucket = _user_buckets.get(key)
+    if bucket is None:
+        bucket = _user_buckets[key] = TokenBucket(rate, burst)
+        if len(_user_buckets) > MAX_USER_BUCKETS:
+            _user_buckets.popitem(last=False)
+    else:
+        _user_buckets.move_to_end(key)
+    return bucket
+
+
+class ThrottleMixin:
+    """
+    Limita i messaggi in ingresso di un consumer WebSocket per tipo, con un
+    bucket per connessione (WEBSOCKET_RATE_LIMITS) e uno per utente
+    (WEBSOCKET_USER_RATE_LIMITS) condiviso tra le sue connessioni nel processo.
+    I limiti sono coppie (messaggi al secondo, burst); i tipi non elencati
+    non sono limitati.
+    """
+
+    def throttle_user_id(self, message):
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return None
+
+    def allow_message(self, message_type, message):
+        buckets = getattr(self, '_buckets', None)
+        if buckets is None:
+            buckets = self._buckets = {}
+
+        limit = getattr(settings, 'WEBSOCKET_RATE_LIMITS', {}).get(message_type)
+        if limit:
+            bucket = buckets.get(message_type)
+            if bucket is None:
+                bucket = buckets[message_type] = TokenBucket(*limit)
+            if not bucket.consume():
+                metrics.incr(f'ws.throttled.connection.{message_type}')
+                return False
+
+        limit = getattr(settings, 'WEBSOCKET_USER_RATE_LIMITS', {}).get(message_type)
+        user_id = self.throttle_user_id(message)
+        if limit and user_id is not None:
+            if not user_bucket(message_type, user_id, *limit).consume():
+                metrics.incr(f'ws.throttled.user.{message_type}')
+                return False
+        return True
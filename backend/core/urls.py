@@ -20,6 +20,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
 from rest_framework.documentation import include_docs_urls
+from .views import export_view, metrics_view
 
 def api_root(request):
     return JsonResponse({
@@ -33,6 +34,9 @@ def api_root(request):
             "events": "/api/events/",
             "qr": "/api/qr/",
             "media": "/api/media/",
+            "search": "/api/search/",
+            "recommendations": "/api/recommendations/",
+            "trending": "/api/trending/",
         }
     })
 
@@ -47,7 +51,12 @@ urlpatterns = [
     path('api/qr/', include('qr_system.urls')),
     path('api/media/', include('media.urls')),
     path('api/payment/', include('payment.urls')),
+    path('api/search/', include('search.urls')),
+    path('api/recommendations/', include('recommendations.urls')),
+    path('api/trending/', include('trending.urls')),
     path('api/docs/', include_docs_urls(title='OFI API')),
+    path('api/metrics/', metrics_view, name='metrics'),
+    path('api/exports/<str:dataset>/', export_view, name='export'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,53 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.dateparse import parse_datetime
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from . import exports, metrics
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    # Contatori del worker che risponde alla richiesta
+    return Response(metrics.snapshot())
+
+
+def parse_datetime_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: 'Data non valida (ISO 8601)'})
+    return parsed
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_view(request, dataset):
+    """
+    Esportazione completa di un dataset (interactions, artworks, registrations)
+    in streaming: `?output=ndjson|csv`, `?compress=0` per il testo non compresso,
+    `?since=`/`?until=` (ISO 8601) sul campo data, `?after=<id>` per le
+    esportazioni incrementali.
+    """
+    if dataset not in exports.DATASETS:
+        raise NotFound(f"Dataset sconosciuto: {dataset}")
+    fmt = request.query_params.get('output', 'ndjson')
+    if fmt not in exports.FORMATS:
+        raise ValidationError({'output': f"Valori ammessi: {', '.join(exports.FORMATS)}"})
+    try:
+        after = int(request.query_params.get('after', 0))
+    except ValueError:
+        raise ValidationError({'after': 'Deve essere un numero intero'})
+    return exports.export_response(
+        dataset,
+        fmt,
+        compress=request.query_params.get('compress', '1') != '0',
+        since=parse_datetime_param(request, 'since'),
+        until=parse_datetime_param(request, 'until'),
+        after=after,
+        asynchronous=isinstance(request._request, ASGIRequest),
+    )
@@ -0,0 +1,201 @@
+import asyncio
+import json
+from django.conf import settings
+from .backpressure import OutboundQueue, TransportPressure
+
+try:
+    import msgpack
+except ImportError:  # msgpack arriva con channels-redis, ma resta opzionale
+    msgpack = None
+
+# Sottoprotocolli WebSocket negoziabili; senza negoziazione si usa JSON
+JSON_SUBPROTOCOL = 'ofi.json'
+MSGPACK_SUBPROTOCOL = 'ofi.msgpack'
+
+# Chiusura per un frame non decodificabile (1007: dati del frame non validi)
+INVALID_FRAME_CLOSE_CODE = 1007
+
+# Nomi brevi dei campi e dei tipi usati nel formato binario
+FIELD_TAGS = {
+    'type': 't',
+    'seq': 's',
+    'auction_id': 'a',
+    'current_price': 'p',
+    'min_bid_increment': 'mi',
+    'highest_bidder': 'b',
+    'total_bids': 'n',
+    'unique_bidders': 'u',
+    'end_time': 'e',
+    'last_bid_time': 'l',
+    'is_active': 'ia',
+    'server_time': 'st',
+    'success': 'ok',
+    'message': 'm',
+    'winner': 'w',
+    'events': 'ev',
+    'amount': 'am',
+    'bidder': 'bd',
+    'time': 'tm',
+    'user_id': 'ui',
+    'username': 'un',
+    'status': 'ss',
+    'viewers': 'v',
+    'duration': 'd',
+    'count': 'c',
+    'messages': 'ms',
+    'live_stream': 'ls',
+}
+TYPE_TAGS = {
+    'auction_snapshot': 'AS',
+    'auction_update': 'AU',
+    'auction_replay': 'AR',
+    'auction_closed': 'AC',
+    'auction_heartbeat': 'AH',
+    'bid_response': 'BR',
+    'place_bid': 'PB',
+    'chat_message': 'CM',
+    'chat_batch': 'CB',
+    'chat_history': 'CH',
+    'stream_status': 'SS',
+    'viewer_count': 'VC',
+}
+FIELD_NAMES = {tag: name for name, tag in FIELD_TAGS.items()}
+TYPE_NAMES = {tag: name for name, tag in TYPE_TAGS.items()}
+
+
+def _compact(value):
+    if isinstance(value, dict):
+        compact = {FIELD_TAGS.get(key, key): _compact(item) for key, item in value.items()}
+        if 't' in compact:
+            compact['t'] = TYPE_TAGS.get(compact['t'], compact['t'])
+        return compact
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        expanded = {FIELD_NAMES.get(key, key): _expand(item) for key, item in value.items()}
+        if 'type' in expanded:
+            expanded['type'] = TYPE_NAMES.get(expanded['type'], expanded['type'])
+        return expanded
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def available_subprotocols():
+    return [MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL] if msgpack else [JSON_SUBPROTOCOL]
+
+
+def negotiate(requested):
+    """Sceglie il sottoprotocollo tra quelli proposti dal client (None = JSON senza negoziazione)."""
+    for subprotocol in available_subprotocols():
+        if subprotocol in (requested or []):
+            return subprotocol
+    return None
+
+
+def encode(payload, subprotocol=None):
+    """Restituisce il frame pronto per il socket: str per JSON, bytes per MessagePack."""
+    if subprotocol == MSGPACK_SUBPROTOCOL:
+        return msgpack.packb(_compact(payload), use_bin_type=True)
+    return json.dumps(payload)
+
+
+def encode_frames(payload):
+    """
+    Codifica un broadcast una sola volta per ogni formato disponibile: i consumer
+    della stanza inviano il frame già pronto invece di serializzare per socket.
+    """
+    frames = {JSON_SUBPROTOCOL: json.dumps(payload)}
+    if msgpack:
+        frames[MSGPACK_SUBPROTOCOL] = msgpack.packb(_compact(payload), use_bin_type=True)
+    return frames
+
+
+class InvalidFrame(ValueError):
+    """Frame in ingresso che non è un messaggio (oggetto JSON o mappa MessagePack)."""
+
+
+def decode(text_data=None, bytes_data=None):
+    try:
+        if bytes_data is not None:
+            if msgpack is None:
+                raise InvalidFrame('Formato binario non supportato')
+            payload = _expand(msgpack.unpackb(bytes_data, raw=False))
+        else:
+            payload = json.loads(text_data)
+    except InvalidFrame:
+        raise
+    except Exception as e:
+        # msgpack solleva eccezioni diverse a seconda dell'errore (dati troncati, extra, tipi)
+        raise InvalidFrame(str(e)) from e
+    if not isinstance(payload, dict):
+        raise InvalidFrame('Il messaggio deve essere un oggetto')
+    return payload
+
+
+class WireProtocolMixin:
+    """
+    Negoziazione del formato e invio dei frame per i consumer WebSocket.
+    I frame passano da una coda limitata (WEBSOCKET_OUTBOUND_QUEUE_SIZE, 0 per
+    inviarli direttamente), svuotata solo quando il trasporto accetta dati: un
+    client lento perde i frame più vecchi della stanza e, oltre
+    WEBSOCKET_MAX_DROPPED, viene disconnesso. I messaggi diretti a questo
+    client (send_message) non vengono mai scartati. Un frame in ingresso non
+    decodificabile chiude il socket con INVALID_FRAME_CLOSE_CODE.
+    """
+    subprotocol = None
+    outbound = None
+
+    async def accept_with_subprotocol(self):
+        self.subprotocol = negotiate(self.scope.get('subprotocols'))
+        await self.accept(subprotocol=self.subprotocol)
+
+    async def write_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def send_frame(self, frame, coalesce=None, private=False):
+        size = getattr(settings, 'WEBSOCKET_OUTBOUND_QUEUE_SIZE', 100)
+        if not size:
+            await self.write_frame(frame)
+            return
+        if self.outbound is None:
+            self.outbound = OutboundQueue(
+                self.write_frame,
+                size,
+                getattr(settings, 'WEBSOCKET_MAX_DROPPED', 200),
+                self.close_slow_consumer,
+                TransportPressure.attach(self.base_send),
+            )
+        self.outbound.put(frame, coalesce, private)
+
+    def close_slow_consumer(self):
+        # 4008: policy violation, il client può riconnettersi e chiedere il replay
+        asyncio.get_running_loop().create_task(self.close(code=4008))
+
+    async def send_message(self, payload, coalesce=None):
+        # Risposte a questo client (esito delle offerte, snapshot, cronologia)
+        await self.send_frame(encode(payload, self.subprotocol), coalesce, private=True)
+
+    async def send_frames(self, frames, coalesce=None, private=False):
+        await self.send_frame(frames.get(self.subprotocol) or frames[JSON_SUBPROTOCOL], coalesce, private)
+
+    async def websocket_receive(self, message):
+        try:
+            await super().websocket_receive(message)
+        except InvalidFrame:
+            await self.close(code=INVALID_FRAME_CLOSE_CODE)
+
+    async def websocket_disconnect(self, message):
+        if self.outbound is not None:
+            self.outbound.close()
+        await super().websocket_disconnect(message)
+
+    def decode_message(self, text_data=None, bytes_data=None):
+        return decode(text_data, bytes_data)
@@ -1,7 +1,10 @@
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
+from django.db.models import F
 from django.utils import timezone
+from core import counters
+from trending import engine as trending
 
 class Event(models.Model):
     class Status(models.TextChoices):
@@ -20,6 +23,7 @@ class Event(models.Model):
     
     # Media e promozione
     cover_image = models.ImageField(_('Immagine Copertina'), upload_to='events/covers/')
+    cover_image_renditions = models.JSONField(_('Varianti Copertina'), default=dict, blank=True, editable=False)
     promo_video = models.URLField(_('Video Promo'), blank=True)
     gallery = models.ManyToManyField('media.Media', blank=True, related_name='events')
     
@@ -90,13 +94,15 @@ class Event(models.Model):
         return True
 
     def increment_views(self):
-        self.views_count += 1
-        self.save()
+        # Scrittura differita e in blocco, senza salvare l'intera riga
+        counters.increment(self, 'views_count')
+        trending.record(trending.Content.EVENT, self.pk, trending.Action.VIEW)
 
     def increment_registrations(self):
+        # Serve subito per i posti disponibili: UPDATE atomico immediato
+        Event.objects.filter(pk=self.pk).update(registered_count=F('registered_count') + 1)
         self.registered_count += 1
-        self.save()
 
     def increment_check_ins(self):
+        Event.objects.filter(pk=self.pk).update(checked_in_count=F('checked_in_count') + 1)
         self.checked_in_count += 1
-        self.save()
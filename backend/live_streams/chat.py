@@ -0,0 +1,195 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import partial
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from core import metrics
+from core.batching import BulkWriter
+from core.ringbuffer import CacheRingBuffer
+from core.wire import encode_frames
+from .models import ChatMessage
+from . import timeseries
+
+logger = logging.getLogger(__name__)
+
+# La cronologia della chat scade se la stanza resta senza messaggi
+HISTORY_TIMEOUT = 60 * 60
+
+_writer = None
+
+
+def seq_key(stream_id):
+    return f'live_chat_seq_{stream_id}'
+
+
+def message_data(row):
+    return {
+        'seq': row.offset,
+        'user_id': row.user_id,
+        'username': row.username,
+        'message': row.message,
+        'time': int(row.created_at.timestamp() * 1000),
+    }
+
+
+def load_recent_messages(stream_id, size):
+    rows = ChatMessage.objects.filter(stream_id=stream_id).order_by('-offset')[:size]
+    return [message_data(row) for row in reversed(rows)]
+
+
+def chat_history(stream_id):
+    size = getattr(settings, 'LIVE_CHAT_HISTORY_SIZE', 50)
+    return CacheRingBuffer(
+        f'live_chat_{stream_id}',
+        size,
+        loader=partial(load_recent_messages, stream_id),
+        timeout=HISTORY_TIMEOUT,
+    )
+
+
+class ChatWriter(BulkWriter):
+    """
+    Scrittura in blocco dei messaggi. Una posizione già salvata (contatore in
+    cache ripartito da un valore vecchio) non scarta il messaggio: riceve una
+    posizione libera dopo l'ultima della live, il contatore viene portato
+    avanti e il conflitto è contato in `<name>.conflicts`.
+    """
+    attempts = 3
+
+    def insert(self, batch):
+        for attempt in range(1, self.attempts + 1):
+            self.reassign_taken(batch)
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.bulk_create(batch, batch_size=self.batch_size)
+                return
+            except IntegrityError:
+                # Posizioni occupate da un altro processo dopo il controllo
+                if attempt == self.attempts:
+                    raise
+
+    def reassign_taken(self, batch):
+        by_stream = defaultdict(list)
+        for message in batch:
+            by_stream[message.stream_id].append(message)
+        for stream_id, messages in by_stream.items():
+            taken = set(ChatMessage.objects.filter(
+                stream_id=stream_id, offset__in=[message.offset for message in messages]
+            ).values_list('offset', flat=True))
+            conflicting = []
+            for message in messages:
+                if message.offset in taken:
+                    conflicting.append(message)
+                else:
+                    taken.add(message.offset)
+            if not conflicting:
+                continue
+            last = max(last_saved_offset(stream_id), *taken)
+            for message in conflicting:
+                last += 1
+                logger.warning(
+                    "Posizione %s della chat della live %s già occupata: messaggio salvato come %s",
+                    message.offset, stream_id, last,
+                )
+                message.offset = last
+            metrics.incr(f'{self.name}.conflicts', len(conflicting))
+            if (cache.get(seq_key(stream_id)) or 0) < last:
+                cache.set(seq_key(stream_id), last, timeout=None)
+
+
+def chat_writer():
+    global _writer
+    if _writer is None:
+        _writer = ChatWriter(
+            'live_chat',
+            ChatMessage,
+            batch_size=getattr(settings, 'LIVE_CHAT_WRITE_BATCH', 500),
+            interval=getattr(settings, 'LIVE_CHAT_WRITE_INTERVAL', 1.0),
+            max_pending=getattr(settings, 'LIVE_CHAT_WRITE_MAX_PENDING', 10000),
+        )
+    return _writer
+
+
+def last_saved_offset(stream_id):
+    return ChatMessage.objects.filter(stream_id=stream_id).aggregate(last=Max('offset'))['last'] or 0
+
+
+@database_sync_to_async
+def last_offset(stream_id):
+    return last_saved_offset(stream_id)
+
+
+async def next_offsets(stream_id, count):
+    """Riserva `count` posizioni consecutive con un solo incremento del contatore condiviso."""
+    if await cache.aget(seq_key(stream_id)) is None:
+        # Contatore perso (o live nuova): riparte dall'ultima posizione salvata
+        await cache.aadd(seq_key(stream_id), await last_offset(stream_id), timeout=None)
+    last = await cache.aincr(seq_key(stream_id), count)
+    return range(last - count + 1, last + 1)
+
+
+def persist(stream_id, messages):
+    """Accoda i messaggi per la scrittura in blocco, senza attendere il database."""
+    writer = chat_writer()
+    for message in messages:
+        writer.put(ChatMessage(
+            stream_id=stream_id,
+            offset=message['seq'],
+            user_id=message.get('user_id'),
+            username=message.get('username') or '',
+            message=message['message'],
+            created_at=datetime.fromtimestamp(message['time'] / 1000, tz=dt_timezone.utc),
+        ))
+
+
+def clean_text(payload):
+    """Testo del messaggio, o None se non è una stringa non vuota entro LIVE_CHAT_MAX_LENGTH."""
+    text = payload.get('message')
+    if not isinstance(text, str):
+        return None
+    text = text.strip()
+    if not text or len(text) > getattr(settings, 'LIVE_CHAT_MAX_LENGTH', 500):
+        return None
+    return text
+
+
+def build_message(text, user=None):
+    """
+    Messaggio di chat accodato per il prossimo tick (la sequenza è assegnata
+    all'invio). L'autore è l'utente della sessione, mai un nome scelto dal client.
+    """
+    authenticated = user is not None and user.is_authenticated
+    return {
+        'user_id': user.pk if authenticated else None,
+        'username': user.username if authenticated else None,
+        'message': text,
+        'time': int(time.time() * 1000),
+    }
+
+
+def merge_messages(pending, message):
+    # I messaggi dello stesso tick vengono inviati tutti, in ordine di arrivo
+    return {**pending, 'messages': pending['messages'] + message['messages']}
+
+
+async def prepare_batch(batch):
+    """
+    Eseguita una volta per tick e per stanza: numera i messaggi, li accoda per
+    il salvataggio, li aggiunge alla cronologia e codifica il frame unico
+    inviato a tutti i socket della stanza.
+    """
+    stream_id, messages = batch['stream_id'], batch['messages']
+    for offset, message in zip(await next_offsets(stream_id, len(messages)), messages):
+        message['seq'] = offset
+    persist(stream_id, messages)
+    await timeseries.record(stream_id, 'chat', len(messages))
+    await database_sync_to_async(chat_history(stream_id).extend)(messages)
+    return {
+        'type': 'chat_batch',
+        'frames': encode_frames({'type': 'chat_batch', 'messages': messages}),
+    }
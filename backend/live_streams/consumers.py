@@ -1,10 +1,53 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
+from django.conf import settings
+from core import groups
+from core.broadcast import get_broadcaster
+from core.heartbeat import get_heartbeat
+from core.throttling import ThrottleMixin
+from core.wire import WireProtocolMixin, encode_frames
+from trending import engine as trending
 from .models import LiveStream
+from . import chat, presence, timeseries
 from django.utils import timezone
 
-class LiveStreamConsumer(AsyncWebsocketConsumer):
+
+@database_sync_to_async
+def load_stream_status(stream_id):
+    try:
+        stream = LiveStream.objects.get(id=stream_id)
+    except LiveStream.DoesNotExist:
+        return None
+    duration = None
+    if stream.started_at:
+        duration = (timezone.now() - stream.started_at).total_seconds()
+    return {
+        'status': stream.status,
+        'duration': duration
+    }
+
+
+async def stream_status(stream_id):
+    status = await load_stream_status(stream_id)
+    if status:
+        status['viewers'] = await presence.viewer_count(stream_id)
+    return status
+
+
+async def status_heartbeat(stream_id):
+    # Stato periodico della stanza, inviato dal solo processo leader
+    status = await stream_status(stream_id)
+    if status:
+        return {
+            'type': 'stream_status',
+            'frames': encode_frames({'type': 'stream_status', **status}),
+        }
+
+
+class LiveStreamConsumer(ThrottleMixin, WireProtocolMixin, AsyncWebsocketConsumer):
+    joined = False
+
     async def connect(self):
         self.stream_id = self.scope['url_route']['kwargs']['stream_id']
         self.room_group_name = f'live_{self.stream_id}'
@@ -12,59 +55,76 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
         # Verifica che la live esista e sia attiva
         if await self.is_valid_stream():
             # Unisciti al gruppo
-            await self.channel_layer.group_add(
+            await groups.group_add(
+                self.channel_layer,
                 self.room_group_name,
                 self.channel_name
             )
-            await self.accept()
+            await self.accept_with_subprotocol()
+            # Il numero di spettatori è dato dai socket connessi
+            await presence.viewer_joined(self.stream_id)
+            self.joined = True
+            await sync_to_async(trending.record)(trending.Content.STREAM, int(self.stream_id), trending.Action.VIEW)
             
-            # Invia stato iniziale
+            # Stato iniziale e ultimi messaggi della chat solo a questo socket:
+            # gli altri ricevono lo stato aggiornato con l'heartbeat della stanza
             await self.send_stream_status()
+            await self.send_chat_history()
+            self.heartbeat().join(self.room_group_name, self.stream_id)
+            self.metrics_collector().join(self.room_group_name, self.stream_id)
         else:
             await self.close()
 
     async def disconnect(self, close_code):
+        if self.joined:
+            await presence.viewer_left(self.stream_id)
+            await self.heartbeat().leave(self.room_group_name)
+            await self.metrics_collector().leave(self.room_group_name)
+            self.joined = False
         # Rimuovi dal gruppo
-        await self.channel_layer.group_discard(
+        await groups.group_discard(
+            self.channel_layer,
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode_message(text_data, bytes_data)
         message_type = text_data_json.get('type')
+        if not self.allow_message(message_type, text_data_json):
+            # Messaggi oltre il limite scartati senza risposta
+            return
         
-        if message_type == 'viewer_count':
-            # Aggiorna il conteggio spettatori
-            count = text_data_json.get('count', 0)
-            await self.update_viewer_count(count)
-        elif message_type == 'chat_message':
-            # Inoltra il messaggio della chat
-            await self.channel_layer.group_send(
+        # I messaggi 'viewer_count' dei client sono ignorati: il conteggio
+        # è calcolato dal server in presence
+        if message_type == 'chat_message':
+            text = chat.clean_text(text_data_json)
+            if text is None:
+                await self.send_message({
+                    'type': 'chat_error',
+                    'message': f"Messaggio non valido (testo di al massimo {getattr(settings, 'LIVE_CHAT_MAX_LENGTH', 500)} caratteri)",
+                })
+                return
+            # I messaggi della stanza sono accorpati in un frame per tick
+            broadcaster = get_broadcaster(self.channel_layer, getattr(settings, 'LIVE_CHAT_BROADCAST_TICK', 0.1))
+            await broadcaster.publish(
                 self.room_group_name,
                 {
-                    'type': 'chat_message',
-                    'message': text_data_json.get('message'),
-                    'username': text_data_json.get('username')
-                }
+                    'type': 'chat_batch',
+                    'stream_id': self.stream_id,
+                    'messages': [chat.build_message(text, self.scope.get('user'))],
+                },
+                merge=chat.merge_messages,
+                prepare=chat.prepare_batch,
             )
 
-    async def chat_message(self, event):
-        # Invia il messaggio della chat al WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'username': event['username']
-        }))
+    async def chat_batch(self, event):
+        # Invia i messaggi della chat accorpati al WebSocket
+        await self.send_frames(event['frames'])
 
     async def stream_status(self, event):
-        # Invia aggiornamenti dello stato della live
-        await self.send(text_data=json.dumps({
-            'type': 'stream_status',
-            'status': event['status'],
-            'viewers': event['viewers'],
-            'duration': event['duration']
-        }))
+        # Invia aggiornamenti dello stato della live: in coda conta solo l'ultimo
+        await self.send_frames(event['frames'], coalesce='stream_status')
 
     @database_sync_to_async
     def is_valid_stream(self):
@@ -74,40 +134,25 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
         except LiveStream.DoesNotExist:
             return False
 
-    @database_sync_to_async
-    def update_viewer_count(self, count):
-        try:
-            stream = LiveStream.objects.get(id=self.stream_id)
-            stream.update_viewers(count)
-            return True
-        except LiveStream.DoesNotExist:
-            return False
+    def heartbeat(self):
+        interval = getattr(settings, 'WEBSOCKET_HEARTBEAT_INTERVAL', 5)
+        return get_heartbeat('live', self.channel_layer, interval, status_heartbeat)
+
+    def metrics_collector(self):
+        # Stesso meccanismo di leader dell'heartbeat: un solo worker per live
+        # scrive il bucket di ogni secondo, senza inviare messaggi
+        return get_heartbeat('live_metrics', self.channel_layer, 1, timeseries.collect)
 
     @database_sync_to_async
-    def get_stream_status(self):
-        try:
-            stream = LiveStream.objects.get(id=self.stream_id)
-            duration = None
-            if stream.started_at:
-                duration = (timezone.now() - stream.started_at).total_seconds()
-            
-            return {
-                'status': stream.status,
-                'viewers': stream.viewers_count,
-                'duration': duration
-            }
-        except LiveStream.DoesNotExist:
-            return None
+    def get_chat_history(self):
+        return chat.chat_history(self.stream_id).items()
+
+    async def send_chat_history(self):
+        messages = await self.get_chat_history()
+        if messages:
+            await self.send_message({'type': 'chat_history', 'messages': messages})
 
     async def send_stream_status(self):
-        status = await self.get_stream_status()
+        status = await stream_status(self.stream_id)
         if status:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'stream_status',
-                    'status': status['status'],
-                    'viewers': status['viewers'],
-                    'duration': status['duration']
-                }
-            ) 
\ No newline at end of file
+            await self.send_message({'type': 'stream_status', **status}) 
\ No newline at end of file
@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from live_streams.models import LiveStream, StreamMetricBucket
+from live_streams.timeseries import downsample_stream
+
+
+class Command(BaseCommand):
+    help = 'Accorpa in bucket al minuto e all\'ora le metriche al secondo delle live concluse'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=60,
+            help='Secondi di attesa dopo la fine della live, per gli ultimi bucket ancora in scrittura',
+        )
+
+    def handle(self, *args, **options):
+        ended_before = timezone.now() - timedelta(seconds=options['grace'])
+        stream_ids = (
+            LiveStream.objects
+            .exclude(status=LiveStream.Status.LIVE)
+            .filter(metric_buckets__resolution=StreamMetricBucket.Resolution.SECOND)
+            .exclude(ended_at__gt=ended_before)
+            .values_list('id', flat=True)
+            .distinct()
+        )
+        for stream_id in stream_ids:
+            count = downsample_stream(stream_id)
+            self.stdout.write(f'Live {stream_id}: accorpati {count} bucket al secondo')
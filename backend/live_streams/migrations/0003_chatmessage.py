@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('live_streams', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.PositiveBigIntegerField(verbose_name='Posizione')),
+                ('username', models.CharField(blank=True, max_length=150, verbose_name='Nome Utente')),
+                ('message', models.TextField(verbose_name='Messaggio')),
+                ('created_at', models.DateTimeField(verbose_name='Data Invio')),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='live_streams.livestream')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Messaggio Chat',
+                'verbose_name_plural': 'Messaggi Chat',
+                'ordering': ['stream', 'offset'],
+                'indexes': [models.Index(fields=['stream', 'offset'], name='live_stream_stream__3e4e2e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('live_streams', '0003_chatmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamMetricBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(1, 'Secondo'), (60, 'Minuto'), (3600, 'Ora')], verbose_name='Risoluzione')),
+                ('start', models.DateTimeField(verbose_name='Inizio')),
+                ('viewers', models.PositiveIntegerField(default=0, verbose_name='Spettatori (media)')),
+                ('peak_viewers', models.PositiveIntegerField(default=0, verbose_name='Picco Spettatori')),
+                ('chat_messages', models.PositiveIntegerField(default=0, verbose_name='Messaggi Chat')),
+                ('bids', models.PositiveIntegerField(default=0, verbose_name='Offerte')),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_buckets', to='live_streams.livestream')),
+            ],
+            options={
+                'verbose_name': 'Metrica Live',
+                'verbose_name_plural': 'Metriche Live',
+                'ordering': ['stream', 'resolution', 'start'],
+                'constraints': [models.UniqueConstraint(fields=('stream', 'resolution', 'start'), name='unique_stream_metric_bucket')],
+            },
+        ),
+    ]
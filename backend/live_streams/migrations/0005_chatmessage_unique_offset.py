@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_offsets(apps, schema_editor):
+    # Di ogni posizione ripetuta resta il primo messaggio salvato
+    ChatMessage = apps.get_model('live_streams', 'ChatMessage')
+    duplicates = (
+        ChatMessage.objects.values('stream_id', 'offset')
+        .annotate(count=Count('id'), first=Min('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        ChatMessage.objects.filter(stream_id=duplicate['stream_id'], offset=duplicate['offset']) \
+            .exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('live_streams', '0004_streammetricbucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_offsets, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='live_stream_stream__3e4e2e_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('stream', 'offset'), name='unique_chat_message_offset'),
+        ),
+    ]
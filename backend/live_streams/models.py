@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -57,11 +59,20 @@ class LiveStream(models.Model):
             if self.started_at:
                 self.duration = self.ended_at - self.started_at
             self.save()
+            self.compact_metrics()
 
     def cancel(self):
         if self.status in [self.Status.SCHEDULED, self.Status.LIVE]:
+            was_live = self.status == self.Status.LIVE
             self.status = self.Status.CANCELLED
             self.save()
+            if was_live:
+                self.compact_metrics()
+
+    def compact_metrics(self):
+        # Metriche al secondo accorpate poco dopo la fine della diretta
+        from .timeseries import compact_later
+        transaction.on_commit(lambda: compact_later(self.pk))
 
     @property
     def is_active(self):
@@ -72,7 +83,67 @@ class LiveStream(models.Model):
         return bool(self.video_url)
 
     def update_viewers(self, count):
+        # Aggiorna solo i contatori, con il picco calcolato dal database
+        LiveStream.objects.filter(pk=self.pk).update(
+            viewers_count=count,
+            peak_viewers=Greatest(F('peak_viewers'), count),
+        )
         self.viewers_count = count
         if count > self.peak_viewers:
             self.peak_viewers = count
-        self.save()
+
+
+class ChatMessage(models.Model):
+    """
+    Messaggio della chat di una live, salvato in blocco dopo l'invio.
+    `offset` è la posizione del messaggio nella chat della live e permette
+    di rileggerla da un punto qualsiasi (replay, moderazione).
+    """
+    stream = models.ForeignKey(LiveStream, on_delete=models.CASCADE, related_name='chat_messages')
+    offset = models.PositiveBigIntegerField(_('Posizione'))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='chat_messages')
+    username = models.CharField(_('Nome Utente'), max_length=150, blank=True)
+    message = models.TextField(_('Messaggio'))
+    created_at = models.DateTimeField(_('Data Invio'))
+
+    class Meta:
+        verbose_name = _('Messaggio Chat')
+        verbose_name_plural = _('Messaggi Chat')
+        ordering = ['stream', 'offset']
+        constraints = [
+            # Un solo messaggio per posizione: la lettura da un offset non salta né ripete
+            models.UniqueConstraint(fields=['stream', 'offset'], name='unique_chat_message_offset'),
+        ]
+
+    def __str__(self):
+        return f"{self.username}: {self.message[:50]}"
+
+
+class StreamMetricBucket(models.Model):
+    """
+    Serie temporale di una live: un bucket al secondo durante la diretta,
+    accorpato in bucket al minuto e all'ora quando la live è conclusa.
+    """
+    class Resolution(models.IntegerChoices):
+        SECOND = 1, _('Secondo')
+        MINUTE = 60, _('Minuto')
+        HOUR = 3600, _('Ora')
+
+    stream = models.ForeignKey(LiveStream, on_delete=models.CASCADE, related_name='metric_buckets')
+    resolution = models.PositiveIntegerField(_('Risoluzione'), choices=Resolution.choices)
+    start = models.DateTimeField(_('Inizio'))
+    viewers = models.PositiveIntegerField(_('Spettatori (media)'), default=0)
+    peak_viewers = models.PositiveIntegerField(_('Picco Spettatori'), default=0)
+    chat_messages = models.PositiveIntegerField(_('Messaggi Chat'), default=0)
+    bids = models.PositiveIntegerField(_('Offerte'), default=0)
+
+    class Meta:
+        verbose_name = _('Metrica Live')
+        verbose_name_plural = _('Metriche Live')
+        ordering = ['stream', 'resolution', 'start']
+        constraints = [
+            models.UniqueConstraint(fields=['stream', 'resolution', 'start'], name='unique_stream_metric_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.stream_id} {self.get_resolution_display()} {self.start}"
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import uuid
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Greatest
+from core.sharedcache import require_shared_cache
+from .models import LiveStream
+
+logger = logging.getLogger(__name__)
+
+# Socket aperti in questo processo per stream e stream da salvare al prossimo flush
+_local_streams = {}
+_dirty = set()
+_flusher = None
+# Identità del processo e slot occupato tra quelli dei worker
+_token = uuid.uuid4().hex
+_slot = None
+
+
+def viewers_key(stream_id, slot):
+    return f'live_viewers_{stream_id}_{slot}'
+
+
+def peak_key(stream_id):
+    return f'live_peak_{stream_id}'
+
+
+def slot_key(slot):
+    return f'live_worker_{slot}'
+
+
+def flush_interval():
+    return getattr(settings, 'LIVE_VIEWERS_FLUSH_INTERVAL', 10)
+
+
+def max_workers():
+    return getattr(settings, 'LIVE_VIEWERS_MAX_WORKERS', 64)
+
+
+def contribution_timeout():
+    # Il flusher rinnova ogni intervallo: un processo caduto sparisce dal conteggio
+    # dopo al più tre intervalli
+    return flush_interval() * 3
+
+
+async def worker_slot():
+    """
+    Slot del processo tra LIVE_VIEWERS_MAX_WORKERS, preso con cache.add e
+    rinnovato dal flusher. Gli spettatori di una live sono la somma dei
+    contributi degli slot, ognuno con scadenza: nessun decremento perso.
+    """
+    global _slot
+    if _slot is not None:
+        return _slot
+    require_shared_cache("La presenza nelle live")
+    slots = [slot_key(slot) for slot in range(max_workers())]
+    taken = await cache.aget_many(slots)
+    for slot, key in enumerate(slots):
+        if key not in taken and await cache.aadd(key, _token, timeout=contribution_timeout()):
+            _slot = slot
+            return slot
+    raise RuntimeError(f"Nessuno slot libero per la presenza: aumenta LIVE_VIEWERS_MAX_WORKERS ({max_workers()})")
+
+
+async def publish(stream_id):
+    """Scrive il numero di socket di questo processo per lo stream."""
+    key = viewers_key(stream_id, await worker_slot())
+    local = _local_streams.get(stream_id, 0)
+    if local:
+        await cache.aset(key, local, timeout=contribution_timeout())
+    else:
+        await cache.adelete(key)
+
+
+async def refresh():
+    """Rinnova lo slot e i contributi del processo prima che scadano."""
+    global _slot
+    if _slot is not None and await cache.aget(slot_key(_slot)) != _token:
+        # Slot scaduto (processo bloccato) e forse preso da un altro: se ne cerca uno nuovo
+        logger.warning("Slot %s della presenza perso, nuova registrazione", _slot)
+        _slot = None
+    slot = await worker_slot()
+    await cache.atouch(slot_key(slot), contribution_timeout())
+    for stream_id in list(_local_streams):
+        await publish(stream_id)
+
+
+async def viewer_joined(stream_id):
+    """
+    Registra un socket connesso nel contributo del processo e restituisce il
+    numero di spettatori, sommato su tutti i worker.
+    """
+    _local_streams[stream_id] = _local_streams.get(stream_id, 0) + 1
+    await publish(stream_id)
+    count = await viewer_count(stream_id)
+    # Il picco è indicativo: viene consolidato con GREATEST in fase di flush
+    if count > (await cache.aget(peak_key(stream_id)) or 0):
+        await cache.aset(peak_key(stream_id), count, timeout=None)
+
+    _dirty.add(stream_id)
+    ensure_flusher()
+    return count
+
+
+async def viewer_left(stream_id):
+    remaining = _local_streams.get(stream_id, 0) - 1
+    if remaining > 0:
+        _local_streams[stream_id] = remaining
+    else:
+        _local_streams.pop(stream_id, None)
+    await publish(stream_id)
+    _dirty.add(stream_id)
+    return await viewer_count(stream_id)
+
+
+async def viewer_count(stream_id):
+    contributions = await cache.aget_many([viewers_key(stream_id, slot) for slot in range(max_workers())])
+    return sum(contributions.values())
+
+
+@database_sync_to_async
+def flush_stream(stream_id, count, peak):
+    # Un solo UPDATE sui due campi, senza leggere né riscrivere la riga
+    LiveStream.objects.filter(pk=stream_id).update(
+        viewers_count=count,
+        peak_viewers=Greatest(F('peak_viewers'), max(count, peak or 0)),
+    )
+
+
+async def flush(interval):
+    for stream_id in list(_dirty):
+        # Con più worker basta che uno solo scriva per ogni intervallo;
+        # gli altri riprovano al giro successivo
+        if not await cache.aadd(f'live_viewers_flush_{stream_id}', 1, timeout=interval):
+            continue
+        count = await viewer_count(stream_id)
+        try:
+            await flush_stream(stream_id, count, await cache.aget(peak_key(stream_id)))
+            _dirty.discard(stream_id)
+        except Exception:
+            logger.exception("Aggiornamento spettatori fallito per lo stream %s", stream_id)
+
+
+async def run_flusher():
+    interval = flush_interval()
+    while _local_streams or _dirty:
+        await asyncio.sleep(interval)
+        try:
+            await refresh()
+        except Exception:
+            logger.exception("Rinnovo della presenza fallito")
+        await flush(interval)
+
+
+def ensure_flusher():
+    """Avvia nel loop corrente il task che salva periodicamente i contatori."""
+    global _flusher
+    if _flusher is None or _flusher.done() or _flusher.get_loop() is not asyncio.get_running_loop():
+        _flusher = asyncio.get_running_loop().create_task(run_flusher())
@@ -0,0 +1,9 @@
+from rest_framework import serializers
+from .models import ChatMessage
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChatMessage
+        fields = ['offset', 'user', 'username', 'message', 'created_at']
+        read_only_fields = fields
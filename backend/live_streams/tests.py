@@ -1,3 +1,289 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import re_path
+from django.utils import timezone
+from core import metrics
+from users.models import User
+from . import chat, presence, timeseries
+from .consumers import LiveStreamConsumer
+from .models import ChatMessage, LiveStream, StreamMetricBucket
 
-# Create your tests here.
+
+class WorkerState:
+    """Stato di presence di un processo simulato (token, slot, socket locali)."""
+
+    def __init__(self):
+        self.token = presence.uuid.uuid4().hex
+        self.slot = None
+        self.streams = {}
+
+    async def run(self, coroutine_function, *args):
+        with mock.patch.multiple(presence, _token=self.token, _slot=self.slot, _local_streams=self.streams):
+            try:
+                return await coroutine_function(*args)
+            finally:
+                self.slot = presence._slot
+
+
+@override_settings(LIVE_VIEWERS_FLUSH_INTERVAL=0.1, LIVE_VIEWERS_MAX_WORKERS=4)
+@mock.patch.object(presence, 'ensure_flusher')
+class PresenceTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_viewers_are_summed_across_workers(self, ensure_flusher):
+        first, second = WorkerState(), WorkerState()
+        self.assertEqual(await first.run(presence.viewer_joined, '1'), 1)
+        self.assertEqual(await first.run(presence.viewer_joined, '1'), 2)
+        self.assertEqual(await second.run(presence.viewer_joined, '1'), 3)
+        self.assertNotEqual(first.slot, second.slot)
+        self.assertEqual(await first.run(presence.viewer_left, '1'), 2)
+        self.assertEqual(await presence.viewer_count('1'), 2)
+        self.assertEqual(await presence.viewer_count('2'), 0)
+
+    async def test_crashed_worker_expires_from_the_count(self, ensure_flusher):
+        crashed, alive = WorkerState(), WorkerState()
+        await crashed.run(presence.viewer_joined, '1')
+        await crashed.run(presence.viewer_joined, '1')
+        await alive.run(presence.viewer_joined, '1')
+        # Solo il processo vivo rinnova il proprio contributo
+        for _ in range(5):
+            await asyncio.sleep(0.1)
+            await alive.run(presence.refresh)
+        self.assertEqual(await presence.viewer_count('1'), 1)
+        # Lo slot del processo caduto torna libero
+        newcomer = WorkerState()
+        await newcomer.run(presence.viewer_joined, '1')
+        self.assertEqual(newcomer.slot, crashed.slot)
+        self.assertEqual(await presence.viewer_count('1'), 2)
+
+    async def test_lost_slot_is_claimed_again(self, ensure_flusher):
+        worker = WorkerState()
+        await worker.run(presence.viewer_joined, '1')
+        lost = worker.slot
+        # Processo bloccato oltre la scadenza: slot e contributo scadono, un altro prende lo slot
+        await cache.adelete(presence.viewers_key('1', lost))
+        await cache.aset(presence.slot_key(lost), 'another-process')
+        await worker.run(presence.refresh)
+        self.assertNotEqual(worker.slot, lost)
+        self.assertEqual(await cache.aget(presence.slot_key(worker.slot)), worker.token)
+        self.assertEqual(await presence.viewer_count('1'), 1)
+
+    @override_settings(
+        LOCAL_CACHE=False,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    async def test_process_local_cache_is_refused(self, ensure_flusher):
+        with self.assertRaises(ImproperlyConfigured):
+            await WorkerState().run(presence.viewer_joined, '1')
+
+
+def create_stream(**fields):
+    artist = User.objects.create_user(f'artist{User.objects.count()}', password='password')
+    return LiveStream.objects.create(title='Live', artist=artist, scheduled_start=timezone.now(), **fields)
+
+
+class MetricsCollectTests(SimpleTestCase):
+    """Raccolta dei contatori al secondo da parte del leader della stanza."""
+
+    def setUp(self):
+        cache.clear()
+        self.buckets = []
+        writer = mock.Mock(put=self.buckets.append)
+        for patcher in (
+            mock.patch.object(timeseries, 'metrics_writer', return_value=writer),
+            mock.patch.object(presence, 'viewer_count', mock.AsyncMock(return_value=7)),
+            mock.patch.object(timeseries, 'is_live', mock.AsyncMock(return_value=True)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def at(self, second, coroutine_function, *args):
+        with mock.patch.object(timeseries.time, 'time', return_value=second + 0.5):
+            return await coroutine_function(*args)
+
+    def written(self):
+        rows = [(int(b.start.timestamp()), b.viewers, b.chat_messages, b.bids) for b in self.buckets]
+        self.buckets.clear()
+        return rows
+
+    async def test_late_increments_are_written_as_deltas(self):
+        await self.at(1000, timeseries.collect, 1)
+        self.written()
+        await self.at(1000, timeseries.record, 1, 'chat', 2)
+        await self.at(1001, timeseries.collect, 1)
+        self.assertEqual(self.written(), [(1000, 7, 2, 0)])
+        # Incremento arrivato dopo la raccolta del suo secondo (orologio indietro)
+        await self.at(1000, timeseries.record, 1, 'chat', 1)
+        await self.at(1000, timeseries.record, 1, 'bids', 1)
+        await self.at(1002, timeseries.collect, 1)
+        self.assertEqual(self.written(), [(1000, 0, 1, 1), (1001, 7, 0, 0)])
+        # Nulla viene contato due volte
+        await self.at(1003, timeseries.collect, 1)
+        self.assertEqual(self.written(), [(1002, 7, 0, 0)])
+
+    async def test_nothing_is_collected_once_the_stream_is_over(self):
+        await self.at(1000, timeseries.collect, 1)
+        self.written()
+        await self.at(1000, timeseries.record, 1, 'chat', 2)
+        timeseries.is_live.return_value = False
+        await self.at(1005, timeseries.collect, 1)
+        self.assertEqual(self.written(), [])
+
+
+class MetricsStorageTests(TestCase):
+    def setUp(self):
+        self.stream = create_stream(status=LiveStream.Status.LIVE)
+
+    def bucket(self, second, viewers, chat, bids=0):
+        return StreamMetricBucket(
+            stream=self.stream, resolution=StreamMetricBucket.Resolution.SECOND,
+            start=datetime.fromtimestamp(second, tz=dt_timezone.utc),
+            viewers=viewers, peak_viewers=viewers, chat_messages=chat, bids=bids,
+        )
+
+    def test_deltas_are_summed_into_existing_buckets(self):
+        writer = timeseries.DeltaWriter('test_metrics', StreamMetricBucket)
+        writer.insert([self.bucket(1000, 5, 2), self.bucket(1001, 6, 1), self.bucket(1000, 0, 3, 1)])
+        writer.insert([self.bucket(1000, 0, 1)])
+        rows = StreamMetricBucket.objects.order_by('start').values_list('viewers', 'chat_messages', 'bids')
+        self.assertEqual(list(rows), [(5, 6, 1), (6, 1, 0)])
+
+    def test_ending_the_stream_schedules_compaction(self):
+        with mock.patch.object(timeseries, 'compact_later') as compact_later:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.stream.end()
+            compact_later.assert_called_once_with(self.stream.pk)
+
+    def test_compaction_replaces_seconds_with_minutes(self):
+        StreamMetricBucket.objects.bulk_create([self.bucket(600 + i, 4, 1) for i in range(90)])
+        with mock.patch.object(timeseries, 'close_old_connections'):
+            timeseries.compact(self.stream.pk)
+        rows = StreamMetricBucket.objects.values_list('resolution', 'chat_messages')
+        self.assertEqual(sorted(rows), [(60, 30), (60, 60), (3600, 90)])
+
+    def test_second_compaction_adds_to_the_same_minute(self):
+        StreamMetricBucket.objects.bulk_create([self.bucket(600 + i, 4, 1) for i in range(90)])
+        timeseries.downsample_stream(self.stream.pk)
+        # Delta arrivati dopo il primo accorpamento, nel primo minuto e in uno nuovo
+        StreamMetricBucket.objects.bulk_create([self.bucket(610, 0, 2, 1), self.bucket(720, 3, 1)])
+        minute = timeseries.load_series(self.stream.pk, StreamMetricBucket.Resolution.MINUTE)
+        self.assertEqual(minute['chat_messages'].tolist(), [62, 30, 1])
+        self.assertEqual(minute['viewers'].tolist(), [4, 4, 3])
+
+        self.assertEqual(timeseries.downsample_stream(self.stream.pk), 2)
+        rows = StreamMetricBucket.objects.order_by('resolution', 'start').values_list(
+            'resolution', 'viewers', 'chat_messages', 'bids'
+        )
+        self.assertEqual(list(rows), [(60, 4, 62, 1), (60, 4, 30, 0), (60, 3, 1, 0), (3600, 4, 93, 1)])
+        hour = timeseries.load_series(self.stream.pk, StreamMetricBucket.Resolution.HOUR)
+        self.assertEqual(hour['chat_messages'].tolist(), [93])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    LIVE_CHAT_MAX_LENGTH=20,
+)
+class ChatTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.stream = create_stream(status=LiveStream.Status.LIVE, started_at=timezone.now())
+        self.user = User.objects.create_user('alice', password='password')
+
+    async def connect(self, user):
+        application = URLRouter([re_path(r'ws/live/(?P<stream_id>[^/]+)/$', LiveStreamConsumer.as_asgi())])
+        communicator = WebsocketCommunicator(application, f'/ws/live/{self.stream.pk}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await self.receive(communicator, 'stream_status')
+        return communicator
+
+    async def receive(self, communicator, kind):
+        while True:
+            data = json.loads(await communicator.receive_from(timeout=2))
+            if data['type'] == kind:
+                return data
+
+    def test_text_must_be_a_short_string(self):
+        self.assertEqual(chat.clean_text({'message': '  ciao  '}), 'ciao')
+        for message in (None, '', '   ', {'text': 'ciao'}, ['ciao'], 42, 'x' * 21):
+            with self.subTest(message=message):
+                self.assertIsNone(chat.clean_text({'message': message}))
+
+    async def test_author_comes_from_the_session(self):
+        communicator = await self.connect(self.user)
+        await communicator.send_to(text_data=json.dumps({
+            'type': 'chat_message', 'username': 'admin', 'message': 'ciao',
+        }))
+        batch = await self.receive(communicator, 'chat_batch')
+        self.assertEqual(batch['messages'][0]['username'], 'alice')
+        self.assertEqual(batch['messages'][0]['user_id'], self.user.pk)
+        await communicator.disconnect()
+        # Il messaggio salvato ha lo stesso autore
+        await database_sync_to_async(chat.chat_writer().stop)()
+        saved = await ChatMessage.objects.aget(stream=self.stream)
+        self.assertEqual((saved.username, saved.message), ('alice', 'ciao'))
+
+    async def test_invalid_message_is_refused(self):
+        communicator = await self.connect(self.user)
+        for message in ({'text': 'ciao'}, 'x' * 21):
+            await communicator.send_to(text_data=json.dumps({'type': 'chat_message', 'message': message}))
+            self.assertEqual((await self.receive(communicator, 'chat_error'))['type'], 'chat_error')
+        self.assertTrue(await communicator.receive_nothing(0.3))
+        await communicator.disconnect()
+
+
+class ChatOffsetTests(TransactionTestCase):
+    def setUp(self):
+        self.stream = create_stream(status=LiveStream.Status.LIVE)
+
+    def message(self, offset, text='ciao', stream_id=None):
+        return ChatMessage(stream_id=stream_id or self.stream.pk, offset=offset, message=text, created_at=timezone.now())
+
+    def test_offset_is_unique_per_stream(self):
+        self.message(1).save()
+        # La stessa posizione in un'altra live è ammessa
+        self.message(1, stream_id=create_stream().pk).save()
+        with self.assertRaises(IntegrityError):
+            self.message(1).save()
+
+    def test_repeated_offset_is_saved_at_a_free_position(self):
+        cache.clear()
+        metrics.reset()
+        self.message(2, 'primo').save()
+        writer = chat.ChatWriter('test_chat', ChatMessage)
+        with self.assertLogs('live_streams.chat', 'WARNING'):
+            self.assertTrue(writer.write([self.message(1), self.message(2, 'doppio'), self.message(3), self.message(3, 'terzo')]))
+        rows = ChatMessage.objects.filter(stream=self.stream).order_by('offset').values_list('offset', 'message')
+        self.assertEqual(list(rows), [(1, 'ciao'), (2, 'primo'), (3, 'ciao'), (4, 'doppio'), (5, 'terzo')])
+        self.assertEqual((metrics.get('test_chat.written'), metrics.get('test_chat.conflicts')), (4, 2))
+        # Il contatore riparte dopo le posizioni riassegnate
+        self.assertEqual(cache.get(chat.seq_key(self.stream.pk)), 5)
+
+    def test_migration_keeps_the_first_message_of_each_offset(self):
+        executor = MigrationExecutor(connection)
+        before, after = [('live_streams', '0004_streammetricbucket')], [('live_streams', '0005_chatmessage_unique_offset')]
+        executor.migrate(before)
+        try:
+            OldChatMessage = executor.loader.project_state(before).apps.get_model('live_streams', 'ChatMessage')
+            first = OldChatMessage.objects.create(stream_id=self.stream.pk, offset=1, message='primo', created_at=timezone.now())
+            OldChatMessage.objects.create(stream_id=self.stream.pk, offset=1, message='doppio', created_at=timezone.now())
+            OldChatMessage.objects.create(stream_id=self.stream.pk, offset=2, message='ciao', created_at=timezone.now())
+        finally:
+            executor.loader.build_graph()
+            executor.migrate(after)
+        self.assertEqual(
+            list(ChatMessage.objects.values_list('id', 'offset').filter(offset=1)), [(first.pk, 1)]
+        )
+        self.assertEqual(ChatMessage.objects.count(), 2)
@@ -0,0 +1,301 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from core.batching import BulkWriter
+from .models import LiveStream, StreamMetricBucket
+from . import presence
+
+logger = logging.getLogger(__name__)
+
+Resolution = StreamMetricBucket.Resolution
+
+# Colonne della serie, nell'ordine in cui vengono lette dal database
+COLUMNS = ('start', 'viewers', 'peak_viewers', 'chat_messages', 'bids')
+METRIC_FIELDS = COLUMNS[1:]
+
+# I contatori al secondo restano in cache il tempo necessario al leader per leggerli
+COUNTER_TIMEOUT = 5 * 60
+# Secondi recuperati al massimo dopo un cambio di leader
+MAX_CATCH_UP = 60
+# Secondi già raccolti che il leader rilegge: gli incrementi arrivati dopo la
+# raccolta (orologi dei worker non allineati) vanno nel bucket giusto come delta
+LATE_SECONDS = 5
+KINDS = ('chat', 'bids')
+KEY_FIELDS = ('stream', 'resolution', 'start')
+# Metriche che si sommano quando lo stesso bucket viene scritto più volte
+SUMMED_FIELDS = ('chat_messages', 'bids')
+
+_writer = None
+
+
+def counter_key(stream_id, kind, second):
+    return f'live_ts_{kind}_{stream_id}_{second}'
+
+
+def last_second_key(stream_id):
+    return f'live_ts_last_{stream_id}'
+
+
+def upsert_deltas(buckets, batch_size=None):
+    """
+    Scrive i bucket come delta: se il bucket esiste già messaggi e offerte si
+    sommano a quelli salvati, mentre spettatori e picco restano quelli della
+    prima scrittura. INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite).
+    """
+    # Una riga per bucket: lo stesso INSERT non può aggiornarla due volte
+    rows = {}
+    for bucket in buckets:
+        key = (bucket.stream_id, bucket.resolution, bucket.start)
+        if key in rows:
+            for field in SUMMED_FIELDS:
+                setattr(rows[key], field, getattr(rows[key], field) + getattr(bucket, field))
+        else:
+            rows[key] = bucket
+    rows = list(rows.values())
+    if not rows:
+        return
+
+    meta, quote = StreamMetricBucket._meta, connection.ops.quote_name
+    fields = [meta.get_field(name) for name in (*KEY_FIELDS, *METRIC_FIELDS)]
+    table = quote(meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    conflict = ', '.join(quote(field.column) for field in fields[:len(KEY_FIELDS)])
+    summed = ', '.join(
+        f'{column} = {table}.{column} + excluded.{column}'
+        for column in (quote(meta.get_field(name).column) for name in SUMMED_FIELDS)
+    )
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    size = max(1, min(batch_size or len(rows), connection.ops.bulk_batch_size(fields, rows)))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), size):
+            chunk = rows[start:start + size]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([placeholders] * len(chunk))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {summed}',
+                [field.get_db_prep_save(getattr(row, field.attname), connection) for row in chunk for field in fields],
+            )
+
+
+class DeltaWriter(BulkWriter):
+    """
+    Bucket al secondo scritti come delta (upsert_deltas): incrementi arrivati
+    dopo la prima raccolta o da un leader precedente si sommano al bucket.
+    """
+
+    def insert(self, batch):
+        upsert_deltas(batch, self.batch_size)
+
+
+def metrics_writer():
+    global _writer
+    if _writer is None:
+        _writer = DeltaWriter('stream_metrics', StreamMetricBucket)
+    return _writer
+
+
+async def record(stream_id, kind, count=1):
+    """Conta `count` eventi (chat, bids) nel secondo corrente della live."""
+    key = counter_key(stream_id, kind, int(time.time()))
+    if not await cache.aadd(key, count, timeout=COUNTER_TIMEOUT):
+        await cache.aincr(key, count)
+
+
+async def consume(key, count):
+    """Toglie dal contatore quanto è stato letto: ogni incremento è scritto una volta."""
+    try:
+        await cache.adecr(key, count)
+    except ValueError:
+        # Contatore scaduto nel frattempo
+        pass
+
+
+def second_bucket(stream_id, second, viewers, counts):
+    return StreamMetricBucket(
+        stream_id=stream_id,
+        resolution=Resolution.SECOND,
+        start=datetime.fromtimestamp(second, tz=dt_timezone.utc),
+        viewers=viewers,
+        peak_viewers=viewers,
+        chat_messages=counts.get(counter_key(stream_id, 'chat', second), 0),
+        bids=counts.get(counter_key(stream_id, 'bids', second), 0),
+    )
+
+
+async def is_live(stream_id):
+    return await LiveStream.objects.filter(pk=stream_id, status=LiveStream.Status.LIVE).aexists()
+
+
+async def collect(stream_id):
+    """
+    Chiamata ogni secondo dal leader della stanza (heartbeat senza messaggi):
+    accoda un bucket per ogni secondo concluso dall'ultima raccolta, più un
+    delta per gli incrementi arrivati in ritardo negli ultimi LATE_SECONDS
+    secondi già raccolti. I contatori sono nella cache condivisa, come la
+    lease che sceglie il leader. A live conclusa non scrive più nulla: i
+    bucket al secondo verrebbero dopo l'accorpamento in minuti e ore.
+    """
+    if not await is_live(stream_id):
+        return None
+    now = int(time.time())
+    last = await cache.aget(last_second_key(stream_id)) or now - 2
+    first = max(last + 1, now - MAX_CATCH_UP)
+    seconds = range(first, now)
+    if not seconds:
+        return None
+    late = range(max(first - LATE_SECONDS, now - MAX_CATCH_UP), first)
+
+    keys = [counter_key(stream_id, kind, second) for second in (*late, *seconds) for kind in KINDS]
+    counts = {key: count for key, count in (await cache.aget_many(keys)).items() if count}
+    for key, count in counts.items():
+        await consume(key, count)
+    viewers = await presence.viewer_count(stream_id)
+    writer = metrics_writer()
+    for second in late:
+        if any(counter_key(stream_id, kind, second) in counts for kind in KINDS):
+            writer.put(second_bucket(stream_id, second, 0, counts))
+    for second in seconds:
+        writer.put(second_bucket(stream_id, second, viewers, counts))
+    await cache.aset(last_second_key(stream_id), now - 1, timeout=COUNTER_TIMEOUT)
+    return None
+
+
+def empty_columns():
+    return {column: np.zeros(0, dtype=np.int64) for column in COLUMNS}
+
+
+def load_columns(stream_id, resolution):
+    """Bucket salvati come colonne numpy; start in secondi epoch."""
+    rows = StreamMetricBucket.objects.filter(
+        stream_id=stream_id, resolution=resolution
+    ).order_by('start').values_list(*COLUMNS)
+    data = np.array(
+        [(int(start.timestamp()), *metrics) for start, *metrics in rows],
+        dtype=np.int64,
+    ).reshape(-1, len(COLUMNS))
+    return {column: data[:, i] for i, column in enumerate(COLUMNS)}
+
+
+def aggregate(columns, step):
+    """
+    Accorpa bucket ordinati per start in bucket di `step` secondi: media degli
+    spettatori, massimo del picco, somma di messaggi e offerte.
+    """
+    if not len(columns['start']):
+        return empty_columns()
+    starts = columns['start'] // step * step
+    bucket_starts, index = np.unique(starts, return_index=True)
+    sizes = np.diff(np.append(index, len(starts)))
+    return {
+        'start': bucket_starts,
+        'viewers': np.rint(np.add.reduceat(columns['viewers'], index) / sizes).astype(np.int64),
+        'peak_viewers': np.maximum.reduceat(columns['peak_viewers'], index),
+        'chat_messages': np.add.reduceat(columns['chat_messages'], index),
+        'bids': np.add.reduceat(columns['bids'], index),
+    }
+
+
+def merge(stored, extra):
+    """
+    Unisce due serie alla stessa risoluzione come upsert_deltas: sullo stesso
+    start messaggi e offerte si sommano, spettatori e picco restano quelli di
+    `stored`.
+    """
+    if not len(extra['start']):
+        return stored
+    if not len(stored['start']):
+        return extra
+    starts = np.union1d(stored['start'], extra['start'])
+    merged = {column: np.zeros(len(starts), dtype=np.int64) for column in COLUMNS}
+    merged['start'] = starts
+    stored_at, extra_at = np.searchsorted(starts, stored['start']), np.searchsorted(starts, extra['start'])
+    for field in METRIC_FIELDS:
+        if field in SUMMED_FIELDS:
+            merged[field][extra_at] += extra[field]
+            merged[field][stored_at] += stored[field]
+        else:
+            merged[field][extra_at] = extra[field]
+            merged[field][stored_at] = stored[field]
+    return merged
+
+
+def load_series(stream_id, resolution):
+    """
+    Serie alla risoluzione richiesta. Se non è salvata (es. live in corso,
+    ancora al secondo) viene calcolata dalla risoluzione più fine disponibile.
+    I bucket al secondo rimasti accanto a minuti e ore sono arrivati dopo
+    l'accorpamento e vengono aggiunti alla serie.
+    """
+    columns, source = empty_columns(), Resolution.SECOND
+    for stored in (value for value in sorted(Resolution.values, reverse=True) if value <= resolution):
+        loaded = load_columns(stream_id, stored)
+        if len(loaded['start']):
+            columns = loaded if stored == resolution else aggregate(loaded, resolution)
+            source = stored
+            break
+    if source != Resolution.SECOND:
+        columns = merge(columns, aggregate(load_columns(stream_id, Resolution.SECOND), resolution))
+    return columns
+
+
+def bucket_rows(stream_id, resolution, columns):
+    return [
+        StreamMetricBucket(
+            stream_id=stream_id,
+            resolution=resolution,
+            start=datetime.fromtimestamp(int(start), tz=dt_timezone.utc),
+            **{field: int(columns[field][i]) for field in METRIC_FIELDS},
+        )
+        for i, start in enumerate(columns['start'])
+    ]
+
+
+def downsample_stream(stream_id):
+    """
+    Sostituisce i bucket al secondo di una live conclusa con bucket al minuto
+    e all'ora. I minuti già salvati da un accorpamento precedente ricevono i
+    nuovi secondi come delta; le ore si ricalcolano dai minuti.
+    Restituisce il numero di bucket al secondo accorpati.
+    """
+    with transaction.atomic():
+        seconds = load_columns(stream_id, Resolution.SECOND)
+        if not len(seconds['start']):
+            return 0
+        upsert_deltas(bucket_rows(stream_id, Resolution.MINUTE, aggregate(seconds, Resolution.MINUTE)))
+        minutes = load_columns(stream_id, Resolution.MINUTE)
+        StreamMetricBucket.objects.bulk_create(
+            bucket_rows(stream_id, Resolution.HOUR, aggregate(minutes, Resolution.HOUR)),
+            update_conflicts=True,
+            unique_fields=list(KEY_FIELDS),
+            update_fields=list(METRIC_FIELDS),
+        )
+        StreamMetricBucket.objects.filter(stream_id=stream_id, resolution=Resolution.SECOND).delete()
+    return len(seconds['start'])
+
+
+def compact(stream_id):
+    try:
+        count = downsample_stream(stream_id)
+        logger.info("Live %s: accorpati %s bucket al secondo", stream_id, count)
+    except Exception:
+        logger.exception("Accorpamento delle metriche della live %s fallito", stream_id)
+    finally:
+        close_old_connections()
+
+
+def compact_later(stream_id, delay=None):
+    """
+    Accorpa le metriche di una live appena conclusa dopo `delay` secondi
+    (STREAM_METRICS_COMPACT_DELAY), in un thread del processo. Il comando
+    compact_stream_metrics resta per le live concluse durante un riavvio.
+    """
+    if delay is None:
+        delay = getattr(settings, 'STREAM_METRICS_COMPACT_DELAY', 60)
+    timer = threading.Timer(delay, compact, args=(stream_id,))
+    timer.daemon = True
+    timer.start()
+    return timer
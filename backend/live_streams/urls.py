@@ -1,3 +1,7 @@
 from django.urls import path
+from . import views
 
-urlpatterns = []  # Aggiungeremo le URL più tardi 
\ No newline at end of file
+urlpatterns = [
+    path('<int:stream_id>/chat/', views.ChatMessageListView.as_view(), name='live-stream-chat'),
+    path('<int:stream_id>/metrics/', views.StreamMetricsView.as_view(), name='live-stream-metrics'),
+]
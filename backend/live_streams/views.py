@@ -1,3 +1,58 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.pagination import KeysetPagination
+from .models import ChatMessage, LiveStream, StreamMetricBucket
+from .serializers import ChatMessageSerializer
+from . import timeseries
 
-# Create your views here.
+
+class ChatMessageListView(generics.ListAPIView):
+    """
+    Chat salvata di una live in ordine di invio. Con `?after=<offset>` la
+    lettura riparte da una posizione (replay, moderazione) usando l'indice
+    (stream, offset).
+    """
+    serializer_class = ChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('offset', 'id')
+
+    def get_queryset(self):
+        stream = get_object_or_404(LiveStream, pk=self.kwargs['stream_id'])
+        queryset = ChatMessage.objects.filter(stream=stream)
+        after = self.request.query_params.get('after')
+        if after is not None:
+            try:
+                queryset = queryset.filter(offset__gt=int(after))
+            except ValueError:
+                raise ValidationError({'after': 'Deve essere un numero intero'})
+        return queryset
+
+
+class StreamMetricsView(APIView):
+    """
+    Serie temporale di una live in formato colonnare: un array per metrica,
+    con `start` in secondi epoch. `?resolution=second|minute|hour` (default
+    minute); una live di tre ore al minuto sono 180 punti per colonna.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    resolutions = {
+        'second': StreamMetricBucket.Resolution.SECOND,
+        'minute': StreamMetricBucket.Resolution.MINUTE,
+        'hour': StreamMetricBucket.Resolution.HOUR,
+    }
+
+    def get(self, request, stream_id):
+        stream = get_object_or_404(LiveStream, pk=stream_id)
+        name = request.query_params.get('resolution', 'minute')
+        if name not in self.resolutions:
+            raise ValidationError({'resolution': f"Valori ammessi: {', '.join(self.resolutions)}"})
+        columns = timeseries.load_series(stream.pk, self.resolutions[name])
+        return Response({
+            'stream': stream.pk,
+            'resolution': name,
+            **{column: values.tolist() for column, values in columns.items()},
+        })
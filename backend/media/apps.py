@@ -1,6 +1,17 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db import transaction
+from django.db.models.signals import post_save
 
 
 class MediaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'media'
+
+    def ready(self):
+        from . import renditions
+
+        # Varianti generate dopo il commit, fuori dal ciclo della richiesta
+        for label, field_name in renditions.SOURCES:
+            def generate(sender, instance, field_name=field_name, **kwargs):
+                transaction.on_commit(lambda: renditions.schedule(instance, field_name))
+            post_save.connect(generate, sender=apps.get_model(label), weak=False, dispatch_uid=f'renditions_{label}_{field_name}')
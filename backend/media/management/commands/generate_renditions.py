@@ -0,0 +1,30 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from media import renditions
+
+
+class Command(BaseCommand):
+    help = "Genera (o rigenera) in parallelo le varianti WebP/JPEG delle immagini caricate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help="Solo questo modello (es. artworks.Artwork), ripetibile")
+        parser.add_argument('--force', action='store_true', help="Rigenera anche le varianti già aggiornate")
+        parser.add_argument('--workers', type=int, help="Processi del pool (default: RENDITION_WORKERS o un processo per core)")
+        parser.add_argument('--chunk-size', type=int, default=64)
+
+    def handle(self, *args, **options):
+        sources = renditions.SOURCES
+        if options['model']:
+            known = {label.lower() for label, _ in sources}
+            unknown = [label for label in options['model'] if label.lower() not in known]
+            if unknown:
+                raise CommandError(f"Modelli senza varianti: {', '.join(unknown)}")
+            wanted = {label.lower() for label in options['model']}
+            sources = [(label, field) for label, field in sources if label.lower() in wanted]
+
+        for label, field_name in sources:
+            count = renditions.regenerate(
+                apps.get_model(label), field_name,
+                force=options['force'], chunk_size=options['chunk_size'], workers=options['workers'],
+            )
+            self.stdout.write(f'{label}.{field_name}: {count} immagini')
@@ -40,6 +40,7 @@ class Media(models.Model):
     
     # Thumbnails e preview
     thumbnail = models.ImageField(_('Thumbnail'), upload_to='media/thumbnails/', null=True, blank=True)
+    thumbnail_renditions = models.JSONField(_('Varianti Thumbnail'), default=dict, blank=True, editable=False)
     preview_url = models.URLField(_('URL Preview'), blank=True)
     
     # Privacy e accesso
@@ -0,0 +1,223 @@
+import atexit
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+# Campi immagine con varianti: (modello, campo); le varianti sono nel JSONField <campo>_renditions
+SOURCES = (
+    ('artworks.Artwork', 'image'),
+    ('events.Event', 'cover_image'),
+    ('users.User', 'profile_pic'),
+    ('media.Media', 'thumbnail'),
+)
+
+_process_pool = None
+_dispatcher = None
+
+
+def rendition_widths():
+    return tuple(getattr(settings, 'RENDITION_WIDTHS', (320, 640, 1024, 1600)))
+
+
+def rendition_quality():
+    return getattr(settings, 'RENDITION_QUALITY', 80)
+
+
+def renditions_field(field_name):
+    """Nome del JSONField che descrive le varianti di un campo immagine."""
+    return f'{field_name}_renditions'
+
+
+def rendition_name(digest, width, fmt):
+    # Nome derivato dal contenuto: stessa immagine, stessi file (e cache infinita)
+    return f'renditions/{digest[:2]}/{digest}-{width}.{fmt}'
+
+
+def render(data, widths, quality):
+    """
+    Crea le varianti di un'immagine: per ogni larghezza (mai oltre
+    l'originale) una WebP e una JPEG. Funzione pura, eseguita nel process pool.
+    Restituisce (sha256, larghezza, altezza, {formato: {larghezza: bytes}}).
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    width, height = image.size
+    targets = sorted({min(target, width) for target in widths})
+
+    outputs = {fmt: {} for fmt in FORMATS}
+    for target in targets:
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.LANCZOS
+        )
+        for fmt, (pil_format, _) in FORMATS.items():
+            frame = resized
+            if pil_format == 'JPEG' and frame.mode not in ('RGB', 'L'):
+                frame = frame.convert('RGB')
+            elif frame.mode not in ('RGB', 'RGBA', 'L'):
+                frame = frame.convert('RGBA')
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, quality=quality, optimize=True, **({'method': 4} if pil_format == 'WEBP' else {}))
+            outputs[fmt][target] = buffer.getvalue()
+    return digest, width, height, outputs
+
+
+def render_job(job):
+    """Job per il pool: (chiave, bytes, larghezze, qualità) -> (chiave, risultato o None)."""
+    key, data, widths, quality = job
+    try:
+        return key, render(data, widths, quality)
+    except Exception:
+        logger.exception("Varianti non generate per %s", key)
+        return key, None
+
+
+def store(source_name, result):
+    """Salva i file (solo se mancano) e restituisce la descrizione delle varianti."""
+    digest, width, height, outputs = result
+    variants = {}
+    for fmt, files in outputs.items():
+        variants[fmt] = {}
+        for target, content in files.items():
+            name = rendition_name(digest, target, fmt)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(content))
+            variants[fmt][str(target)] = name
+    return {
+        'source': source_name,
+        'hash': digest,
+        'width': width,
+        'height': height,
+        'variants': variants,
+    }
+
+
+def needs_renditions(instance, field_name):
+    file = getattr(instance, field_name)
+    if not file:
+        return False
+    current = getattr(instance, renditions_field(field_name)) or {}
+    return current.get('source') != file.name
+
+
+def read_file(file):
+    file.open('rb')
+    try:
+        return file.read()
+    finally:
+        file.close()
+
+
+def save_renditions(model, pk, field_name, renditions):
+    # UPDATE del solo campo JSON: nessun segnale post_save, nessun ciclo
+    model.objects.filter(pk=pk).update(**{renditions_field(field_name): renditions})
+
+
+def get_process_pool(workers=None):
+    global _process_pool
+    if _process_pool is None:
+        workers = workers or getattr(settings, 'RENDITION_WORKERS', None) or os.cpu_count()
+        # forkserver: i worker non ereditano thread, lock e connessioni del processo Django
+        _process_pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('forkserver')
+        )
+        atexit.register(_process_pool.shutdown)
+    return _process_pool
+
+
+def get_dispatcher():
+    """Thread che legge i file e attende il pool, fuori dal ciclo della richiesta."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='renditions')
+        atexit.register(_dispatcher.shutdown)
+    return _dispatcher
+
+
+def process(model, pk, field_name):
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None or not needs_renditions(instance, field_name):
+            return
+        file = getattr(instance, field_name)
+        job = (file.name, read_file(file), rendition_widths(), rendition_quality())
+        _, result = get_process_pool().submit(render_job, job).result()
+        if result is not None:
+            save_renditions(model, pk, field_name, store(file.name, result))
+    except Exception:
+        logger.exception("Elaborazione varianti fallita per %s %s", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance, field_name):
+    """Accoda la generazione delle varianti se l'immagine è nuova o cambiata."""
+    if not needs_renditions(instance, field_name):
+        return
+    if getattr(settings, 'RENDITIONS_SYNC', False):
+        process(type(instance), instance.pk, field_name)
+        return
+    get_dispatcher().submit(process, type(instance), instance.pk, field_name)
+
+
+def regenerate(model, field_name, queryset=None, force=False, chunk_size=64, workers=None):
+    """
+    Rigenera in blocco le varianti di un modello, in parallelo su tutti i core.
+    Restituisce il numero di immagini elaborate.
+    """
+    queryset = (queryset if queryset is not None else model.objects.all())
+    queryset = queryset.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+    widths, quality = rendition_widths(), rendition_quality()
+    pool = get_process_pool(workers)
+    done = 0
+    batch = []
+
+    def flush(batch):
+        # Letture una per una: un file mancante o illeggibile non ferma il blocco
+        jobs, names = [], {}
+        for pk, instance in batch:
+            file = getattr(instance, field_name)
+            try:
+                data = read_file(file)
+            except Exception:
+                logger.exception("Immagine %s di %s %s non leggibile", file.name, model.__name__, pk)
+                continue
+            jobs.append((pk, data, widths, quality))
+            names[pk] = file.name
+        count = 0
+        for pk, result in pool.map(render_job, jobs):
+            if result is None:
+                continue
+            try:
+                save_renditions(model, pk, field_name, store(names[pk], result))
+            except Exception:
+                logger.exception("Varianti non salvate per %s %s", model.__name__, pk)
+                continue
+            count += 1
+        return count
+
+    for instance in queryset.order_by('pk').iterator(chunk_size=chunk_size):
+        if force or needs_renditions(instance, field_name):
+            batch.append((instance.pk, instance))
+        if len(batch) >= chunk_size:
+            done += flush(batch)
+            batch = []
+    if batch:
+        done += flush(batch)
+    return done
@@ -0,0 +1,46 @@
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from .renditions import FORMATS, renditions_field
+
+
+class RenditionsField(serializers.Field):
+    """
+    Varianti di un campo immagine pronte per <picture>/srcset:
+        {"src": ..., "width": ..., "height": ...,
+         "srcset": {"webp": "url 320w, url 640w", "jpeg": ...}, "types": {...}}
+    None finché le varianti non sono state generate.
+    """
+
+    def __init__(self, field_name, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        self.image_field = field_name
+        super().__init__(**kwargs)
+
+    def url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def to_representation(self, instance):
+        renditions = getattr(instance, renditions_field(self.image_field)) or {}
+        image = getattr(instance, self.image_field)
+        if not renditions.get('variants') or not image or renditions.get('source') != image.name:
+            return None
+        srcset = {
+            fmt: ', '.join(
+                f'{self.url(name)} {width}w'
+                for width, name in sorted(files.items(), key=lambda item: int(item[0]))
+            )
+            for fmt, files in renditions['variants'].items()
+        }
+        # Fallback per i client senza srcset: la JPEG più grande
+        jpeg = renditions['variants'].get('jpeg', {})
+        largest = max(jpeg, key=int) if jpeg else None
+        return {
+            'src': self.url(jpeg[largest]) if largest else None,
+            'width': renditions['width'],
+            'height': renditions['height'],
+            'srcset': srcset,
+            'types': {fmt: FORMATS[fmt][1] for fmt in srcset if fmt in FORMATS},
+        }
@@ -1,3 +1,68 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+from artworks.models import Artwork
+from users.models import User
+from . import renditions
 
-# Create your tests here.
+
+def image_file(width, height, name='opera.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+@override_settings(RENDITION_WIDTHS=(320, 640, 1024), RENDITIONS_SYNC=True)
+class RegenerateTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.artist = User.objects.create_user('artist', password='password')
+
+    def artwork(self, width=800, height=400):
+        artwork = Artwork(title='Opera', description='', price=Decimal('1'), artist=self.artist)
+        artwork.image.save('opera.png', image_file(width, height), save=False)
+        # bulk_create: nessun segnale, le varianti le genera solo regenerate()
+        return Artwork.objects.bulk_create([artwork])[0]
+
+    def variants(self, artwork):
+        artwork.refresh_from_db()
+        return artwork.image_renditions
+
+    def test_widths_are_capped_at_the_original(self):
+        artwork = self.artwork(width=800, height=400)
+        self.assertEqual(renditions.regenerate(Artwork, 'image', workers=2), 1)
+        described = self.variants(artwork)
+        self.assertEqual((described['source'], described['width'], described['height']), (artwork.image.name, 800, 400))
+        for fmt in renditions.FORMATS:
+            self.assertEqual(sorted(described['variants'][fmt], key=int), ['320', '640', '800'])
+        with default_storage.open(described['variants']['jpeg']['320']) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (320, 160))
+
+    def test_unreadable_source_does_not_stop_the_others(self):
+        missing, broken, good = self.artwork(), self.artwork(), self.artwork()
+        default_storage.delete(missing.image.name)
+        Artwork.objects.filter(pk=broken.pk).update(image=default_storage.save('rotta.png', ContentFile(b'non immagine')))
+        with self.assertLogs('media.renditions', 'ERROR'):
+            self.assertEqual(renditions.regenerate(Artwork, 'image', workers=2), 1)
+        self.assertEqual(self.variants(missing), {})
+        self.assertEqual(self.variants(broken), {})
+        self.assertIn('variants', self.variants(good))
+
+    def test_rerun_skips_or_reuses_existing_renditions(self):
+        artwork = self.artwork()
+        renditions.regenerate(Artwork, 'image', workers=2)
+        first = self.variants(artwork)
+        # Già aggiornate: niente da fare senza force
+        self.assertEqual(renditions.regenerate(Artwork, 'image', workers=2), 0)
+        # Con force i file (nominati dal contenuto) vengono riusati, non duplicati
+        self.assertEqual(renditions.regenerate(Artwork, 'image', force=True, workers=2), 1)
+        self.assertEqual(self.variants(artwork), first)
+        _, files = default_storage.listdir(f"renditions/{first['hash'][:2]}")
+        self.assertEqual(len(files), 6)
@@ -0,0 +1,335 @@
+import logging
+from datetime import timedelta
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+from users.models import UserInteraction
+from .models import Recommendation, RecommendationBuild
+
+logger = logging.getLogger(__name__)
+
+Action = UserInteraction.ActionType
+Content = UserInteraction.ContentType
+
+# Quanto pesa ogni azione: un'offerta o un check-in dicono più di una visualizzazione
+ACTION_WEIGHTS = {
+    Action.VIEW: 1,
+    Action.COMMENT: 2,
+    Action.LIKE: 3,
+    Action.SHARE: 3,
+    Action.REGISTER: 4,
+    Action.BID: 5,
+    Action.CHECK_IN: 5,
+}
+# Codice numerico del tipo di contenuto: l'oggetto è identificato da (codice << 32) | id
+CONTENT_CODES = {content_type: code for code, content_type in enumerate(Content.values)}
+ARTWORK_CODE = CONTENT_CODES[Content.ARTWORK]
+ID_MASK = (1 << 32) - 1
+
+POPULAR_KEY = 'popular'
+WRITE_BATCH_SIZE = 1000
+# Secondi per cui un worker riusa la versione corrente senza rileggerla dalla tabella
+BUILD_CHECK_SECONDS = 60
+BUILD_KEY = 'recs_build'
+
+
+def similar_key(content_type, content_id):
+    return f'similar:{content_type}:{content_id}'
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def cache_key(key, build):
+    return f'recs_{build}_{key}'
+
+
+def cache_timeout():
+    # Oltre l'intervallo tra due calcoli: la cache non resta mai vuota
+    return getattr(settings, 'RECOMMENDATIONS_CACHE_TIMEOUT', 2 * 24 * 3600)
+
+
+def interaction_window(days=None):
+    """
+    Giorni di interazioni del calcolo, al massimo INTERACTIONS_RETENTION_DAYS:
+    oltre, le righe grezze sono già state compattate e la finestra sarebbe
+    solo in apparenza più lunga.
+    """
+    retention = getattr(settings, 'INTERACTIONS_RETENTION_DAYS', 90)
+    days = days or getattr(settings, 'RECOMMENDATIONS_WINDOW_DAYS', retention)
+    if days > retention:
+        logger.warning("Finestra di %s giorni ridotta a %s (INTERACTIONS_RETENTION_DAYS)", days, retention)
+    return min(days, retention)
+
+
+# --- Lettura (richieste) -------------------------------------------------------
+
+def current_build():
+    """Id dell'ultimo calcolo completato, riletto dalla tabella ogni BUILD_CHECK_SECONDS."""
+    build = cache.get(BUILD_KEY)
+    if build is None:
+        build = RecommendationBuild.objects.filter(finished_at__isnull=False) \
+            .order_by('-id').values_list('id', flat=True).first() or 0
+        cache.set(BUILD_KEY, build, BUILD_CHECK_SECONDS)
+    return build
+
+
+def get_items(key):
+    """Lista precalcolata [[id opera, punteggio], ...]: una lettura dalla cache."""
+    build = current_build()
+    build_key = cache_key(key, build)
+    items = cache.get(build_key)
+    if items is None:
+        items = Recommendation.objects.filter(build_id=build, key=key).values_list('items', flat=True).first() or []
+        cache.set(build_key, items, cache_timeout())
+    return items
+
+
+def similar_artworks(artwork_id, limit=20):
+    return get_items(similar_key(Content.ARTWORK, artwork_id))[:limit]
+
+
+def recommended_for_user(user_id, limit=20):
+    """Consigliati per l'utente; chi non ha ancora interazioni vede le opere più popolari."""
+    return (get_items(user_key(user_id)) or get_items(POPULAR_KEY))[:limit]
+
+
+# --- Calcolo (job offline) -----------------------------------------------------
+
+def sum_pairs(users, items, weights):
+    """Somma i pesi delle coppie (utente, oggetto) ripetute."""
+    if not len(users):
+        return users, items, weights
+    order = np.lexsort((items, users))
+    users, items, weights = users[order], items[order], weights[order]
+    start = np.ones(len(users), dtype=bool)
+    start[1:] = (users[1:] != users[:-1]) | (items[1:] != items[:-1])
+    index = np.flatnonzero(start)
+    return users[index], items[index], np.add.reduceat(weights, index)
+
+
+def top_k(rows, cols, data, k):
+    """Le `k` voci con valore più alto di ogni riga di una matrice in formato COO."""
+    order = np.lexsort((-data, rows))
+    rows, cols, data = rows[order], cols[order], data[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < k
+    return rows[keep], cols[keep], data[keep]
+
+
+def interaction_rows(since):
+    """Interazioni come tuple di interi: tipo e azione tradotti dal database."""
+    return UserInteraction.objects.filter(timestamp__gte=since).annotate(
+        code=Case(
+            *[When(content_type=content_type, then=Value(code)) for content_type, code in CONTENT_CODES.items()],
+            output_field=IntegerField(),
+        ),
+        weight=Case(
+            *[When(action=action, then=Value(weight)) for action, weight in ACTION_WEIGHTS.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+def load_pairs(since, chunk_size):
+    """
+    Legge le interazioni a blocchi (keyset su id) e restituisce le coppie
+    (utente, oggetto) con il peso sommato. Ogni blocco viene accorpato subito:
+    la memoria cresce con le coppie distinte, non con le righe della tabella.
+    """
+    queryset = interaction_rows(since)
+    parts, pending, last_id = [], 0, 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'user_id', 'code', 'content_id', 'weight')[:chunk_size]
+        )
+        if not rows:
+            break
+        data = np.array(rows, dtype=np.int64)
+        last_id = int(data[-1, 0])
+        items = (data[:, 2] << 32) | data[:, 3]
+        parts.append(sum_pairs(data[:, 1], items, data[:, 4]))
+        pending += len(parts[-1][0])
+        if pending > 10 * chunk_size:
+            parts = [sum_pairs(*map(np.concatenate, zip(*parts)))]
+            pending = len(parts[0][0])
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    users, items, weights = sum_pairs(*map(np.concatenate, zip(*parts)))
+    valid = weights > 0
+    return users[valid], items[valid], weights[valid]
+
+
+def build_matrix(users, items, weights, max_items_per_user):
+    """
+    Matrice utenti x oggetti con pesi log(1 + peso): cento visualizzazioni non
+    valgono cento volte una. Gli utenti molto attivi (o i bot) contano con i
+    loro `max_items_per_user` oggetti più forti, così il costo di X.T @ X resta limitato.
+    """
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    item_keys, item_index = np.unique(items, return_inverse=True)
+    values = np.log1p(weights).astype(np.float32)
+    user_index, item_index, values = top_k(user_index, item_index, values, max_items_per_user)
+    matrix = sparse.csr_matrix(
+        (values, (user_index, item_index)), shape=(len(user_ids), len(item_keys)), dtype=np.float32
+    )
+    return matrix, user_ids, item_keys
+
+
+def neighbours(matrix, item_keys, top_n, block_size):
+    """
+    Similarità coseno oggetto -> opera, calcolata a blocchi di colonne come
+    X[:, blocco].T @ X[:, opere] sulla matrice normalizzata; di ogni oggetto si
+    tengono le `top_n` opere più simili. Restituisce una matrice sparsa oggetti x opere.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    normalized = sparse.csc_matrix(matrix @ sparse.diags(1 / np.maximum(norms, 1e-9)))
+    artworks = np.flatnonzero((item_keys >> 32) == ARTWORK_CODE)
+    artwork_columns = normalized[:, artworks]
+    artwork_position = np.full(len(item_keys), -1)
+    artwork_position[artworks] = np.arange(len(artworks))
+
+    rows, cols, data = [], [], []
+    for start in range(0, len(item_keys), block_size):
+        block = np.arange(start, min(start + block_size, len(item_keys)))
+        similarity = (normalized[:, block].T @ artwork_columns).tocoo()
+        # Un'opera non è simile a se stessa
+        other = similarity.col != artwork_position[block[similarity.row]]
+        block_rows, block_cols, block_data = top_k(
+            similarity.row[other], similarity.col[other], similarity.data[other], top_n
+        )
+        rows.append(block_rows + start)
+        cols.append(block_cols)
+        data.append(block_data)
+    result = sparse.csr_matrix(
+        (np.concatenate(data) if data else [], (np.concatenate(rows) if rows else [], np.concatenate(cols) if cols else [])),
+        shape=(len(item_keys), len(artworks)), dtype=np.float32,
+    )
+    return result, item_keys[artworks] & ID_MASK
+
+
+def item_lists(matrix, ids):
+    """Righe di una matrice sparsa come liste [[id, punteggio], ...] ordinate per punteggio."""
+    matrix = matrix.tocsr()
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            yield row, []
+            continue
+        order = np.argsort(-matrix.data[start:end], kind='stable')
+        cols = matrix.indices[start:end][order]
+        scores = matrix.data[start:end][order]
+        yield row, [[int(ids[col]), round(float(score), 4)] for col, score in zip(cols, scores)]
+
+
+def user_recommendations(matrix, similar, artwork_ids, item_keys, top_n, block_size):
+    """
+    Punteggio utente -> opera = X[utente] @ vicini, a blocchi di utenti;
+    le opere con cui l'utente ha già interagito sono escluse.
+    """
+    artworks = np.flatnonzero((item_keys >> 32) == ARTWORK_CODE)
+    for start in range(0, matrix.shape[0], block_size):
+        block = matrix[start:start + block_size]
+        scores = (block @ similar).tocsr()
+        seen = block[:, artworks]
+        seen.data[:] = 1
+        scores = (scores - scores.multiply(seen)).tocoo()
+        keep = scores.data > 0
+        rows, cols, data = top_k(scores.row[keep], scores.col[keep], scores.data[keep], top_n)
+        top = sparse.csr_matrix((data, (rows, cols)), shape=(block.shape[0], len(artworks)))
+        yield start, item_lists(top, artwork_ids)
+
+
+def popular_artworks(matrix, item_keys, top_n):
+    artworks = np.flatnonzero((item_keys >> 32) == ARTWORK_CODE)
+    totals = np.asarray(matrix[:, artworks].sum(axis=0)).ravel()
+    order = np.argsort(-totals, kind='stable')[:top_n]
+    return [[int(item_keys[artworks[i]] & ID_MASK), round(float(totals[i]), 4)] for i in order if totals[i] > 0]
+
+
+def save(entries, build):
+    """Salva (chiave, elementi) del calcolo `build` in tabella e in cache, a blocchi."""
+    batch = []
+    for key, items in entries:
+        batch.append(Recommendation(build_id=build, key=key, items=items))
+        if len(batch) >= WRITE_BATCH_SIZE:
+            write_batch(batch, build)
+            batch = []
+    write_batch(batch, build)
+
+
+def write_batch(batch, build):
+    if not batch:
+        return
+    Recommendation.objects.bulk_create(batch)
+    cache.set_many({cache_key(entry.key, build): entry.items for entry in batch}, cache_timeout())
+
+
+def publish(build):
+    """
+    Rende `build` la versione corrente, dopo che tutte le sue righe sono state
+    scritte. Il calcolo precedente resta: i worker possono leggerlo ancora per
+    BUILD_CHECK_SECONDS. Quelli più vecchi e i calcoli interrotti vengono
+    eliminati con le loro righe; restituisce quante righe sono state tolte.
+    """
+    previous = RecommendationBuild.objects.filter(finished_at__isnull=False, id__lt=build.id) \
+        .order_by('-id').values_list('id', flat=True).first()
+    build.finished_at = timezone.now()
+    build.save(update_fields=['finished_at'])
+    cache.set(BUILD_KEY, build.id, BUILD_CHECK_SECONDS)
+    old = RecommendationBuild.objects.filter(id__lt=build.id).exclude(id=previous)
+    removed = Recommendation.objects.filter(build__in=old).delete()[0]
+    old.delete()
+    return removed
+
+
+def build(chunk_size=100000, top_n=None, window_days=None, block_size=2000):
+    """
+    Ricalcola tutte le raccomandazioni dalle interazioni degli ultimi
+    `window_days` giorni (al massimo quelli conservati). Le richieste
+    continuano a leggere il calcolo precedente finché questo non è completo.
+    Restituisce i conteggi per il log del comando.
+    """
+    started = timezone.now()
+    current = RecommendationBuild.objects.create()
+    top_n = top_n or getattr(settings, 'RECOMMENDATIONS_TOP_K', 50)
+    days = interaction_window(window_days)
+    max_items_per_user = getattr(settings, 'RECOMMENDATIONS_MAX_ITEMS_PER_USER', 500)
+
+    users, items, weights = load_pairs(started - timedelta(days=days), chunk_size)
+    matrix, user_ids, item_keys = build_matrix(users, items, weights, max_items_per_user)
+    similar, artwork_ids = neighbours(matrix, item_keys, top_n, block_size)
+
+    artwork_rows = np.flatnonzero((item_keys >> 32) == ARTWORK_CODE)
+    save((
+        (similar_key(Content.ARTWORK, int(artwork_ids[row])), entries)
+        for row, entries in item_lists(similar[artwork_rows], artwork_ids)
+        if entries
+    ), current.id)
+    save((
+        (user_key(int(user_ids[start + row])), entries)
+        for start, rows in user_recommendations(matrix, similar, artwork_ids, item_keys, top_n, block_size)
+        for row, entries in rows
+        if entries
+    ), current.id)
+    save([(POPULAR_KEY, popular_artworks(matrix, item_keys, top_n))], current.id)
+    removed = publish(current)
+
+    counts = {
+        'pairs': len(users),
+        'users': len(user_ids),
+        'items': len(item_keys),
+        'artworks': len(artwork_ids),
+        'neighbours': int(similar.nnz),
+        'removed': removed,
+        'build': current.id,
+    }
+    logger.info("Raccomandazioni ricalcolate: %s", counts)
+    return counts
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recommendations.engine import build
+
+
+class Command(BaseCommand):
+    help = "Ricalcola opere simili e consigliati per utente dalle interazioni (da eseguire periodicamente)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100000, help="Interazioni lette per query")
+        parser.add_argument('--block-size', type=int, default=2000, help="Oggetti/utenti per moltiplicazione sparsa")
+        parser.add_argument('--top-k', type=int, help="Vicini per oggetto (default RECOMMENDATIONS_TOP_K)")
+        parser.add_argument('--window-days', type=int, help="Giorni di interazioni considerati")
+
+    def handle(self, *args, **options):
+        counts = build(
+            chunk_size=options['chunk_size'],
+            top_n=options['top_k'],
+            window_days=options['window_days'],
+            block_size=options['block_size'],
+        )
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: {count}')
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Chiave')),
+                ('items', models.JSONField(default=list, verbose_name='Elementi')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Aggiornato il')),
+            ],
+            options={
+                'verbose_name': 'Raccomandazione',
+                'verbose_name_plural': 'Raccomandazioni',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Iniziato il')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Completato il')),
+            ],
+            options={
+                'verbose_name': 'Calcolo raccomandazioni',
+                'verbose_name_plural': 'Calcoli raccomandazioni',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_current_build(apps, schema_editor):
+    # Le righe esistenti sono quelle dell'ultimo calcolo completato
+    Recommendation = apps.get_model('recommendations', 'Recommendation')
+    RecommendationBuild = apps.get_model('recommendations', 'RecommendationBuild')
+    current = RecommendationBuild.objects.filter(finished_at__isnull=False).order_by('-id').first()
+    if current is None:
+        Recommendation.objects.all().delete()
+    else:
+        Recommendation.objects.update(build=current)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0002_recommendation_build'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='build',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='recommendations.recommendationbuild', verbose_name='Calcolo'),
+        ),
+        migrations.RunPython(assign_current_build, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recommendation',
+            name='build',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='recommendations.recommendationbuild', verbose_name='Calcolo'),
+        ),
+        migrations.AlterField(
+            model_name='recommendation',
+            name='key',
+            field=models.CharField(max_length=100, verbose_name='Chiave'),
+        ),
+        migrations.AddConstraint(
+            model_name='recommendation',
+            constraint=models.UniqueConstraint(fields=('build', 'key'), name='unique_recommendation_build_key'),
+        ),
+    ]
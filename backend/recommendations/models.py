@@ -0,0 +1,47 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class Recommendation(models.Model):
+    """
+    Risultato precalcolato del motore di raccomandazione, una riga per chiave
+    e calcolo: 'similar:<tipo>:<id>' (vicini di un contenuto), 'user:<id>'
+    (consigliati per un utente), 'popular' (fallback). `items` è una lista di
+    [id opera, punteggio]. Le richieste leggono dalla cache, con chiavi legate
+    al calcolo corrente (RecommendationBuild); le righe dello stesso calcolo
+    servono a ripopolarla.
+    """
+    build = models.ForeignKey(
+        'RecommendationBuild', on_delete=models.CASCADE, related_name='recommendations', verbose_name=_('Calcolo')
+    )
+    key = models.CharField(_('Chiave'), max_length=100)
+    items = models.JSONField(_('Elementi'), default=list)
+    updated_at = models.DateTimeField(_('Aggiornato il'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Raccomandazione')
+        verbose_name_plural = _('Raccomandazioni')
+        constraints = [
+            models.UniqueConstraint(fields=['build', 'key'], name='unique_recommendation_build_key'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class RecommendationBuild(models.Model):
+    """
+    Un calcolo delle raccomandazioni. L'ultimo completato è la versione delle
+    righe e delle chiavi in cache: a calcolo finito ogni worker passa alle
+    chiavi nuove e quelle vecchie (anche nelle cache locali degli altri
+    processi) scadono da sole.
+    """
+    started_at = models.DateTimeField(_('Iniziato il'), auto_now_add=True)
+    finished_at = models.DateTimeField(_('Completato il'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Calcolo raccomandazioni')
+        verbose_name_plural = _('Calcoli raccomandazioni')
+
+    def __str__(self):
+        return f'#{self.pk}'
@@ -0,0 +1,99 @@
+from decimal import Decimal
+from django.core.cache import cache
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from artworks.models import Artwork
+from users.models import User, UserInteraction
+from . import engine
+from .models import Recommendation, RecommendationBuild
+
+
+class BuildTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        artist = User.objects.create_user('artist', password='password')
+        self.artworks = [
+            Artwork.objects.create(title=f'Opera {i}', description='', image='', price=Decimal('1'), artist=artist)
+            for i in range(3)
+        ]
+        self.users = [User.objects.create_user(f'user{i}', password='password') for i in range(3)]
+
+    def interact(self, user, artwork, days_ago=0):
+        interaction = UserInteraction.objects.create(
+            user=user, content_type='artwork', content_id=artwork.pk, action='like'
+        )
+        UserInteraction.objects.filter(pk=interaction.pk).update(
+            timestamp=timezone.now() - timezone.timedelta(days=days_ago)
+        )
+
+    def similar_ids(self, artwork):
+        return [artwork_id for artwork_id, _ in engine.similar_artworks(artwork.pk)]
+
+    @override_settings(INTERACTIONS_RETENTION_DAYS=30, RECOMMENDATIONS_WINDOW_DAYS=180)
+    def test_window_never_exceeds_retention(self):
+        first, second, third = self.artworks
+        for user in self.users[:2]:
+            self.interact(user, first)
+            self.interact(user, second)
+        # Più vecchia della conservazione: non deve contare anche se la finestra è più lunga
+        self.interact(self.users[0], third, days_ago=60)
+        engine.build()
+        self.assertEqual(self.similar_ids(first), [second.pk])
+
+    def test_stale_cache_entries_of_a_previous_build_are_not_served(self):
+        first, second, third = self.artworks
+        self.interact(self.users[0], first)
+        self.interact(self.users[0], second)
+        engine.build()
+        previous = engine.current_build()
+        self.assertEqual(self.similar_ids(first), [second.pk])
+
+        # Un altro worker tiene in cache la lista vecchia del calcolo precedente
+        cache.set(engine.cache_key(engine.similar_key('artwork', first.pk), previous), [[second.pk, 1.0]])
+        UserInteraction.objects.all().delete()
+        self.interact(self.users[1], first)
+        self.interact(self.users[1], third)
+        engine.build()
+
+        self.assertGreater(engine.current_build(), previous)
+        self.assertEqual(self.similar_ids(first), [third.pk])
+        # Il calcolo precedente resta finché i worker possono ancora leggerlo
+        self.assertEqual(list(RecommendationBuild.objects.values_list('id', flat=True)), [previous, engine.current_build()])
+
+    def test_build_in_progress_is_not_read(self):
+        first, second, _ = self.artworks
+        self.interact(self.users[0], first)
+        self.interact(self.users[0], second)
+        engine.build()
+        published = engine.current_build()
+        cache.delete(engine.BUILD_KEY)
+        RecommendationBuild.objects.create()
+        self.assertEqual(engine.current_build(), published)
+
+    def test_cache_miss_during_a_build_serves_the_published_rows(self):
+        first, second, third = self.artworks
+        self.interact(self.users[0], first)
+        self.interact(self.users[0], second)
+        engine.build()
+        published = engine.current_build()
+
+        UserInteraction.objects.all().delete()
+        self.interact(self.users[1], first)
+        self.interact(self.users[1], third)
+        # Righe nuove già scritte, calcolo non ancora pubblicato
+        with mock.patch.object(engine, 'publish', return_value=0):
+            engine.build()
+        cache.clear()
+        self.assertEqual(engine.current_build(), published)
+        self.assertEqual(self.similar_ids(first), [second.pk])
+
+    def test_older_builds_are_removed_with_their_rows(self):
+        first, second, _ = self.artworks
+        self.interact(self.users[0], first)
+        self.interact(self.users[0], second)
+        builds = []
+        for _ in range(3):
+            engine.build()
+            builds.append(engine.current_build())
+        self.assertEqual(set(Recommendation.objects.values_list('build_id', flat=True)), set(builds[1:]))
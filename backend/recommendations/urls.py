@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('artworks/<int:artwork_id>/similar/', views.SimilarArtworksView.as_view(), name='similar-artworks'),
+    path('for-you/', views.RecommendedForYouView.as_view(), name='recommended-for-you'),
+]
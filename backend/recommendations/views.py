@@ -0,0 +1,44 @@
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from artworks.models import Artwork
+from artworks.serializers import ArtworkSerializer
+from . import engine
+
+
+class RecommendationView(APIView):
+    """Base: legge la lista precalcolata e carica le opere con una sola query."""
+    max_limit = 50
+
+    def get_limit(self, request):
+        try:
+            return max(1, min(int(request.query_params.get('limit', 20)), self.max_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Deve essere un numero intero'})
+
+    def artworks_response(self, request, items):
+        artworks = Artwork.objects.select_related('artist').in_bulk([artwork_id for artwork_id, _ in items])
+        results = []
+        for artwork_id, score in items:
+            if artwork_id in artworks:
+                data = ArtworkSerializer(artworks[artwork_id], context={'request': request}).data
+                data['score'] = score
+                results.append(data)
+        return Response({'results': results})
+
+
+class SimilarArtworksView(RecommendationView):
+    """Opere apprezzate dagli stessi utenti che hanno interagito con questa. `?limit=`"""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, artwork_id):
+        return self.artworks_response(request, engine.similar_artworks(artwork_id, self.get_limit(request)))
+
+
+class RecommendedForYouView(RecommendationView):
+    """Opere consigliate all'utente autenticato in base alle sue interazioni. `?limit=`"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return self.artworks_response(request, engine.recommended_for_user(request.user.pk, self.get_limit(request)))
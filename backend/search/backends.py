@@ -0,0 +1,103 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import SearchDocument
+
+# Configurazione testuale di PostgreSQL: deve coincidere con l'indice GIN
+# creato dalla migrazione 0002
+PG_CONFIG = 'simple'
+PG_VECTOR = (
+    f"setweight(to_tsvector('{PG_CONFIG}', title), 'A') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', body), 'B')"
+)
+FTS_TABLE = 'search_searchdocument_fts'
+MAX_TERMS = 8
+
+
+def parse_terms(query):
+    """Parole della query, minuscole e senza operatori: ognuna è cercata anche come prefisso."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+class SQLiteBackend:
+    """FTS5 con tabella external-content aggiornata da trigger, ranking bm25."""
+
+    def match_expression(self, terms):
+        # Ogni termine come prefisso: "ven" trova "venezia"
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, terms, kinds, limit):
+        kind_filter = ''
+        params = [self.match_expression(terms)]
+        if kinds:
+            kind_filter = f"AND d.kind IN ({', '.join(['%s'] * len(kinds))})"
+            params.extend(kinds)
+        params.append(limit)
+        sql = f"""
+            SELECT d.kind, d.object_id, d.title, -bm25({FTS_TABLE}, 10.0, 1.0) AS score
+            FROM {FTS_TABLE}
+            JOIN search_searchdocument d ON d.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s {kind_filter}
+            ORDER BY bm25({FTS_TABLE}, 10.0, 1.0)
+            LIMIT %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgresBackend:
+    """tsvector pesato (titolo A, testo B) con indice GIN, ranking ts_rank_cd."""
+
+    def query_expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, terms, kinds, limit):
+        kind_filter = ''
+        params = [PG_CONFIG, self.query_expression(terms)]
+        if kinds:
+            kind_filter = 'AND kind = ANY(%s)'
+            params.append(list(kinds))
+        params.append(limit)
+        sql = f"""
+            SELECT kind, object_id, title, ts_rank_cd({PG_VECTOR}, query) AS score
+            FROM search_searchdocument, to_tsquery(%s, %s) query
+            WHERE ({PG_VECTOR}) @@ query {kind_filter}
+            ORDER BY score DESC
+            LIMIT %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class FallbackBackend:
+    """Database senza indice full-text: scansione con icontains, solo per sviluppo."""
+
+    def search(self, terms, kinds, limit):
+        queryset = SearchDocument.objects.all()
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(body__icontains=term))
+        return [(kind, object_id, title, 0.0) for kind, object_id, title in queryset.values_list('kind', 'object_id', 'title')[:limit]]
+
+
+def get_backend():
+    if connection.vendor == 'sqlite':
+        return SQLiteBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    return FallbackBackend()
+
+
+def search(query, kinds=None, limit=20):
+    """Documenti più rilevanti per `query`, come dizionari ordinati per punteggio."""
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    rows = get_backend().search(terms, kinds, limit)
+    return [
+        {'type': kind, 'id': object_id, 'title': title, 'score': float(score)}
+        for kind, object_id, title, score in rows
+    ]
@@ -0,0 +1,100 @@
+from django.contrib.auth import get_user_model
+from artworks.models import Artwork
+from events.models import Event
+from .models import SearchDocument
+
+Kind = SearchDocument.Kind
+
+# Campi dell'utente che compaiono nell'indice (nome dell'artista)
+ARTIST_FIELDS = {'username', 'first_name', 'last_name', 'bio', 'role'}
+
+
+def join(*parts):
+    return '\n'.join(part for part in parts if part)
+
+
+def artist_name(user):
+    return user.get_full_name() or user.username
+
+
+def artwork_document(artwork):
+    return SearchDocument(
+        kind=Kind.ARTWORK,
+        object_id=artwork.pk,
+        title=artwork.title,
+        body=join(artwork.description, artwork.location, artist_name(artwork.artist)),
+    )
+
+
+def artist_document(user):
+    return SearchDocument(
+        kind=Kind.ARTIST,
+        object_id=user.pk,
+        title=artist_name(user),
+        body=join(user.username, user.bio),
+    )
+
+
+def event_document(event):
+    return SearchDocument(
+        kind=Kind.EVENT,
+        object_id=event.pk,
+        title=event.name,
+        body=join(event.description, event.location, event.city),
+    )
+
+
+def save_documents(documents, batch_size=500):
+    """Inserisce o aggiorna i documenti in blocco (i trigger/indici del database seguono)."""
+    SearchDocument.objects.bulk_create(
+        documents,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['title', 'body', 'updated_at'],
+    )
+
+
+def remove_document(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_artwork(artwork):
+    save_documents([artwork_document(artwork)])
+
+
+def index_event(event):
+    save_documents([event_document(event)])
+
+
+def index_artist(user):
+    """Indicizza l'artista e ricalcola le sue opere, che contengono il suo nome."""
+    if not user.is_artist:
+        remove_document(Kind.ARTIST, user.pk)
+        return
+    save_documents([artist_document(user)])
+    artworks = Artwork.objects.filter(artist=user).select_related('artist')
+    save_documents([artwork_document(artwork) for artwork in artworks.iterator(chunk_size=500)])
+
+
+def rebuild(chunk_size=2000):
+    """Ricostruisce l'intero indice a blocchi; restituisce i documenti per tipo."""
+    User = get_user_model()
+    SearchDocument.objects.all().delete()
+    sources = [
+        (Kind.ARTWORK, Artwork.objects.select_related('artist'), artwork_document),
+        (Kind.ARTIST, User.objects.filter(role__in=[User.Role.ARTIST, User.Role.VERIFIED_ARTIST]), artist_document),
+        (Kind.EVENT, Event.objects.all(), event_document),
+    ]
+    counts = {}
+    for kind, queryset, build in sources:
+        batch, counts[kind] = [], 0
+        for obj in queryset.order_by('pk').iterator(chunk_size=chunk_size):
+            batch.append(build(obj))
+            if len(batch) >= chunk_size:
+                save_documents(batch)
+                counts[kind] += len(batch)
+                batch = []
+        save_documents(batch)
+        counts[kind] += len(batch)
+    return counts
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from search.indexing import rebuild
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice di ricerca di opere, artisti ed eventi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        counts = rebuild(chunk_size=options['chunk_size'])
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count} documenti')
@@ -0,0 +1,30 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class SearchDocument(models.Model):
+    """
+    Documento dell'indice di ricerca: una riga per opera, artista o evento.
+    L'indice invertito vero e proprio è creato dalla migrazione in base al
+    database (tabella FTS5 su SQLite, indice GIN su tsvector su PostgreSQL).
+    """
+    class Kind(models.TextChoices):
+        ARTWORK = 'artwork', _('Opera')
+        ARTIST = 'artist', _('Artista')
+        EVENT = 'event', _('Evento')
+
+    kind = models.CharField(_('Tipo'), max_length=20, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField(_('ID Oggetto'))
+    title = models.CharField(_('Titolo'), max_length=300)
+    body = models.TextField(_('Testo'), blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Documento di Ricerca')
+        verbose_name_plural = _('Documenti di Ricerca')
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
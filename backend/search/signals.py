@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from artworks.models import Artwork
+from events.models import Event
+from . import indexing
+
+Kind = indexing.Kind
+User = get_user_model()
+
+
+@receiver(post_save, sender=Artwork)
+def artwork_saved(sender, instance, update_fields=None, **kwargs):
+    # Salvataggi parziali che non toccano i campi indicizzati (es. contatori)
+    if update_fields and not {'title', 'description', 'location', 'artist'} & set(update_fields):
+        return
+    indexing.index_artwork(instance)
+
+
+@receiver(post_delete, sender=Artwork)
+def artwork_deleted(sender, instance, **kwargs):
+    indexing.remove_document(Kind.ARTWORK, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Il login aggiorna solo last_login: nessuna reindicizzazione
+    if update_fields and not indexing.ARTIST_FIELDS & set(update_fields):
+        return
+    indexing.index_artist(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    indexing.remove_document(Kind.ARTIST, instance.pk)
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'name', 'description', 'location', 'city'} & set(update_fields):
+        return
+    indexing.index_event(instance)
+
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    indexing.remove_document(Kind.EVENT, instance.pk)
@@ -0,0 +1,97 @@
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from artworks.models import Artwork
+from events.models import Event
+from users.models import User
+from .backends import search
+
+
+class SearchRankingTests(TestCase):
+    def setUp(self):
+        self.artist = User.objects.create_user(
+            'mrossi', password='password', first_name='Maria', last_name='Rossi', role=User.Role.ARTIST,
+        )
+
+    def artwork(self, title, description='', **fields):
+        return Artwork.objects.create(
+            title=title, description=description, image='', price=Decimal('1'), artist=self.artist, **fields
+        )
+
+    def event(self, name, description='', city='Milano'):
+        return Event.objects.create(
+            name=name, description=description, date=timezone.now(), location='Galleria', address='Via Roma 1',
+            city=city, country='Italia', cover_image='', created_by=self.artist,
+        )
+
+    def ids(self, query, **options):
+        return [(result['type'], result['id']) for result in search(query, **options)]
+
+    def test_title_match_ranks_above_body_match(self):
+        in_body = self.artwork('Paesaggio', 'Tramonto sulla laguna di Venezia')
+        in_title = self.artwork('Venezia', 'Olio su tela')
+        self.assertEqual(self.ids('venezia'), [('artwork', in_title.pk), ('artwork', in_body.pk)])
+
+    def test_every_term_must_match(self):
+        self.artwork('Notturno', 'Luna piena')
+        both = self.artwork('Notturno blu', 'Luna piena sul mare')
+        self.assertEqual(self.ids('notturno blu'), [('artwork', both.pk)])
+        self.assertEqual(len(self.ids('luna')), 2)
+
+    def test_terms_match_as_prefixes(self):
+        artwork = self.artwork('Ritratto veneziano')
+        self.assertEqual(self.ids('ritr ven'), [('artwork', artwork.pk)])
+        self.assertEqual(self.ids('ritratti'), [])
+
+    def test_artist_name_finds_artist_and_artworks(self):
+        artwork = self.artwork('Composizione')
+        self.assertEqual(
+            set(self.ids('maria rossi')), {('artist', self.artist.pk), ('artwork', artwork.pk)}
+        )
+        self.assertEqual(self.ids('rossi', kinds=['artist']), [('artist', self.artist.pk)])
+
+    def test_index_follows_saves_and_deletes(self):
+        artwork = self.artwork('Bozzetto')
+        artwork.title = 'Affresco'
+        artwork.save()
+        self.assertEqual(self.ids('bozzetto'), [])
+        self.assertEqual(self.ids('affresco'), [('artwork', artwork.pk)])
+        # Il nuovo nome dell'artista arriva anche nei documenti delle sue opere
+        self.artist.last_name = 'Bianchi'
+        self.artist.save()
+        self.assertIn(('artwork', artwork.pk), self.ids('bianchi'))
+        artwork.delete()
+        self.assertEqual(self.ids('affresco'), [])
+
+    def test_events_are_searchable_by_city(self):
+        event = self.event('Vernice', city='Torino')
+        self.assertEqual(self.ids('torino'), [('event', event.pk)])
+
+    def test_query_syntax_is_not_interpreted(self):
+        artwork = self.artwork('Natura morta')
+        for query in ('"natura', 'natura*', 'natura) (morta', "natura' --"):
+            with self.subTest(query=query):
+                self.assertEqual(self.ids(query), [('artwork', artwork.pk)])
+        # Gli operatori di FTS5 sono parole qualsiasi, da trovare come le altre
+        for query in ('natura OR pittura', 'NOT natura', 'natura NEAR morta'):
+            with self.subTest(query=query):
+                self.assertEqual(self.ids(query), [])
+        self.assertEqual(search('  ** ""  '), [])
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        artist = User.objects.create_user('artist', password='password', role=User.Role.ARTIST)
+        Artwork.objects.create(title='Marina', description='', image='', price=Decimal('1'), artist=artist)
+
+    def test_results_with_type_filter_and_limit(self):
+        response = self.client.get('/api/search/', {'q': 'marina', 'type': 'artwork', 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['title'] for result in response.data['results']], ['Marina'])
+        self.assertGreater(response.data['results'][0]['score'], 0)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/search/', {'q': 'marina', 'type': 'poem'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'marina', 'limit': 'x'}).status_code, 400)
@@ -0,0 +1,28 @@
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .backends import search
+from .models import SearchDocument
+
+
+class SearchView(APIView):
+    """
+    Ricerca full-text su opere, artisti ed eventi con ranking e prefissi.
+    `?q=` testo, `?type=artwork,artist,event` per limitare i tipi,
+    `?limit=` numero di risultati (massimo 50).
+    """
+    permission_classes = [permissions.AllowAny]
+    max_limit = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        invalid = set(kinds) - set(SearchDocument.Kind.values)
+        if invalid:
+            raise ValidationError({'type': f"Tipi non validi: {', '.join(sorted(invalid))}"})
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), self.max_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Deve essere un numero intero'})
+        return Response({'query': query, 'results': search(query, kinds, limit)})
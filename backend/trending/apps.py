@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class TrendingConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'trending'
+
+    def ready(self):
+        # Le UserInteraction salvate alimentano le classifiche
+        from . import signals  # noqa: F401
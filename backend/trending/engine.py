@@ -0,0 +1,237 @@
+"""
+Classifiche "di tendenza" per tipo di contenuto, aggiornate a ogni interazione.
+
+Il punteggio di un contenuto è la somma dei pesi delle sue interazioni, ognuna
+dimezzata ogni TRENDING_HALF_LIFE secondi. Invece di ricalcolare il decadimento
+di tutti i punteggi a ogni lettura, ogni interazione vale
+    peso * exp(lambda * (t - epoca))
+e l'ordinamento non cambia col passare del tempo: basta un incremento per
+interazione. Quando l'esponente diventa troppo grande l'epoca viene spostata in
+avanti e tutti i punteggi riscalati (stesso ordine, numeri più piccoli).
+
+Ogni classifica tiene i TRENDING_SIZE contenuti migliori (più un margine) in una
+struttura ordinata: la lettura dei primi N costa O(N), senza scansioni.
+
+Visualizzazioni e mi piace di opere ed eventi arrivano dai rispettivi contatori
+(increment_views/increment_likes), gli spettatori delle live dalla presenza;
+le altre azioni dalle UserInteraction salvate.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from users.models import UserInteraction
+
+logger = logging.getLogger(__name__)
+
+Action = UserInteraction.ActionType
+Content = UserInteraction.ContentType
+
+# Peso delle azioni nel punteggio di tendenza
+ACTION_WEIGHTS = {
+    Action.VIEW: 1,
+    Action.COMMENT: 2,
+    Action.LIKE: 3,
+    Action.SHARE: 4,
+    Action.REGISTER: 5,
+    Action.BID: 5,
+    Action.CHECK_IN: 5,
+}
+# Interazioni contate alla fonte (contatori e presenza): ignorate dal segnale
+# di UserInteraction per non contarle due volte
+DIRECT_ACTIONS = {
+    (Content.ARTWORK, Action.VIEW),
+    (Content.ARTWORK, Action.LIKE),
+    (Content.EVENT, Action.VIEW),
+    (Content.STREAM, Action.VIEW),
+}
+# Esponente oltre il quale l'epoca viene spostata (e^50 ~ 5e21, ben dentro un double)
+MAX_EXPONENT = 50.0
+# Contenuti tenuti oltre TRENDING_SIZE, perché chi è appena sotto la soglia non perda il punteggio
+CAPACITY_FACTOR = 2
+
+_store = None
+
+
+def half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 6 * 3600)
+
+
+def decay_rate():
+    """Lambda del decadimento esponenziale."""
+    return math.log(2) / half_life()
+
+
+def feed_size():
+    return getattr(settings, 'TRENDING_SIZE', 100)
+
+
+def capacity():
+    return feed_size() * CAPACITY_FACTOR
+
+
+class LocalStore:
+    """
+    Classifiche nella memoria del processo: dizionario dei punteggi e lista
+    ordinata (bisect) di (-punteggio, id). Per sviluppo e processo singolo.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scores = {}
+        self.rankings = {}
+        self.epochs = {}
+
+    def add(self, content_type, content_id, weight, at):
+        rate = decay_rate()
+        with self.lock:
+            epoch = self.epochs.setdefault(content_type, at)
+            if rate * (at - epoch) > MAX_EXPONENT:
+                self.rebase(content_type, at)
+                epoch = at
+            scores = self.scores.setdefault(content_type, {})
+            ranking = self.rankings.setdefault(content_type, [])
+            old = scores.get(content_id)
+            if old is not None:
+                del ranking[bisect.bisect_left(ranking, (-old, content_id))]
+            score = (old or 0.0) + weight * math.exp(rate * (at - epoch))
+            scores[content_id] = score
+            bisect.insort(ranking, (-score, content_id))
+            while len(ranking) > capacity():
+                _, evicted = ranking.pop()
+                del scores[evicted]
+
+    def rebase(self, content_type, at):
+        factor = math.exp(-decay_rate() * (at - self.epochs[content_type]))
+        scores = {content_id: score * factor for content_id, score in self.scores.get(content_type, {}).items()}
+        self.scores[content_type] = scores
+        self.rankings[content_type] = sorted((-score, content_id) for content_id, score in scores.items())
+        self.epochs[content_type] = at
+
+    def top(self, content_type, limit):
+        with self.lock:
+            ranking = self.rankings.get(content_type, [])[:limit]
+            epoch = self.epochs.get(content_type)
+        return epoch, [(content_id, -score) for score, content_id in ranking]
+
+    def clear(self, content_type):
+        with self.lock:
+            self.scores.pop(content_type, None)
+            self.rankings.pop(content_type, None)
+            self.epochs.pop(content_type, None)
+
+
+class RedisStore:
+    """
+    Classifiche condivise tra i processi in un sorted set Redis per tipo, con
+    l'epoca in una chiave accanto. Incremento, spostamento dell'epoca e taglio
+    alla capacità avvengono in un solo script Lua, atomico rispetto agli altri
+    processi.
+    """
+    ADD_SCRIPT = """
+        local epoch = tonumber(redis.call('GET', KEYS[2]))
+        local at, rate, weight = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        if not epoch then
+            epoch = at
+            redis.call('SET', KEYS[2], at)
+        elseif rate * (at - epoch) > tonumber(ARGV[6]) then
+            redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', math.exp(-rate * (at - epoch)))
+            epoch = at
+            redis.call('SET', KEYS[2], at)
+        end
+        redis.call('ZINCRBY', KEYS[1], weight * math.exp(rate * (at - epoch)), ARGV[4])
+        local capacity = tonumber(ARGV[5])
+        if redis.call('ZCARD', KEYS[1]) > capacity then
+            redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -capacity - 1)
+        end
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.add_script = self.client.register_script(self.ADD_SCRIPT)
+
+    def keys(self, content_type):
+        return [f'trending:{content_type}', f'trending:{content_type}:epoch']
+
+    def add(self, content_type, content_id, weight, at):
+        self.add_script(
+            keys=self.keys(content_type),
+            args=[at, decay_rate(), weight, content_id, capacity(), MAX_EXPONENT],
+        )
+
+    def top(self, content_type, limit):
+        ranking_key, epoch_key = self.keys(content_type)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(epoch_key)
+        pipe.zrevrange(ranking_key, 0, limit - 1, withscores=True)
+        epoch, ranking = pipe.execute()
+        if epoch is None:
+            return None, []
+        return float(epoch), [(int(content_id), score) for content_id, score in ranking]
+
+    def clear(self, content_type):
+        self.client.delete(*self.keys(content_type))
+
+
+_store_lock = threading.RLock()
+
+
+def get_store():
+    """
+    Store delle classifiche. Senza TRENDING_REDIS_URL le classifiche sono nella
+    memoria del processo: vengono ricostruite dal database prima di essere
+    pubblicate, perché nessun altro processo (né rebuild_trending) può
+    riempirle; chi legge nel frattempo attende la fine della ricostruzione.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = getattr(settings, 'TRENDING_REDIS_URL', '')
+                if url:
+                    _store = RedisStore(url)
+                else:
+                    from .seed import rebuild
+
+                    store = LocalStore()
+                    rebuild(store)
+                    _store = store
+    return _store
+
+
+def warm_up():
+    """
+    Prepara lo store all'avvio del processo (asgi.py), così la ricostruzione
+    non pesa sulla prima richiesta. Se fallisce si riprova al primo uso.
+    """
+    try:
+        get_store()
+    except Exception:
+        logger.exception("Classifiche di tendenza non ricostruite all'avvio")
+
+
+def record(content_type, content_id, action, count=1, at=None, store=None):
+    """Aggiunge `count` azioni `action` al punteggio del contenuto."""
+    weight = ACTION_WEIGHTS.get(action, 0) * count
+    if weight > 0:
+        # Id sempre interi: nella lista ordinata str e int non sono confrontabili
+        (store or get_store()).add(content_type, int(content_id), weight, time.time() if at is None else at)
+
+
+def top(content_type, limit=None):
+    """Primi `limit` contenuti di tendenza come [(id, punteggio attuale)], dal più alto."""
+    limit = min(limit or feed_size(), feed_size())
+    epoch, ranking = get_store().top(content_type, limit)
+    if epoch is None:
+        return []
+    # Punteggio riportato a oggi: stesso ordine, valori confrontabili nel tempo
+    factor = math.exp(-decay_rate() * (time.time() - epoch))
+    return [(content_id, score * factor) for content_id, score in ranking]
+
+
+def clear(content_type, store=None):
+    (store or get_store()).clear(content_type)
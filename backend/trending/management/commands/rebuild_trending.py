@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from trending.seed import rebuild
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce le classifiche di tendenza da interazioni e contatori recenti"
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'TRENDING_REDIS_URL', ''):
+            # Lo store locale di questo comando sparirebbe con il processo
+            raise CommandError(
+                "TRENDING_REDIS_URL non impostato: le classifiche sono nella memoria "
+                "di ogni processo web e vengono ricostruite al primo uso"
+            )
+        for content_type, count in rebuild().items():
+            self.stdout.write(f'{content_type}: {count} incrementi')
@@ -0,0 +1,57 @@
+from datetime import timedelta
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from artworks.models import Artwork
+from live_streams.models import LiveStream
+from users.models import UserInteraction
+from . import engine
+
+Content = UserInteraction.ContentType
+Action = UserInteraction.ActionType
+
+# Oltre questo numero di emivite un'interazione vale meno di 1/1000 del suo peso
+HALF_LIVES = 10
+
+
+def rebuild(store=None):
+    """
+    Ricostruisce le classifiche da zero (avvio, cambio di emivita, store svuotato)
+    in `store`, di default quello in uso:
+    UserInteraction aggregate per ora nel database, più i contatori di opere,
+    live creati o iniziati nella finestra (gli eventi non hanno data di creazione). Restituisce gli incrementi per tipo.
+    """
+    store = store or engine.get_store()
+    since = timezone.now() - timedelta(seconds=HALF_LIVES * engine.half_life())
+    for content_type in Content.values:
+        engine.clear(content_type, store=store)
+    counts = dict.fromkeys(Content.values, 0)
+
+    hourly = (
+        UserInteraction.objects.filter(timestamp__gte=since)
+        .annotate(hour=TruncHour('timestamp'))
+        .values_list('content_type', 'content_id', 'action', 'hour')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for content_type, content_id, action, hour, count in hourly.iterator(chunk_size=5000):
+        if (content_type, action) in engine.DIRECT_ACTIONS:
+            continue
+        engine.record(content_type, content_id, action, count, at=hour.timestamp(), store=store)
+        counts[content_type] += 1
+
+    # I contatori non hanno data: valgono dal momento della creazione del contenuto
+    counters = [
+        (Content.ARTWORK, Artwork.objects.filter(created_at__gte=since), 'created_at',
+         [('views_count', Action.VIEW), ('likes_count', Action.LIKE)]),
+        (Content.STREAM, LiveStream.objects.filter(started_at__gte=since), 'started_at',
+         [('peak_viewers', Action.VIEW)]),
+    ]
+    for content_type, queryset, date_field, fields in counters:
+        names = [field for field, _ in fields]
+        for content_id, created, *values in queryset.values_list('id', date_field, *names).iterator(chunk_size=5000):
+            for (_, action), value in zip(fields, values):
+                if value:
+                    engine.record(content_type, content_id, action, value, at=created.timestamp(), store=store)
+                    counts[content_type] += 1
+    return counts
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from users.models import UserInteraction
+from . import engine
+
+
+@receiver(post_save, sender=UserInteraction)
+def interaction_saved(sender, instance, created, **kwargs):
+    if not created or (instance.content_type, instance.action) in engine.DIRECT_ACTIONS:
+        return
+    engine.record(instance.content_type, instance.content_id, instance.action, at=instance.timestamp.timestamp())
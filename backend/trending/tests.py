@@ -0,0 +1,65 @@
+import time
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from users.models import User, UserInteraction
+from . import engine
+
+Content = engine.Content
+Action = engine.Action
+
+
+@override_settings(TRENDING_REDIS_URL='')
+class TrendingTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(engine, '_store', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_store_is_seeded_from_the_database_on_first_use(self):
+        user = User.objects.create_user('alice', password='password')
+        UserInteraction.objects.bulk_create([
+            UserInteraction(user=user, content_type=Content.EVENT, content_id=7, action=Action.REGISTER),
+            UserInteraction(user=user, content_type=Content.EVENT, content_id=8, action=Action.SHARE),
+        ])
+        self.assertEqual([content_id for content_id, _ in engine.top(Content.EVENT)], [7, 8])
+
+    def test_string_and_integer_ids_are_the_same_content(self):
+        now = time.time()
+        engine.record(Content.STREAM, '5', Action.VIEW, at=now)
+        engine.record(Content.STREAM, 5, Action.VIEW, at=now)
+        engine.record(Content.STREAM, 6, Action.VIEW, at=now)
+        ranking = engine.top(Content.STREAM)
+        self.assertEqual([content_id for content_id, _ in ranking], [5, 6])
+        self.assertAlmostEqual(ranking[0][1] / ranking[1][1], 2)
+
+    def test_recent_interactions_outrank_older_ones(self):
+        half_life = engine.half_life()
+        engine.record(Content.ARTWORK, 1, Action.LIKE, at=0.0)
+        engine.record(Content.ARTWORK, 2, Action.VIEW, at=2 * half_life)
+        self.assertEqual([content_id for content_id, _ in engine.top(Content.ARTWORK)], [2, 1])
+
+    def test_store_is_published_only_once_rebuilt(self):
+        published = []
+
+        def rebuild(store):
+            published.append(engine._store)
+            store.add(Content.EVENT, 7, 1, time.time())
+
+        with mock.patch('trending.seed.rebuild', side_effect=rebuild):
+            self.assertEqual([content_id for content_id, _ in engine.top(Content.EVENT)], [7])
+        self.assertEqual(published, [None])
+
+    def test_failed_rebuild_is_retried_on_next_use(self):
+        with mock.patch('trending.seed.rebuild', side_effect=DatabaseError):
+            with self.assertLogs('trending.engine', 'ERROR'):
+                engine.warm_up()
+        self.assertIsNone(engine._store)
+        self.assertEqual(engine.top(Content.EVENT), [])
+        self.assertIsNotNone(engine._store)
+
+    def test_rebuild_command_requires_a_shared_store(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_trending')
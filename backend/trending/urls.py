@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('<str:content_type>/', views.TrendingView.as_view(), name='trending'),
+]
@@ -0,0 +1,46 @@
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from artworks.models import Artwork
+from auctions.models import Auction
+from events.models import Event
+from live_streams.models import LiveStream
+from users.models import UserInteraction
+from . import engine
+
+Content = UserInteraction.ContentType
+
+# Campi restituiti per ogni tipo di contenuto, letti con una sola query
+FEEDS = {
+    Content.ARTWORK: (Artwork, ('id', 'title', 'image', 'category', 'artist__username')),
+    Content.EVENT: (Event, ('id', 'name', 'date', 'city', 'status')),
+    Content.STREAM: (LiveStream, ('id', 'title', 'status', 'viewers_count')),
+    Content.AUCTION: (Auction, ('id', 'artwork__title', 'current_price', 'end_time', 'is_active')),
+}
+
+
+class TrendingView(APIView):
+    """
+    Contenuti di tendenza per tipo (`artwork`, `event`, `stream`, `auction`):
+    la classifica è già ordinata in memoria, la richiesta legge i primi `?limit=`
+    e ne carica i dati con una query per chiave primaria.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, content_type):
+        if content_type not in FEEDS:
+            raise NotFound(f"Tipo non valido: {content_type}")
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), engine.feed_size()))
+        except ValueError:
+            raise ValidationError({'limit': 'Deve essere un numero intero'})
+
+        ranking = engine.top(content_type, limit)
+        model, fields = FEEDS[content_type]
+        rows = {row['id']: row for row in model.objects.filter(pk__in=[content_id for content_id, _ in ranking]).values(*fields)}
+        results = []
+        for content_id, score in ranking:
+            if content_id in rows:
+                results.append({**rows[content_id], 'score': round(score, 3)})
+        return Response({'type': content_type, 'results': results})
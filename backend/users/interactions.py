@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import close_old_connections
+from core import metrics
+from core.batching import BulkWriter
+from trending import engine as trending
+from .models import UserAgent, UserInteraction
+
+Action = UserInteraction.ActionType
+
+# Oltre questa lunghezza lo user agent viene troncato (valori anomali o malevoli)
+MAX_USER_AGENT_LENGTH = 512
+# User agent risolti (hash -> id) tenuti in memoria dal writer
+AGENT_CACHE_SIZE = 10000
+# Visualizzazioni recenti ricordate per la deduplica
+DEDUP_MAX_ENTRIES = 100000
+
+_writer = None
+_views = None
+
+
+class ViewDeduplicator:
+    """
+    Ultima visualizzazione registrata per (utente, tipo, id): le ripetizioni
+    entro `window` secondi vengono scartate. Le chiavi sono in ordine di
+    registrazione, quindi le scadute si tolgono dalla testa; oltre
+    `max_entries` si scartano le più vecchie e la memoria resta limitata.
+    """
+
+    def __init__(self, window, max_entries=DEDUP_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def seen(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            last = self.entries.get(key)
+            if last is not None and now - last < self.window:
+                return True
+            self.entries[key] = now
+            self.entries.move_to_end(key)
+            while self.entries and (
+                len(self.entries) > self.max_entries
+                or now - next(iter(self.entries.values())) >= self.window
+            ):
+                self.entries.popitem(last=False)
+        return False
+
+
+class InteractionWriter(BulkWriter):
+    """
+    BulkWriter per le interazioni: la coda contiene coppie (interazione,
+    user agent) e prima del bulk_create i testi vengono sostituiti dall'id
+    della tabella UserAgent, con i nuovi valori inseriti in blocco.
+    Dopo la scrittura le azioni alimentano le classifiche di tendenza
+    (bulk_create non invia i segnali post_save).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.agents = OrderedDict()
+
+    def resolve_agents(self, values):
+        digests = {UserAgent.digest_of(value): value for value in values if value}
+        missing = [digest for digest in digests if digest not in self.agents]
+        if missing:
+            UserAgent.objects.bulk_create(
+                [UserAgent(digest=digest, value=digests[digest]) for digest in missing],
+                ignore_conflicts=True,
+            )
+            self.agents.update(UserAgent.objects.filter(digest__in=missing).values_list('digest', 'id'))
+        for digest in digests:
+            if digest in self.agents:
+                self.agents.move_to_end(digest)
+        while len(self.agents) > AGENT_CACHE_SIZE:
+            self.agents.popitem(last=False)
+        return {value: self.agents.get(digest) for digest, value in digests.items()}
+
+    def write(self, batch):
+        started = time.monotonic()
+        try:
+            close_old_connections()
+            agents = self.resolve_agents({user_agent for _, user_agent in batch})
+        except Exception:
+            agents = {}
+            metrics.incr(f'{self.name}.agent_failures')
+        rows = []
+        for interaction, user_agent in batch:
+            interaction.agent_id = agents.get(user_agent)
+            rows.append(interaction)
+        written = super().write(rows)
+        metrics.incr(f'{self.name}.write_ms', round((time.monotonic() - started) * 1000))
+        if written:
+            for row in rows:
+                if (row.content_type, row.action) not in trending.DIRECT_ACTIONS:
+                    trending.record(row.content_type, row.content_id, row.action, at=row.timestamp.timestamp())
+        return written
+
+
+def interaction_writer():
+    global _writer
+    if _writer is None:
+        _writer = InteractionWriter(
+            'interactions',
+            UserInteraction,
+            batch_size=getattr(settings, 'INTERACTIONS_WRITE_BATCH', 1000),
+            interval=getattr(settings, 'INTERACTIONS_WRITE_INTERVAL', 2.0),
+            max_pending=getattr(settings, 'INTERACTIONS_WRITE_MAX_PENDING', 50000),
+        )
+    return _writer
+
+
+def view_deduplicator():
+    global _views
+    if _views is None:
+        _views = ViewDeduplicator(getattr(settings, 'INTERACTIONS_VIEW_DEDUP_WINDOW', 30))
+    return _views
+
+
+def record(user_id, content_type, content_id, action, metadata=None, ip_address=None, user_agent=''):
+    """
+    Accoda un'interazione per la scrittura in blocco, senza query nella richiesta.
+    Restituisce False se è stata scartata (visualizzazione ripetuta o coda piena).
+    """
+    if action == Action.VIEW and view_deduplicator().window > 0:
+        if view_deduplicator().seen((user_id, content_type, content_id)):
+            metrics.incr('interactions.deduplicated')
+            return False
+    interaction = UserInteraction(
+        user_id=user_id,
+        content_type=content_type,
+        content_id=content_id,
+        action=action,
+        metadata=metadata or {},
+        ip_address=ip_address,
+    )
+    return interaction_writer().put((interaction, (user_agent or '')[:MAX_USER_AGENT_LENGTH]))
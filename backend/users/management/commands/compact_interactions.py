@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users.rollups import compact, rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggiorna i riepiloghi orari e giornalieri delle interazioni e elimina le "
+        "righe grezze più vecchie della retention (da eseguire periodicamente)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=getattr(settings, 'INTERACTIONS_RETENTION_DAYS', 90),
+            help='Giorni di righe grezze da conservare',
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Righe per transazione')
+        parser.add_argument('--rollup-only', action='store_true', help='Aggiorna i riepiloghi senza eliminare')
+
+    def handle(self, *args, **options):
+        rolled_up = rollup(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Righe incluse nei riepiloghi: {rolled_up}')
+        if not options['rollup_only']:
+            deleted = compact(options['retention_days'], chunk_size=options['chunk_size'])
+            self.stdout.write(f'Righe grezze eliminate: {deleted}')
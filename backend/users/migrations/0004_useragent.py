@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+import hashlib
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def intern_user_agents(apps, schema_editor):
+    # Sposta i testi già salvati nella tabella UserAgent, un valore distinto alla volta
+    UserAgent = apps.get_model('users', 'UserAgent')
+    UserInteraction = apps.get_model('users', 'UserInteraction')
+    values = UserInteraction.objects.exclude(user_agent='').values_list('user_agent', flat=True).distinct()
+    for value in list(values):
+        agent, _ = UserAgent.objects.get_or_create(
+            digest=hashlib.sha256(value.encode()).hexdigest(), defaults={'value': value}
+        )
+        UserInteraction.objects.filter(user_agent=value).update(agent=agent)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_profile_pic_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='Hash')),
+                ('value', models.TextField(verbose_name='User Agent')),
+            ],
+            options={
+                'verbose_name': 'User Agent',
+                'verbose_name_plural': 'User Agent',
+            },
+        ),
+        migrations.AddField(
+            model_name='userinteraction',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.useragent', verbose_name='User Agent'),
+        ),
+        migrations.RunPython(intern_user_agents, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='userinteraction',
+            name='user_agent',
+        ),
+    ]
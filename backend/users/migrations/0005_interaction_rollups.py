@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_useragent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Nome')),
+                ('last_id', models.PositiveBigIntegerField(default=0, verbose_name='Ultimo ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Checkpoint Riepiloghi',
+                'verbose_name_plural': 'Checkpoint Riepiloghi',
+            },
+        ),
+        migrations.CreateModel(
+            name='InteractionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(3600, 'Ora'), (86400, 'Giorno')], verbose_name='Risoluzione')),
+                ('content_type', models.CharField(choices=[('artwork', 'Opera'), ('event', 'Evento'), ('stream', 'Live Stream'), ('auction', 'Asta')], max_length=50, verbose_name='Tipo Contenuto')),
+                ('content_id', models.IntegerField(verbose_name='ID Contenuto')),
+                ('action', models.CharField(choices=[('view', 'Visualizzazione'), ('like', 'Mi piace'), ('bid', 'Offerta'), ('register', 'Registrazione'), ('check_in', 'Check-in'), ('comment', 'Commento'), ('share', 'Condivisione')], max_length=50, verbose_name='Azione')),
+                ('start', models.DateTimeField(verbose_name='Inizio')),
+                ('count', models.PositiveBigIntegerField(default=0, verbose_name='Conteggio')),
+            ],
+            options={
+                'verbose_name': 'Riepilogo Interazioni',
+                'verbose_name_plural': 'Riepiloghi Interazioni',
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'content_id', 'resolution', 'start', 'action'), name='unique_interaction_rollup')],
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+import hashlib
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -18,6 +19,7 @@ class User(AbstractUser):
     )
     bio = models.TextField(blank=True, null=True)
     profile_pic = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_pic_renditions = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -53,6 +55,25 @@ class User(AbstractUser):
     def is_base(self):
         return self.role == self.Role.BASE
 
+class UserAgent(models.Model):
+    """
+    User agent distinti: le interazioni li referenziano per id invece di
+    ripetere in ogni riga qualche centinaio di byte di testo.
+    """
+    digest = models.CharField(_('Hash'), max_length=64, unique=True)
+    value = models.TextField(_('User Agent'))
+
+    class Meta:
+        verbose_name = _('User Agent')
+        verbose_name_plural = _('User Agent')
+
+    def __str__(self):
+        return self.value
+
+    @staticmethod
+    def digest_of(value):
+        return hashlib.sha256(value.encode()).hexdigest()
+
 class UserInteraction(models.Model):
     class ContentType(models.TextChoices):
         ARTWORK = 'artwork', _('Opera')
@@ -76,7 +97,7 @@ class UserInteraction(models.Model):
     timestamp = models.DateTimeField(_('Timestamp'), auto_now_add=True)
     metadata = models.JSONField(_('Metadati'), default=dict)
     ip_address = models.GenericIPAddressField(_('Indirizzo IP'), null=True)
-    user_agent = models.TextField(_('User Agent'), blank=True)
+    agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+', verbose_name=_('User Agent'))
 
     class Meta:
         verbose_name = _('Interazione Utente')
@@ -89,3 +110,48 @@ class UserInteraction(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.get_content_type_display()} - {self.get_action_display()}"
+
+
+class InteractionRollup(models.Model):
+    """
+    Conteggi delle interazioni per contenuto e azione, all'ora e al giorno.
+    Calcolati a blocchi dalla tabella grezza (vedi users.rollups): le
+    dashboard leggono solo questi, le righe grezze vecchie vengono eliminate.
+    """
+    class Resolution(models.IntegerChoices):
+        HOUR = 3600, _('Ora')
+        DAY = 86400, _('Giorno')
+
+    resolution = models.PositiveIntegerField(_('Risoluzione'), choices=Resolution.choices)
+    content_type = models.CharField(_('Tipo Contenuto'), max_length=50, choices=UserInteraction.ContentType.choices)
+    content_id = models.IntegerField(_('ID Contenuto'))
+    action = models.CharField(_('Azione'), max_length=50, choices=UserInteraction.ActionType.choices)
+    start = models.DateTimeField(_('Inizio'))
+    count = models.PositiveBigIntegerField(_('Conteggio'), default=0)
+
+    class Meta:
+        verbose_name = _('Riepilogo Interazioni')
+        verbose_name_plural = _('Riepiloghi Interazioni')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'content_id', 'resolution', 'start', 'action'],
+                name='unique_interaction_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} {self.content_id} {self.action} {self.get_resolution_display()} {self.start}"
+
+
+class RollupCheckpoint(models.Model):
+    """Ultimo id della tabella grezza già incluso nei riepiloghi."""
+    name = models.CharField(_('Nome'), max_length=50, unique=True)
+    last_id = models.PositiveBigIntegerField(_('Ultimo ID'), default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Checkpoint Riepiloghi')
+        verbose_name_plural = _('Checkpoint Riepiloghi')
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
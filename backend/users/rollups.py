@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import InteractionRollup, RollupCheckpoint, UserInteraction
+
+Resolution = InteractionRollup.Resolution
+
+CHECKPOINT = 'interactions'
+KEY_FIELDS = ('content_type', 'content_id', 'action')
+# Le righe più recenti restano fuori dai riepiloghi: i writer in background
+# potrebbero ancora committare id più bassi di quelli già visibili
+ROLLUP_LAG = timedelta(minutes=5)
+
+
+def rollup_upper_id(now=None):
+    """Id massimo che può entrare nei riepiloghi senza perdere righe in arrivo."""
+    now = now or timezone.now()
+    return UserInteraction.objects.filter(timestamp__lt=now - ROLLUP_LAG).aggregate(last=Max('id'))['last'] or 0
+
+
+def hourly_counts(queryset):
+    """Conteggi raggruppati per (tipo, id, azione, ora), calcolati dal database."""
+    rows = (
+        queryset.annotate(start=TruncHour('timestamp'))
+        .values_list(*KEY_FIELDS, 'start')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {(content_type, content_id, action, start): count for content_type, content_id, action, start, count in rows}
+
+
+def daily_counts(hourly):
+    """Giorni ricavati dalle ore (come TruncDay, nel fuso orario corrente): una sola scansione della tabella grezza."""
+    daily = defaultdict(int)
+    for (content_type, content_id, action, start), count in hourly.items():
+        day = timezone.localtime(start).replace(hour=0, minute=0, second=0, microsecond=0)
+        daily[(content_type, content_id, action, day)] += count
+    return daily
+
+
+def add_counts(resolution, counts):
+    """Somma `counts` ai riepiloghi esistenti (letti e riscritti in un'unica upsert)."""
+    if not counts:
+        return
+    starts = [start for *_, start in counts]
+    existing = InteractionRollup.objects.filter(
+        resolution=resolution,
+        content_type__in={content_type for content_type, _, _, _ in counts},
+        content_id__in={content_id for _, content_id, _, _ in counts},
+        start__gte=min(starts),
+        start__lte=max(starts),
+    ).values_list(*KEY_FIELDS, 'start', 'count')
+    totals = dict(counts)
+    for content_type, content_id, action, start, count in existing:
+        key = (content_type, content_id, action, start)
+        if key in totals:
+            totals[key] += count
+    InteractionRollup.objects.bulk_create(
+        [
+            InteractionRollup(
+                resolution=resolution,
+                content_type=content_type,
+                content_id=content_id,
+                action=action,
+                start=start,
+                count=count,
+            )
+            for (content_type, content_id, action, start), count in totals.items()
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['content_type', 'content_id', 'resolution', 'start', 'action'],
+        update_fields=['count'],
+    )
+
+
+def rollup_chunk(upper_id, chunk_size):
+    """
+    Porta nei riepiloghi le righe dopo il checkpoint, fino a `chunk_size` id.
+    Checkpoint e conteggi cambiano nella stessa transazione, con il checkpoint
+    bloccato: due esecuzioni concorrenti non contano mai la stessa riga.
+    Restituisce le righe elaborate, None se non c'è altro da fare.
+    """
+    with transaction.atomic():
+        RollupCheckpoint.objects.get_or_create(name=CHECKPOINT)
+        checkpoint = RollupCheckpoint.objects.select_for_update().get(name=CHECKPOINT)
+        if checkpoint.last_id >= upper_id:
+            return None
+        end_id = min(checkpoint.last_id + chunk_size, upper_id)
+        rows = UserInteraction.objects.filter(id__gt=checkpoint.last_id, id__lte=end_id)
+        hourly = hourly_counts(rows)
+        add_counts(Resolution.HOUR, hourly)
+        add_counts(Resolution.DAY, daily_counts(hourly))
+        processed = sum(hourly.values())
+        checkpoint.last_id = end_id
+        checkpoint.save(update_fields=['last_id', 'updated_at'])
+    return processed
+
+
+def rollup(chunk_size=10000):
+    """Aggiorna i riepiloghi con tutte le righe nuove; restituisce quante ne ha incluse."""
+    upper_id = rollup_upper_id()
+    total = 0
+    while True:
+        processed = rollup_chunk(upper_id, chunk_size)
+        if processed is None:
+            return total
+        total += processed
+
+
+def compact(retention_days=None, chunk_size=10000):
+    """
+    Elimina a blocchi le righe grezze più vecchie della finestra di retention,
+    solo se già incluse nei riepiloghi. Restituisce le righe eliminate.
+    """
+    if retention_days is None:
+        retention_days = getattr(settings, 'INTERACTIONS_RETENTION_DAYS', 90)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    rolled_up = RollupCheckpoint.objects.filter(name=CHECKPOINT).values_list('last_id', flat=True).first() or 0
+    expired = UserInteraction.objects.filter(id__lte=rolled_up, timestamp__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        # Transazioni brevi: nessun lock lungo sulla tabella mentre si scrive
+        deleted += UserInteraction.objects.filter(id__in=ids).delete()[0]
+
+
+def series(content_type, content_id, resolution, since, until=None):
+    """
+    Conteggi per azione di un contenuto, bucket per bucket: una lettura
+    sull'indice univoco dei riepiloghi, indipendente dalla tabella grezza.
+    """
+    rows = InteractionRollup.objects.filter(
+        content_type=content_type,
+        content_id=content_id,
+        resolution=resolution,
+        start__gte=since,
+        **({'start__lt': until} if until else {}),
+    ).order_by('start').values_list('start', 'action', 'count')
+    buckets = {}
+    for start, action, count in rows:
+        buckets.setdefault(start, {})[action] = count
+    return [{'start': start, **counts} for start, counts in buckets.items()]
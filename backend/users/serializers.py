@@ -0,0 +1,9 @@
+from rest_framework import serializers
+from .models import UserInteraction
+
+
+class InteractionEventSerializer(serializers.Serializer):
+    content_type = serializers.ChoiceField(choices=UserInteraction.ContentType.choices)
+    content_id = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=UserInteraction.ActionType.choices)
+    metadata = serializers.DictField(required=False, default=dict)
@@ -1,3 +1,217 @@
-from django.test import TestCase
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+from django.db.models.functions import TruncDay, TruncHour
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .interactions import InteractionWriter, ViewDeduplicator
+from .models import InteractionRollup, RollupCheckpoint, User, UserAgent, UserInteraction
+from .views import MAX_INTERACTION_EVENTS
+from . import interactions, rollups
 
-# Create your tests here.
+Action = UserInteraction.ActionType
+Content = UserInteraction.ContentType
+
+
+class ViewDeduplicatorTests(SimpleTestCase):
+    def test_repeated_view_within_the_window_is_seen(self):
+        views = ViewDeduplicator(window=30)
+        self.assertFalse(views.seen((1, 'artwork', 7), now=0))
+        self.assertTrue(views.seen((1, 'artwork', 7), now=29))
+        # Altro utente o altro contenuto: visualizzazioni distinte
+        self.assertFalse(views.seen((2, 'artwork', 7), now=29))
+        self.assertFalse(views.seen((1, 'artwork', 8), now=29))
+        # Finestra scaduta dall'ultima registrazione
+        self.assertFalse(views.seen((1, 'artwork', 7), now=30))
+
+    def test_memory_is_bounded(self):
+        views = ViewDeduplicator(window=30, max_entries=2)
+        for content_id in range(5):
+            views.seen((1, 'artwork', content_id), now=0)
+        self.assertEqual(list(views.entries), [(1, 'artwork', 3), (1, 'artwork', 4)])
+        # La più vecchia è stata dimenticata: conta di nuovo
+        self.assertFalse(views.seen((1, 'artwork', 0), now=1))
+
+
+class InteractionWriterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='password')
+        patcher = mock.patch.object(interactions.trending, 'record')
+        self.trending_record = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def interaction(self, content_id=1):
+        return UserInteraction(user=self.user, content_type=Content.ARTWORK, content_id=content_id, action=Action.SHARE)
+
+    def test_repeated_user_agent_is_stored_once(self):
+        agent = 'Mozilla/5.0 (X11; Linux x86_64)'
+        first = InteractionWriter('test_interactions', UserInteraction)
+        self.assertTrue(first.write([(self.interaction(1), agent), (self.interaction(2), agent), (self.interaction(3), '')]))
+        # Un altro processo (cache vuota) ritrova la stessa riga
+        second = InteractionWriter('test_interactions', UserInteraction)
+        self.assertTrue(second.write([(self.interaction(4), agent)]))
+
+        stored = UserAgent.objects.get()
+        self.assertEqual(stored.value, agent)
+        rows = UserInteraction.objects.order_by('content_id').values_list('content_id', 'agent_id')
+        self.assertEqual(list(rows), [(1, stored.pk), (2, stored.pk), (3, None), (4, stored.pk)])
+
+    def test_written_actions_feed_trending(self):
+        InteractionWriter('test_interactions', UserInteraction).write([(self.interaction(5), '')])
+        self.trending_record.assert_called_once_with(Content.ARTWORK, 5, Action.SHARE, at=mock.ANY)
+
+
+@override_settings(INTERACTIONS_VIEW_DEDUP_WINDOW=30)
+class RecordInteractionsViewTests(TestCase):
+    url = '/api/users/interactions/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice', password='password'))
+        self.queued = []
+        for patcher in (
+            mock.patch.object(interactions, '_views', None),
+            mock.patch.object(interactions, 'interaction_writer', return_value=mock.Mock(put=self.put)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def put(self, item):
+        self.queued.append(item)
+        return True
+
+    def test_events_are_queued_and_repeated_views_skipped(self):
+        view = {'content_type': 'artwork', 'content_id': 3, 'action': 'view'}
+        response = self.client.post(self.url, [view, view, {**view, 'action': 'like'}], format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'accepted': 2, 'skipped': 1})
+        self.assertEqual([interaction.action for interaction, _ in self.queued], ['view', 'like'])
+
+    def test_invalid_events_are_rejected(self):
+        valid = {'content_type': 'artwork', 'content_id': 3, 'action': 'view'}
+        for payload in (
+            {**valid, 'content_type': 'poem'},
+            {**valid, 'action': 'stare'},
+            {**valid, 'content_id': 0},
+            {**valid, 'content_id': 'tre'},
+            {**valid, 'metadata': ['non', 'un', 'oggetto']},
+            [valid] * (MAX_INTERACTION_EVENTS + 1),
+        ):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.post(self.url, payload, format='json').status_code, 400)
+        self.assertEqual(self.queued, [])
+
+    def test_authentication_is_required(self):
+        response = APIClient().post(self.url, {'content_type': 'artwork', 'content_id': 3, 'action': 'view'}, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='password')
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=3)
+
+    def interact(self, hours, content_id=1, action=Action.VIEW, count=1):
+        """`count` interazioni `hours` ore dopo self.start (più qualche minuto)."""
+        created = UserInteraction.objects.bulk_create(
+            UserInteraction(user=self.user, content_type=Content.ARTWORK, content_id=content_id, action=action)
+            for _ in range(count)
+        )
+        UserInteraction.objects.filter(pk__in=[row.pk for row in created]).update(
+            timestamp=self.start + timedelta(hours=hours, minutes=17)
+        )
+
+    def raw_counts(self, trunc):
+        rows = UserInteraction.objects.annotate(start=trunc('timestamp')).values_list(
+            'content_type', 'content_id', 'action', 'start'
+        )
+        return Counter(rows)
+
+    def rolled_up(self, resolution):
+        rows = InteractionRollup.objects.filter(resolution=resolution).values_list(
+            'content_type', 'content_id', 'action', 'start', 'count'
+        )
+        return {tuple(key): count for *key, count in rows}
+
+    def seed(self):
+        self.interact(0, count=3)
+        self.interact(0, action=Action.LIKE)
+        self.interact(5, count=2)
+        self.interact(30, content_id=2, count=4)
+        self.interact(30, action=Action.SHARE)
+
+    def test_rollups_match_the_raw_rows(self):
+        self.seed()
+        # Blocchi piccoli: i conteggi della stessa ora arrivano da più transazioni
+        self.assertEqual(rollups.rollup(chunk_size=2), 11)
+        self.assertEqual(self.rolled_up(InteractionRollup.Resolution.HOUR), self.raw_counts(TruncHour))
+        self.assertEqual(self.rolled_up(InteractionRollup.Resolution.DAY), self.raw_counts(TruncDay))
+
+    def test_rerun_is_idempotent(self):
+        self.seed()
+        rollups.rollup()
+        before = self.rolled_up(InteractionRollup.Resolution.HOUR)
+        self.assertEqual(rollups.rollup(), 0)
+        self.assertEqual(self.rolled_up(InteractionRollup.Resolution.HOUR), before)
+        # Solo le righe nuove si aggiungono ai riepiloghi esistenti
+        self.interact(0, count=2)
+        self.assertEqual(rollups.rollup(), 2)
+        self.assertEqual(self.rolled_up(InteractionRollup.Resolution.HOUR), self.raw_counts(TruncHour))
+
+    def test_recent_rows_wait_for_the_lag(self):
+        self.interact(0)
+        recent = UserInteraction.objects.create(user=self.user, content_type=Content.ARTWORK, content_id=9, action=Action.VIEW)
+        self.assertEqual(rollups.rollup(), 1)
+        self.assertLess(RollupCheckpoint.objects.get(name=rollups.CHECKPOINT).last_id, recent.pk)
+        self.assertFalse(InteractionRollup.objects.filter(content_id=9).exists())
+
+    def test_compaction_removes_only_rolled_up_rows(self):
+        self.interact(0, count=3)
+        self.interact(60, count=2)
+        rollups.rollup()
+        # Vecchia ma arrivata dopo l'ultimo riepilogo: deve restare
+        self.interact(0, content_id=5)
+        self.assertEqual(rollups.compact(retention_days=2, chunk_size=2), 3)
+        remaining = UserInteraction.objects.values_list('content_id', flat=True)
+        self.assertEqual(sorted(remaining), [1, 1, 5])
+        # I riepiloghi non cambiano con la compattazione
+        self.assertEqual(sum(self.rolled_up(InteractionRollup.Resolution.HOUR).values()), 5)
+
+
+class InteractionStatsViewTests(TestCase):
+    url = '/api/users/interactions/stats/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', password='password', is_staff=True))
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        InteractionRollup.objects.bulk_create([
+            InteractionRollup(resolution=InteractionRollup.Resolution.HOUR, content_type=Content.ARTWORK,
+                              content_id=1, action=action, start=hour, count=count)
+            for action, count in ((Action.VIEW, 4), (Action.LIKE, 1))
+        ] + [
+            InteractionRollup(resolution=InteractionRollup.Resolution.HOUR, content_type=Content.ARTWORK,
+                              content_id=1, action=Action.VIEW, start=hour - timedelta(days=10), count=7),
+        ])
+        self.hour = hour
+
+    def test_buckets_are_read_from_the_rollups(self):
+        response = self.client.get(self.url, {'content_type': 'artwork', 'content_id': 1, 'resolution': 'hour', 'days': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['buckets'], [{'start': self.hour, 'view': 4, 'like': 1}])
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'content_type': 'poem', 'content_id': 1},
+            {'content_type': 'artwork', 'content_id': 1, 'resolution': 'minute'},
+            {'content_type': 'artwork', 'content_id': 'uno'},
+            {'content_type': 'artwork'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('alice', password='password'))
+        self.assertEqual(client.get(self.url, {'content_type': 'artwork', 'content_id': 1}).status_code, 403)
@@ -1,8 +1,10 @@
 from django.urls import path
-from . import auth
+from . import auth, views
 
 urlpatterns = [
     path('auth/login/', auth.login_view, name='login'),
     path('auth/logout/', auth.logout_view, name='logout'),
     path('auth/register/', auth.register_view, name='register'),
+    path('interactions/', views.record_interactions, name='record-interactions'),
+    path('interactions/stats/', views.interaction_stats, name='interaction-stats'),
 ] 
\ No newline at end of file
@@ -2,10 +2,14 @@ from django.shortcuts import render
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from .models import User
+from datetime import timedelta
+from django.utils import timezone
+from .models import InteractionRollup, User, UserInteraction
+from .serializers import InteractionEventSerializer
+from . import interactions, rollups
 
 User = get_user_model()
 
@@ -65,3 +69,77 @@ def register(request):
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+# Eventi accettati in una sola richiesta di tracciamento
+MAX_INTERACTION_EVENTS = 100
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def record_interactions(request):
+    """
+    Tracciamento di visualizzazioni, mi piace, condivisioni...: un evento o
+    una lista di eventi. Gli eventi vengono accodati e scritti in blocco in
+    background, quindi la risposta (202) non attende il database.
+    """
+    events = request.data if isinstance(request.data, list) else [request.data]
+    if len(events) > MAX_INTERACTION_EVENTS:
+        return Response(
+            {'error': f'Massimo {MAX_INTERACTION_EVENTS} eventi per richiesta'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    serializer = InteractionEventSerializer(data=events, many=True)
+    serializer.is_valid(raise_exception=True)
+
+    ip_address = request.META.get('REMOTE_ADDR')
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    accepted = 0
+    for event in serializer.validated_data:
+        accepted += interactions.record(
+            request.user.pk,
+            event['content_type'],
+            event['content_id'],
+            event['action'],
+            metadata=event['metadata'],
+            ip_address=ip_address,
+            user_agent=user_agent,
+        )
+    return Response({'accepted': accepted, 'skipped': len(events) - accepted}, status=status.HTTP_202_ACCEPTED)
+
+# Giorni massimi richiedibili per risoluzione (punti restituiti limitati)
+STATS_MAX_DAYS = {
+    InteractionRollup.Resolution.HOUR: 31,
+    InteractionRollup.Resolution.DAY: 366,
+}
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def interaction_stats(request):
+    """
+    Interazioni di un contenuto per ora o per giorno, lette solo dai riepiloghi:
+    `?content_type=artwork&content_id=1&resolution=hour|day&days=30`.
+    """
+    resolutions = {'hour': InteractionRollup.Resolution.HOUR, 'day': InteractionRollup.Resolution.DAY}
+    content_type = request.query_params.get('content_type')
+    name = request.query_params.get('resolution', 'day')
+    if content_type not in UserInteraction.ContentType.values or name not in resolutions:
+        return Response(
+            {'error': 'content_type o resolution non validi'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        content_id = int(request.query_params['content_id'])
+        days = int(request.query_params.get('days', 30))
+    except (KeyError, ValueError):
+        return Response(
+            {'error': 'content_id e days devono essere numeri interi'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    resolution = resolutions[name]
+    days = max(1, min(days, STATS_MAX_DAYS[resolution]))
+    since = timezone.now() - timedelta(days=days)
+    return Response({
+        'content_type': content_type,
+        'content_id': content_id,
+        'resolution': name,
+        'buckets': rollups.series(content_type, content_id, resolution, since),
+    })